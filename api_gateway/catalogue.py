@@ -0,0 +1,219 @@
+# /api_gateway/catalogue.py
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import urljoin
+
+# --- Configuration ---
+CATALOGUE_DB = os.environ.get("CATALOGUE_DB", "catalogue.db")
+# A query answered live within this many hours is served from the catalogue instead.
+CATALOGUE_MAX_AGE_HOURS = float(os.environ.get("CATALOGUE_MAX_AGE_HOURS", "24"))
+# ...as long as that run produced at least this many products (otherwise there is a gap to fill).
+CATALOGUE_MIN_PRODUCTS = int(os.environ.get("CATALOGUE_MIN_PRODUCTS", "1"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppliers (
+    url TEXT PRIMARY KEY,
+    supplier_class TEXT,
+    confidence REAL,
+    stage TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    product_key TEXT NOT NULL UNIQUE,
+    supplier_url TEXT NOT NULL,
+    cleaned_name TEXT NOT NULL,
+    price_as_float REAL,
+    currency TEXT,
+    image_url TEXT,
+    original_url TEXT,
+    source_suppliers TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_supplier ON products(supplier_url);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    cleaned_name, supplier_url, content='products', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, cleaned_name, supplier_url) VALUES (new.id, new.cleaned_name, new.supplier_url);
+END;
+CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, cleaned_name, supplier_url) VALUES ('delete', old.id, old.cleaned_name, old.supplier_url);
+END;
+CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, cleaned_name, supplier_url) VALUES ('delete', old.id, old.cleaned_name, old.supplier_url);
+    INSERT INTO products_fts(rowid, cleaned_name, supplier_url) VALUES (new.id, new.cleaned_name, new.supplier_url);
+END;
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    last_run REAL NOT NULL,
+    supplier_urls TEXT NOT NULL,
+    product_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS query_products (
+    query TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    PRIMARY KEY (query, product_id)
+);
+"""
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a user query."""
+    return " ".join(query.lower().split())
+
+
+def product_key(product: dict) -> str:
+    """Stable identity of an enriched product: its absolute listing URL, or supplier + name."""
+    supplier = product.get("supplier_url") or ""
+    if product.get("original_url"):
+        return urljoin(supplier, product["original_url"])
+    return f"{supplier}#{normalize_query(product.get('cleaned_name') or '')}"
+
+
+def _fts_query(text: str, operator: str) -> Optional[str]:
+    tokens = re.findall(r"\w+", text.lower())
+    return f" {operator} ".join(f'"{t}"*' for t in tokens) or None
+
+
+class Catalogue:
+    """
+    Everything the gateway has discovered and enriched, in one SQLite file:
+    suppliers with their class and confidence, enriched products with an
+    FTS5 index over their names, and which products each query produced.
+    Every call is blocking SQLite; async callers run them via asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = CATALOGUE_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+
+    # --- Writes ---
+    def add_suppliers(self, suppliers: List[dict]):
+        """`suppliers` are the search engine's {'url', 'class', 'confidence', 'stage'} records."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                """INSERT INTO suppliers (url, supplier_class, confidence, stage, first_seen, last_seen)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(url) DO UPDATE SET supplier_class=excluded.supplier_class,
+                       confidence=excluded.confidence, stage=excluded.stage, last_seen=excluded.last_seen""",
+                [(s["url"], s.get("class"), s.get("confidence"), s.get("stage"), now, now) for s in suppliers])
+
+    def add_products(self, products: List[dict], query: Optional[str] = None) -> List[int]:
+        """Upserts enriched products (and links them to the query); returns their ids."""
+        now, ids = time.time(), []
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for p in products:
+                    row = self._db.execute(
+                        """INSERT INTO products (product_key, supplier_url, cleaned_name, price_as_float, currency,
+                                                 image_url, original_url, source_suppliers, updated_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           ON CONFLICT(product_key) DO UPDATE SET cleaned_name=excluded.cleaned_name,
+                               price_as_float=excluded.price_as_float, currency=excluded.currency,
+                               image_url=excluded.image_url, source_suppliers=excluded.source_suppliers,
+                               updated_at=excluded.updated_at
+                           RETURNING id""",
+                        (product_key(p), p.get("supplier_url") or "", p.get("cleaned_name") or "", p.get("price_as_float"),
+                         p.get("currency"), p.get("image_url"), p.get("original_url"),
+                         json.dumps(p.get("source_suppliers") or [p.get("supplier_url")]), now)).fetchone()
+                    ids.append(row["id"])
+                if query:
+                    self._db.executemany("INSERT OR IGNORE INTO query_products (query, product_id) VALUES (?, ?)",
+                                         [(normalize_query(query), i) for i in ids])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def record_query(self, query: str, supplier_urls: List[str], products: List[dict]):
+        """
+        Marks a live run of `query` as complete, after its products have been added.
+        The query's links are replaced by `products` (that run's enriched products),
+        so listings earlier runs found but this one did not are no longer served for it.
+        """
+        key = normalize_query(query)
+        keys = json.dumps([product_key(p) for p in products])
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    """DELETE FROM query_products WHERE query = ? AND product_id NOT IN
+                           (SELECT p.id FROM products p JOIN json_each(?) k ON p.product_key = k.value)""", (key, keys))
+                count = self._db.execute("SELECT COUNT(*) FROM query_products WHERE query = ?", (key,)).fetchone()[0]
+                self._db.execute(
+                    """INSERT INTO queries (query, last_run, supplier_urls, product_count) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(query) DO UPDATE SET last_run=excluded.last_run,
+                           supplier_urls=excluded.supplier_urls, product_count=excluded.product_count""",
+                    (key, time.time(), json.dumps(supplier_urls), count))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    # --- Reads ---
+    def _rows_to_products(self, rows) -> List[dict]:
+        now = time.time()
+        return [{
+            "cleaned_name": r["cleaned_name"], "price_as_float": r["price_as_float"], "currency": r["currency"],
+            "image_url": r["image_url"], "original_url": r["original_url"], "supplier_url": r["supplier_url"],
+            "source_suppliers": json.loads(r["source_suppliers"] or "[]"),
+            "supplier_class": r["supplier_class"], "supplier_confidence": r["confidence"],
+            "age_seconds": round(now - r["updated_at"]),
+        } for r in rows]
+
+    def cached_query(self, query: str, max_age_hours: float = CATALOGUE_MAX_AGE_HOURS) -> Optional[dict]:
+        """The products of a fresh-enough previous live run of `query`, or None if it must run live."""
+        key = normalize_query(query)
+        with self._lock:
+            run = self._db.execute("SELECT * FROM queries WHERE query = ?", (key,)).fetchone()
+            if run is None or time.time() - run["last_run"] > max_age_hours * 3600 or run["product_count"] < CATALOGUE_MIN_PRODUCTS:
+                return None
+            rows = self._db.execute(
+                """SELECT p.*, s.supplier_class, s.confidence FROM query_products q
+                   JOIN products p ON p.id = q.product_id LEFT JOIN suppliers s ON s.url = p.supplier_url
+                   WHERE q.query = ? ORDER BY p.supplier_url, p.id""", (key,)).fetchall()
+        return {"supplier_urls": json.loads(run["supplier_urls"]), "products": self._rows_to_products(rows),
+                "age_seconds": round(time.time() - run["last_run"])}
+
+    def search(self, text: str, limit: int = 20, max_age_hours: Optional[float] = None,
+               supplier_class: Optional[str] = None) -> List[dict]:
+        """Full-text product search, best match first; all terms must match, else any term."""
+        since = time.time() - max_age_hours * 3600 if max_age_hours else 0
+        with self._lock:
+            for operator in ("AND", "OR"):
+                match = _fts_query(text, operator)
+                if match is None:
+                    return []
+                rows = self._db.execute(
+                    """SELECT p.*, s.supplier_class, s.confidence FROM products_fts f
+                       JOIN products p ON p.id = f.rowid LEFT JOIN suppliers s ON s.url = p.supplier_url
+                       WHERE products_fts MATCH ? AND p.updated_at >= ?
+                         AND (? IS NULL OR s.supplier_class = ?)
+                       ORDER BY bm25(products_fts), s.confidence DESC LIMIT ?""",
+                    (match, since, supplier_class, supplier_class, limit)).fetchall()
+                if rows:
+                    break
+        return self._rows_to_products(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = lambda table: self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            return {"suppliers": count("suppliers"), "products": count("products"), "queries": count("queries")}
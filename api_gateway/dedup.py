@@ -0,0 +1,188 @@
+# /api_gateway/dedup.py
+import hashlib
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+# Two names whose shingle sets overlap at least this much (Jaccard) are the same product.
+NAME_SIMILARITY = float(os.environ.get("DEDUP_NAME_SIMILARITY", "0.8"))
+# Sharing a canonical image is strong evidence on its own; the names only need to agree loosely.
+IMAGE_NAME_SIMILARITY = float(os.environ.get("DEDUP_IMAGE_NAME_SIMILARITY", "0.4"))
+
+# MinHash signature of NUM_PERM values, split into LSH_BANDS bands of equal rows:
+# names with Jaccard around (1/bands) ** (1/rows) = 0.5 or more become candidates.
+NUM_PERM = 64
+LSH_BANDS = 16
+_ROWS = NUM_PERM // LSH_BANDS
+_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_PRIME - 1) + 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "dclid", "mc_cid", "mc_eid", "ref", "ref_", "srsltid",
+                   "_ga", "_gl", "igshid", "spm", "variant_source", "sessionid", "sid"}
+# Query parameters image CDNs use for resizing / re-encoding the same picture.
+IMAGE_VARIANT_PARAMS = {"w", "h", "width", "height", "size", "resize", "quality", "q", "fit", "crop", "format",
+                        "fm", "auto", "dpr", "v", "version", "ver", "cache", "t"}
+# Size suffixes in image file names: -300x300, _800x, _x600, @2x, -scaled, _thumb, _small...
+_IMAGE_SIZE_SUFFIX = re.compile(r"([-_](\d+x\d*|x\d+|scaled|thumb|thumbnail|small|medium|large|grande|compact)|@\dx)+(?=\.\w+$)")
+_UNIT_SPACING = re.compile(r"(\d)\s+(kg|g|gr|mg|l|ml|cl|lb|lbs|oz|pcs|pc|x)\b")
+_NUMBER_TOKEN = re.compile(r"\d+(?:[.,]\d+)?[a-z]*")
+
+
+def _strip_host(netloc: str) -> str:
+    netloc = netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def canonical_url(url: Optional[str], base: Optional[str] = None) -> Optional[str]:
+    """Absolute, scheme-less URL without tracking parameters, fragment or trailing slash."""
+    if not url:
+        return None
+    parsed = urlparse(urljoin(base or "", url.strip()))
+    if not parsed.netloc:
+        return None
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    path = re.sub(r"/{2,}", "/", parsed.path).rstrip("/") or "/"
+    return urlunparse(("", _strip_host(parsed.netloc), path, "", urlencode(query), ""))[2:]
+
+
+def canonical_image(url: Optional[str], base: Optional[str] = None) -> Optional[str]:
+    """Image identity that survives CDN resizing parameters, size suffixes and mirror hosts."""
+    if not url or url.startswith("data:"):
+        return None
+    parsed = urlparse(urljoin(base or "", url.strip()))
+    if not parsed.path or parsed.path == "/":
+        return None
+    path = _IMAGE_SIZE_SUFFIX.sub("", parsed.path.lower())
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query) if k.lower() not in IMAGE_VARIANT_PARAMS)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    # Descriptive file names are shared by mirrors on other hosts; generic ones ("image1") only within a host.
+    host = "" if len(stem) >= 12 and not stem.isdigit() else _strip_host(parsed.netloc)
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+
+def normalize_name(name: Optional[str]) -> str:
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w\s.,]", " ", text)
+    text = _UNIT_SPACING.sub(r"\1\2", text)
+    return " ".join(re.sub(r"(?<!\d)[.,]|[.,](?!\d)", " ", text).split())
+
+
+def shingles(normalized: str, k: int = 3) -> set:
+    padded = f" {normalized} "
+    return {padded[i:i + k] for i in range(max(1, len(padded) - k + 1))}
+
+
+def minhash(shingle_set: set) -> List[int]:
+    hashed = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingle_set]
+    return [min((a * h + b) % _PRIME for h in hashed) for a, b in _PERMUTATIONS]
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class ProductCluster:
+    """One real-world product and every (supplier, page) listing that was merged into it."""
+    def __init__(self, cluster_id: int, product: dict, supplier_url: str, listing_url: Optional[str]):
+        self.id = cluster_id
+        self.product = product
+        self.normalized = normalize_name(product.get("name"))
+        self.shingles = shingles(self.normalized) if self.normalized else set()
+        self.numbers = set(_NUMBER_TOKEN.findall(self.normalized))
+        # Shared with the enriched record, so listings merged later still show up in the response.
+        self.source_suppliers: List[str] = [supplier_url]
+        self.source_urls: List[str] = [listing_url] if listing_url else []
+        # Enrichment of the listing that represents the cluster: None while pending, then True or False.
+        self.enriched: Optional[bool] = None
+        # Duplicates held back while that is pending, so one can stand in if it fails.
+        self.held: List[tuple] = []
+
+    def add_source(self, supplier_url: str, listing_url: Optional[str]):
+        if supplier_url not in self.source_suppliers:
+            self.source_suppliers.append(supplier_url)
+        if listing_url and listing_url not in self.source_urls:
+            self.source_urls.append(listing_url)
+
+
+class ProductDeduplicator:
+    """
+    Near-duplicate detection for the raw products of one pipeline run.
+
+    A product is a duplicate of an earlier one if it has the same canonical
+    product URL, the same canonical image and a loosely similar name, or a
+    near-identical name (MinHash + LSH candidates, verified by exact Jaccard)
+    with the same numbers (5kg vs 10kg are different products).
+    """
+
+    def __init__(self, name_similarity: float = NAME_SIMILARITY):
+        self.name_similarity = name_similarity
+        self.clusters: List[ProductCluster] = []
+        self._by_url: Dict[str, ProductCluster] = {}
+        self._by_image: Dict[str, ProductCluster] = {}
+        self._buckets: Dict[tuple, List[ProductCluster]] = {}
+        self.seen = 0
+        self.duplicates = 0
+
+    def _name_candidates(self, signature: List[int]) -> List[ProductCluster]:
+        found = {}
+        for band in range(LSH_BANDS):
+            key = (band, tuple(signature[band * _ROWS:(band + 1) * _ROWS]))
+            for cluster in self._buckets.get(key, ()):
+                found[cluster.id] = cluster
+        return list(found.values())
+
+    def add(self, product: dict, supplier_url: str, page_url: str) -> tuple:
+        """Returns (cluster, is_duplicate). Non-duplicates become a new cluster."""
+        self.seen += 1
+        product_url = canonical_url(product.get("product_url"), page_url)
+        if product_url == canonical_url(page_url) or (product.get("product_url") or "").strip().startswith("#"):
+            # A link back to the listing itself ("#", "?page=1"...) says nothing about which product it is.
+            product_url = None
+        image = canonical_image(product.get("image_url"), page_url)
+        listing_url = urljoin(page_url, product["product_url"]) if product.get("product_url") else None
+        probe = ProductCluster(len(self.clusters), product, supplier_url, listing_url)
+
+        match = self._by_url.get(product_url) if product_url else None
+        if match is None and image in self._by_image:
+            candidate = self._by_image[image]
+            if not probe.shingles or jaccard(probe.shingles, candidate.shingles) >= IMAGE_NAME_SIMILARITY:
+                match = candidate
+        signature = minhash(probe.shingles) if probe.shingles else None
+        if match is None and signature is not None:
+            for candidate in self._name_candidates(signature):
+                if candidate.numbers == probe.numbers and jaccard(probe.shingles, candidate.shingles) >= self.name_similarity:
+                    match = candidate
+                    break
+
+        if match is not None:
+            match.add_source(supplier_url, listing_url)
+            self.duplicates += 1
+            cluster, duplicate = match, True
+        else:
+            self.clusters.append(probe)
+            cluster, duplicate = probe, False
+            if signature is not None:
+                for band in range(LSH_BANDS):
+                    key = (band, tuple(signature[band * _ROWS:(band + 1) * _ROWS]))
+                    self._buckets.setdefault(key, []).append(probe)
+        if product_url:
+            self._by_url.setdefault(product_url, cluster)
+        if image:
+            self._by_image.setdefault(image, cluster)
+        return cluster, duplicate
+
+    def stats(self) -> dict:
+        return {
+            "products_seen": self.seen,
+            "unique_products": len(self.clusters),
+            "duplicates_merged": self.duplicates,
+            "multi_source_products": sum(1 for c in self.clusters if len(c.source_suppliers) > 1),
+        }
@@ -1,91 +1,286 @@
+import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import httpx
-import asyncio
 
-app = FastAPI(title="Main API Gateway")
+import readiness
+import resilience
+import tracing
+from pipeline import post, run_pipeline, transfer_stats
+from trace_collector import TraceCollector
+from catalogue import Catalogue
+from recrawl import RECRAWL_ENABLED, RecrawlScheduler
+from result_cache import RESULT_CACHE_ENABLED, ResultCache
+
+# The gateway doubles as the local trace collector for every service.
+trace_collector = TraceCollector()
+tracing.add_local_sink(trace_collector.add)
+
+# Every discovered supplier and enriched product, searchable via /search.
+catalogue = Catalogue()
+# Revisits known supplier pages in the background and re-enriches what changed.
+recrawl_scheduler = RecrawlScheduler(catalogue)
+# Whole responses to repeated queries, kept in memory.
+result_cache = ResultCache()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if RECRAWL_ENABLED:
+        recrawl_scheduler.start()
+    readiness.start()
+    yield
+    await recrawl_scheduler.stop()
+
+app = FastAPI(title="Main API Gateway", lifespan=lifespan)
+tracing.instrument_fastapi(app, "api_gateway")
+readiness.instrument_fastapi(app)
+
+@readiness.step("catalogue")
+def warm_catalogue():
+    # The first full-text query (statement compilation, FTS tokenizer) is paid here, not by a user.
+    catalogue.search("warmup", limit=1)
 
 # Service URLs from environment variables
 SEARCH_ENGINE_URL = os.environ.get("SEARCH_ENGINE_URL")
-SCRAPER_URL = os.environ.get("SCRAPER_SERVICE_URL")
-PRODUCT_AI_URL = os.environ.get("PRODUCT_AI_SERVICE_URL")
-ENRICHER_URL = os.environ.get("ENRICHER_SERVICE_URL")
+# Discovery fetches and classifies pages, so it is slow even when healthy; never hedged (Google quota).
+SEARCH_ENGINE = resilience.dependency("search_engine_service", initial_timeout=300, floor=30, ceiling=600)
+# A budgeted discovery returns by its own deadline; allow this much on top for the response.
+DEADLINE_GRACE_SECONDS = 30
 
 class UserQueryRequest(BaseModel):
     query: str
+    # Optional discovery budget, passed through to the search engine's budgeted mode.
+    target_count: Optional[int] = None
+    deadline_seconds: Optional[float] = None
+    max_pages: Optional[int] = None
+    # Skip the catalogue and rerun discovery even if a fresh result exists.
+    refresh: bool = False
 
-async def process_single_url(client: httpx.AsyncClient, url: str) -> List[dict]:
-    """
-    This function performs the 'deep enrichment' phase on a single,
-    already validated supplier URL.
-    """
-    try:
-        print(f"GATEWAY (Phase 2): Starting deep scrape for URL: {url}")
-        
-        # Call the specialist workers in order
-        scraper_res = await client.post(f"{SCRAPER_URL}/scrape/", json={"url": url})
-        scraper_res.raise_for_status()
-        html_data = scraper_res.json()
-
-        product_ai_res = await client.post(f"{PRODUCT_AI_URL}/identify_products/", json=html_data)
-        product_ai_res.raise_for_status()
-        raw_products = product_ai_res.json()
-
-        if not raw_products: return []
-
-        enricher_res = await client.post(f"{ENRICHER_URL}/enrich/", json={"products": raw_products})
-        enricher_res.raise_for_status()
-        return enricher_res.json()
-        
-    except Exception as e:
-        print(f"Warning: Failed to deep scrape/enrich URL {url}: {str(e)}")
-        return []
+class SpanBatch(BaseModel):
+    spans: List[dict]
+
+class SupplierPipelineRequest(BaseModel):
+    url: str
+    # Further pages of the same supplier (e.g. paginated listings), processed in the same pipeline.
+    extra_pages: List[str] = []
+
+def _budgeted(request: UserQueryRequest) -> bool:
+    """A budgeted discovery returns a partial answer; the catalogue only holds and serves unbudgeted ones."""
+    return any(v is not None for v in (request.target_count, request.deadline_seconds, request.max_pages))
+
+def _cacheable(result: dict) -> bool:
+    """Only complete live answers are cached: no enricher fallback, no raw-query fallback in the NLP step."""
+    return (result.get("source") == "live" and not result.get("unenriched_products")
+            and bool((result.get("versions") or {}).get("nlp_prompt")))
 
 @app.post("/discover-and-enrich")
 async def discover_and_enrich_flow(request: UserQueryRequest):
     """
     The main, end-to-end workflow that uses the two-phase discovery process.
+    Repeated queries are answered from the result cache (stale ones are refreshed
+    in the background) or, failing that, from the catalogue; identical requests
+    in flight share one live run.
     """
-    async with httpx.AsyncClient(timeout=600.0) as client: # Increased timeout for the full flow
+    budget = request.model_dump(exclude={"query", "refresh"}, exclude_none=True)
+    if RESULT_CACHE_ENABLED and result_cache.versions_due():
+        await _refresh_versions()
+    cache_key = lambda: result_cache.key(request.query, **budget)
+    live = lambda: _discover_live(request)
+    if not request.refresh:
+        # The result cache keys on the budget, so a budgeted request only gets an answer made under the same budget.
+        hit = result_cache.get(cache_key()) if RESULT_CACHE_ENABLED else None
+        if hit is not None:
+            result, age, fresh = hit
+            if not fresh:
+                result_cache.revalidate(cache_key(), live, _cacheable, cache_key)
+            print(f"GATEWAY: Serving '{request.query}' from the result cache ({age}s old{'' if fresh else ', refreshing'}).")
+            return {**result, "source": "cache" if fresh else "cache_stale", "cache_age_seconds": age}
+
+        cached = None if _budgeted(request) else await asyncio.to_thread(catalogue.cached_query, request.query)
+        if cached is not None:
+            print(f"GATEWAY: Serving '{request.query}' from the catalogue ({cached['age_seconds']}s old).")
+            return {
+                "original_query": request.query,
+                "source": "catalogue",
+                "catalogue_age_seconds": cached["age_seconds"],
+                "validated_supplier_urls": cached["supplier_urls"],
+                "discovered_and_enriched_data": cached["products"],
+            }
+
+    if not RESULT_CACHE_ENABLED:
+        return await live()
+    return await result_cache.run(cache_key(), live, _cacheable, cache_key)
+
+async def _refresh_versions():
+    """Keys the result cache on the versions deployed now, not only on those the last live run saw."""
+    try:
+        async with httpx.AsyncClient(event_hooks=tracing.httpx_event_hooks()) as client:
+            response = await client.get(f"{SEARCH_ENGINE_URL}/api/versions", timeout=5)
+            response.raise_for_status()
+        result_cache.note_versions(response.json())
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Warning: Could not read the deployed versions ({e}); keying on the last known ones.")
+
+async def _discover_live(request: UserQueryRequest) -> dict:
+    """Phase 1 (search engine) and Phase 2 (scrape -> identify -> enrich) for one query."""
+    # Every call sets its own timeout (see resilience.py); there is no blanket client timeout.
+    async with httpx.AsyncClient(event_hooks=tracing.httpx_event_hooks()) as client:
         try:
             # === PHASE 1: HIGH-LEVEL DISCOVERY ===
             # The gateway calls the search engine, which does the initial NLP call,
             # Google search, and ML-based filtering.
             print(f"GATEWAY (Phase 1): Calling Search Engine to find and validate supplier URLs...")
             
-            search_engine_res = await client.post(f"{SEARCH_ENGINE_URL}/api/discover", json={"query": request.query})
-            search_engine_res.raise_for_status()
+            def discover(timeout):
+                if request.deadline_seconds:
+                    timeout = request.deadline_seconds + DEADLINE_GRACE_SECONDS
+                return post(client, f"{SEARCH_ENGINE_URL}/api/discover", timeout, json=request.model_dump(exclude_none=True))
+
+            try:
+                with tracing.span("search_engine.discover"):
+                    search_engine_res = await SEARCH_ENGINE.acall(discover)
+            except Exception as e:
+                if not resilience.is_dependency_failure(e):
+                    raise
+                # Discovery is down or too slow: an older answer beats none at all.
+                stale = await asyncio.to_thread(catalogue.cached_query, request.query, float("inf"))
+                if stale is None:
+                    raise HTTPException(status_code=503, detail=f"Search engine unavailable: {type(e).__name__}: {e}")
+                print(f"GATEWAY: Search engine unavailable ({e}); serving '{request.query}' from the catalogue ({stale['age_seconds']}s old).")
+                return {
+                    "original_query": request.query,
+                    "source": "catalogue_stale",
+                    "catalogue_age_seconds": stale["age_seconds"],
+                    "validated_supplier_urls": stale["supplier_urls"],
+                    "discovered_and_enriched_data": stale["products"],
+                }
             
             search_data = search_engine_res.json()
             validated_urls = search_data.get("supplier_urls", [])
+            await asyncio.to_thread(catalogue.add_suppliers, search_data.get("suppliers", []))
             print(f"GATEWAY (Phase 1): Search Engine returned {len(validated_urls)} high-potential supplier URLs.")
 
+            # Products of a budgeted run are indexed, but not linked to (or recorded as the answer to) the query.
+            query_key = None if _budgeted(request) else request.query
             if not validated_urls:
+                if query_key:
+                    await asyncio.to_thread(catalogue.record_query, query_key, [], [])
                 return {
                     "message": "Phase 1 complete. No high-potential supplier URLs were found.",
                     "original_query": request.query,
+                    "source": "live",
+                    "versions": search_data.get("versions"),
                     "processed_query_used": search_data.get("processed_query_sent_to_google", ""),
                     "discovered_and_enriched_data": []
                 }
 
-            # === PHASE 2: DEEP ENRICHMENT ===
-            print(f"GATEWAY (Phase 2): Starting parallel deep enrichment for {len(validated_urls)} URLs...")
-            
-            processing_tasks = [process_single_url(client, url) for url in validated_urls]
-            results_list = await asyncio.gather(*processing_tasks)
-            
-            final_enriched_data = [product for sublist in results_list for product in sublist]
+            # === PHASE 2: DEEP ENRICHMENT (pipelined scrape -> identify -> enrich) ===
+            print(f"GATEWAY (Phase 2): Starting pipelined deep enrichment for {len(validated_urls)} URLs...")
+            result = await run_pipeline(client, [(url, url) for url in validated_urls],
+                                        on_enriched=lambda products: catalogue.add_products(products, query_key))
+            enriched = [p for p in result["products"] if p.get("enriched", True)]
+            # Listings merged after a product was indexed only show up in its final source list.
+            await asyncio.to_thread(catalogue.add_products, [p for p in enriched if len(p.get("source_suppliers", [])) > 1],
+                                    query_key)
+            # A degraded run (enricher unavailable) is not a complete answer to serve from the catalogue later.
+            if query_key and not result["unenriched"]:
+                await asyncio.to_thread(catalogue.record_query, query_key, validated_urls, enriched)
+            await asyncio.to_thread(recrawl_scheduler.enroll, [(url, url) for url in validated_urls], result["baselines"])
 
-            print("GATEWAY: Full workflow complete.")
+            print(f"GATEWAY: Full workflow complete in {result['wall_ms']:.0f} ms of Phase 2.")
             return {
                 "original_query": request.query,
                 "processed_query_used": search_data.get("processed_query_sent_to_google", ""),
+                "source": "live",
+                "versions": search_data.get("versions"),
                 "validated_supplier_urls": validated_urls,
-                "discovered_and_enriched_data": final_enriched_data
+                "discovered_and_enriched_data": result["products"],
+                "deduplication": result["dedup"],
+                "unenriched_products": result["unenriched"],
+                "pipeline_timings": result["timings"]
             }
+        except HTTPException:
+            raise
         except httpx.HTTPStatusError as e:
             raise HTTPException(status_code=e.response.status_code, detail=f"Error from a downstream service '{e.request.url}': {e.response.text}")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred in the gateway: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred in the gateway: {str(e)}")
+
+@app.post("/pipeline/supplier")
+async def supplier_pipeline(request: SupplierPipelineRequest):
+    """
+    Runs the fused scrape -> identify -> enrich pipeline for one supplier,
+    returning its enriched products and per-stage timings for every page.
+    """
+    pages = [(request.url, page) for page in [request.url, *request.extra_pages]]
+    async with httpx.AsyncClient(event_hooks=tracing.httpx_event_hooks()) as client:
+        result = await run_pipeline(client, pages, on_enriched=catalogue.add_products)
+    await asyncio.to_thread(recrawl_scheduler.enroll, pages, result["baselines"])
+    return {
+        "supplier_url": request.url,
+        "discovered_and_enriched_data": result["products"],
+        "deduplication": result["dedup"],
+        "unenriched_products": result["unenriched"],
+        "pipeline_timings": result["timings"],
+        "wall_ms": result["wall_ms"]
+    }
+
+@app.get("/search")
+async def search_catalogue(q: str, limit: int = 20, max_age_hours: Optional[float] = None, supplier_class: Optional[str] = None):
+    """
+    Full-text search over every product the gateway has enriched so far,
+    answered from the local catalogue without any crawling.
+    """
+    started = time.perf_counter()
+    results = await asyncio.to_thread(catalogue.search, q, max(1, min(limit, 200)), max_age_hours, supplier_class)
+    return {
+        "query": q,
+        "count": len(results),
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+        "results": results,
+    }
+
+@app.post("/recrawl/enroll")
+async def enroll_for_recrawl(request: SupplierPipelineRequest):
+    """Puts a supplier's pages on the re-crawl schedule without running the pipeline now."""
+    pages = [(request.url, page) for page in [request.url, *request.extra_pages]]
+    await asyncio.to_thread(recrawl_scheduler.enroll, pages)
+    return {"enrolled": len(pages)}
+
+@app.get("/recrawl")
+async def recrawl_stats():
+    """Size of the re-crawl queue, how much is due, and what recent checks found."""
+    return await asyncio.to_thread(recrawl_scheduler.stats)
+
+@app.get("/stats")
+async def stats():
+    """
+    Bytes moved through the gateway per URL, the gateway's peak memory, the catalogue
+    size and result cache, and, per downstream service, its current timeout, latency and breaker state.
+    """
+    return {**transfer_stats.stats(), "catalogue": catalogue.stats(), "result_cache": result_cache.stats(),
+            "dependencies": resilience.stats()}
+
+
+# --- Trace collector ---
+@app.post("/traces")
+async def collect_spans(batch: SpanBatch):
+    """Receives span batches exported by the other services."""
+    trace_collector.add(batch.spans)
+    return {"accepted": len(batch.spans)}
+
+@app.get("/traces")
+async def recent_traces(limit: int = 20):
+    return trace_collector.recent(limit)
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Every span of one request across all services, with a per-stage latency breakdown."""
+    trace = trace_collector.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown trace id.")
+    return trace
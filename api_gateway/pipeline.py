@@ -0,0 +1,277 @@
+# /api_gateway/pipeline.py
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import time
+from typing import Callable, List, Optional
+
+import httpx
+
+import resilience
+import tracing
+from dedup import ProductDeduplicator
+
+# Service URLs from environment variables
+SCRAPER_URL = os.environ.get("SCRAPER_SERVICE_URL")
+PRODUCT_AI_URL = os.environ.get("PRODUCT_AI_SERVICE_URL")
+ENRICHER_URL = os.environ.get("ENRICHER_SERVICE_URL")
+# "inline" moves page HTML through the gateway; "blob" passes a handle to the
+# page in the blob store shared by scraper_service and product_ai_service.
+PAGE_TRANSPORT = os.environ.get("PAGE_TRANSPORT", "inline")
+
+# --- Stage concurrency (per pipeline run) ---
+SCRAPE_CONCURRENCY = int(os.environ.get("PIPELINE_SCRAPE_CONCURRENCY", "8"))
+IDENTIFY_CONCURRENCY = int(os.environ.get("PIPELINE_IDENTIFY_CONCURRENCY", "4"))
+ENRICH_CONCURRENCY = int(os.environ.get("PIPELINE_ENRICH_CONCURRENCY", "4"))
+# Products are sent to the enricher in batches of this size as soon as they are identified.
+ENRICH_BATCH_SIZE = int(os.environ.get("PIPELINE_ENRICH_BATCH_SIZE", "10"))
+# Near-duplicate products (same item via marketplaces, mirrors, other pages) skip enrichment.
+DEDUP_ENABLED = os.environ.get("PIPELINE_DEDUP", "true").lower() == "true"
+
+# --- Downstream dependencies ---
+# Timeouts start at the first value and then follow each service's observed p99, within [floor, ceiling].
+# Most scrapes are sub-second fast-path fetches, so the p99 says little about a browser render
+# (page load 30s + wait 10s + politeness waits): the floor keeps a full render within the timeout.
+SCRAPER = resilience.dependency("scraper_service", initial_timeout=120, floor=60, ceiling=300)
+# Not hedged: parsing is CPU-bound on a single worker, so a second copy only adds load when it is slow.
+PRODUCT_AI = resilience.dependency("product_ai_service", initial_timeout=60, floor=5, ceiling=180)
+# Not hedged: every enricher call costs LLM tokens.
+ENRICHER = resilience.dependency("enrichment_llm_service", initial_timeout=120, floor=10, ceiling=300)
+
+
+class TransferStats:
+    """Bytes the gateway sends and receives per processed URL, plus its peak RSS."""
+    def __init__(self):
+        self.urls = 0
+        self.total_bytes = 0
+        self.max_bytes = 0
+
+    def record(self, url: str, num_bytes: int):
+        self.urls += 1
+        self.total_bytes += num_bytes
+        self.max_bytes = max(self.max_bytes, num_bytes)
+        print(f"GATEWAY: {num_bytes / 1024:.1f} KB moved through the gateway for {url} ({PAGE_TRANSPORT} transport)")
+
+    def stats(self) -> dict:
+        return {
+            "page_transport": PAGE_TRANSPORT,
+            "urls_processed": self.urls,
+            "total_bytes": self.total_bytes,
+            "avg_bytes_per_url": round(self.total_bytes / self.urls) if self.urls else None,
+            "max_bytes_per_url": self.max_bytes,
+            # ru_maxrss is in KB on Linux
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+transfer_stats = TransferStats()
+
+def wire_bytes(response: httpx.Response) -> int:
+    """Request body plus response body of one downstream call."""
+    return len(response.request.content) + len(response.content)
+
+async def post(client: httpx.AsyncClient, url: str, timeout: float, **kwargs) -> httpx.Response:
+    """One POST with its own timeout; error statuses raise, so they count against the dependency."""
+    response = await client.post(url, timeout=timeout, **kwargs)
+    response.raise_for_status()
+    return response
+
+def product_hash(product: dict) -> str:
+    """Fingerprint of a raw product as product_ai_service reports it."""
+    fields = [product.get(k) for k in ("name", "price", "product_url", "image_url")]
+    return hashlib.sha1(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+def unenriched(products: List[dict]) -> List[dict]:
+    """Raw products in the enricher's output shape, for when the enricher is unavailable."""
+    return [{"cleaned_name": p["name"], "price_as_float": None, "currency": None, "image_url": p.get("image_url"),
+             "original_url": p.get("product_url"), "enriched": False}
+            for p in products if p.get("name") and p.get("price")]
+
+def _ms_since(started: float) -> float:
+    return round((time.monotonic() - started) * 1000, 1)
+
+
+class SupplierPipeline:
+    """
+    Scrape -> identify -> enrich for a set of pages, with the stages overlapped.
+
+    Every page runs as its own task through bounded stages, so product
+    identification starts on the first page that arrives while later pages
+    are still downloading, and each batch of identified products is flushed
+    to the enricher immediately instead of waiting for the whole page set.
+    Products already seen on another page or supplier are merged instead of
+    enriched again (see dedup.py).
+    """
+
+    def __init__(self, client: httpx.AsyncClient, on_enriched: Optional[Callable[[List[dict]], None]] = None):
+        self.client = client
+        # Called with every enriched batch as it arrives (e.g. to index it in the catalogue), in a worker thread.
+        self.on_enriched = on_enriched
+        self.scrape_gate = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+        self.identify_gate = asyncio.Semaphore(IDENTIFY_CONCURRENCY)
+        self.enrich_gate = asyncio.Semaphore(ENRICH_CONCURRENCY)
+        self.products: List[dict] = []
+        self.timings: List[dict] = []
+        # page_url -> what the re-crawl scheduler compares its first check against (fully enriched pages only).
+        self.baselines: dict = {}
+        self.dedup = ProductDeduplicator() if DEDUP_ENABLED else None
+
+    def _deduplicate(self, supplier_url: str, page_url: str, raw_products: List[dict], timing: dict) -> tuple:
+        """Returns (products to enrich, their clusters); products the enricher would skip pass through."""
+        if self.dedup is None:
+            return raw_products, [None] * len(raw_products)
+        to_enrich, clusters = [], []
+        for product in raw_products:
+            if not product.get("name") or not product.get("price"):
+                to_enrich.append(product)
+                clusters.append(None)
+                continue
+            cluster, duplicate = self.dedup.add(product, supplier_url, page_url)
+            if duplicate and cluster.enriched is False:
+                # The product's first listing could not be enriched: this one gets its chance.
+                cluster.enriched = None
+            elif duplicate:
+                timing["duplicates"] += 1
+                if cluster.enriched is None:
+                    cluster.held.append((supplier_url, product, timing))
+                continue
+            to_enrich.append(product)
+            clusters.append(cluster)
+        return to_enrich, clusters
+
+    async def _enrich_held(self, failed: List) -> int:
+        """Enriches a held-back duplicate in place of each cluster whose own enrichment failed."""
+        bytes_moved = 0
+        for cluster in failed:
+            cluster.enriched = False
+            if cluster.held:
+                supplier_url, product, timing = cluster.held.pop(0)
+                timing["duplicates"] -= 1
+                cluster.enriched = None
+                bytes_moved += await self._enrich_batch(supplier_url, [product], [cluster], timing)
+        return bytes_moved
+
+    async def _enrich_batch(self, supplier_url: str, batch: List[dict], clusters: List, timing: dict) -> int:
+        try:
+            async with self.enrich_gate:
+                started = time.monotonic()
+                try:
+                    with tracing.span("enrich", products=len(batch)):
+                        enricher_res = await ENRICHER.acall(
+                            lambda timeout: post(self.client, f"{ENRICHER_URL}/enrich/", timeout, json={"products": batch}),
+                            fallback=lambda: None)
+                finally:
+                    timing["enrich_ms"] += _ms_since(started)
+        except Exception:
+            # Held-back duplicates of this batch's products are tried before the failure propagates.
+            await self._enrich_held([c for c in clusters if c is not None])
+            raise
+        if enricher_res is None:
+            # Degrade instead of failing the page: pass the raw names through, marked as not enriched.
+            enriched = unenriched(batch)
+            timing["unenriched"] += len(enriched)
+        else:
+            enriched = enricher_res.json()
+        # The enricher drops products it cannot clean, so match results back by the URLs it echoes.
+        by_source = {(p.get("product_url"), p.get("image_url")): c for p, c in zip(batch, clusters) if c is not None}
+        for product in enriched:
+            product["supplier_url"] = supplier_url
+            cluster = by_source.get((product.get("original_url"), product.get("image_url")))
+            if cluster is not None:
+                product["source_suppliers"] = cluster.source_suppliers
+                product["source_urls"] = cluster.source_urls
+                cluster.enriched = True
+                cluster.held.clear()
+        self.products.extend(enriched)
+        timing["enriched"] += len(enriched)
+        if self.on_enriched is not None and enricher_res is not None and enriched:
+            try:
+                await asyncio.to_thread(self.on_enriched, enriched)
+            except Exception as e:
+                print(f"Warning: Could not hand enriched products from {supplier_url} on: {e}")
+        # Products the enricher dropped: a held-back duplicate of each is tried instead.
+        retried = await self._enrich_held([c for c in dict.fromkeys(clusters) if c is not None and c.enriched is None])
+        return (wire_bytes(enricher_res) if enricher_res is not None else 0) + retried
+
+    async def _process_page(self, supplier_url: str, page_url: str):
+        timing = {
+            "supplier_url": supplier_url, "page_url": page_url,
+            "scrape_ms": None, "scrape_method": None, "identify_ms": None,
+            "enrich_ms": 0.0, "products_found": 0, "duplicates": 0, "enriched": 0, "unenriched": 0, "total_ms": None,
+        }
+        self.timings.append(timing)
+        page_started = time.monotonic()
+        page_span = tracing.start_span("page", supplier_url=supplier_url, page_url=page_url)
+        try:
+            print(f"GATEWAY (Phase 2): Starting deep scrape for URL: {page_url}")
+            async with self.scrape_gate:
+                started = time.monotonic()
+                with tracing.span("scrape"):
+                    scraper_res = await SCRAPER.acall(lambda timeout: post(
+                        self.client, f"{SCRAPER_URL}/scrape/", timeout, json={"url": page_url, "transport": PAGE_TRANSPORT}))
+                timing["scrape_ms"] = _ms_since(started)
+            if PAGE_TRANSPORT == "blob":
+                # Cheap to decode: the body is only a handle, not the page.
+                timing["scrape_method"] = scraper_res.json().get("method")
+
+            async with self.identify_gate:
+                started = time.monotonic()
+                # Forward the scraper's body as-is: the page is never decoded and re-encoded here.
+                with tracing.span("identify"):
+                    product_ai_res = await PRODUCT_AI.acall(lambda timeout: post(
+                        self.client, f"{PRODUCT_AI_URL}/identify_products/", timeout,
+                        content=scraper_res.content,
+                        headers={"Content-Type": "application/json"},
+                    ))
+                raw_products = product_ai_res.json()
+                timing["identify_ms"] = _ms_since(started)
+            timing["products_found"] = len(raw_products)
+            bytes_moved = wire_bytes(scraper_res) + wire_bytes(product_ai_res)
+            del scraper_res
+
+            to_enrich, clusters = self._deduplicate(supplier_url, page_url, raw_products, timing)
+            batches = [(to_enrich[i:i + ENRICH_BATCH_SIZE], clusters[i:i + ENRICH_BATCH_SIZE])
+                       for i in range(0, len(to_enrich), ENRICH_BATCH_SIZE)]
+            results = await asyncio.gather(
+                *(self._enrich_batch(supplier_url, batch, batch_clusters, timing) for batch, batch_clusters in batches),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    timing["error"] = f"enrich: {result}"
+                else:
+                    bytes_moved += result
+            transfer_stats.record(page_url, bytes_moved)
+            if "error" not in timing and not timing["unenriched"]:
+                self.baselines[page_url] = {"block_hash": product_ai_res.headers.get("X-Product-Block-Hash"),
+                                            "product_hashes": [product_hash(p) for p in raw_products]}
+        except Exception as e:
+            timing["error"] = str(e)
+            page_span.fail(e)
+            print(f"Warning: Failed to deep scrape/enrich URL {page_url}: {str(e)}")
+        finally:
+            timing["total_ms"] = _ms_since(page_started)
+            page_span.set(products_found=timing["products_found"], duplicates=timing["duplicates"], enriched=timing["enriched"],
+                          unenriched=timing["unenriched"])
+            page_span.end()
+
+    async def run(self, pages: List[tuple]) -> dict:
+        """`pages` is a list of (supplier_url, page_url) pairs."""
+        started = time.monotonic()
+        await asyncio.gather(*(self._process_page(supplier, page) for supplier, page in pages))
+        return {
+            "products": self.products,
+            "timings": self.timings,
+            "dedup": self.dedup.stats() if self.dedup else None,
+            # Products passed through unenriched because the enricher was down or too slow.
+            "unenriched": sum(t["unenriched"] for t in self.timings),
+            "baselines": self.baselines,
+            "wall_ms": _ms_since(started),
+        }
+
+
+async def run_pipeline(client: httpx.AsyncClient, pages: List[tuple],
+                       on_enriched: Optional[Callable[[List[dict]], None]] = None) -> dict:
+    return await SupplierPipeline(client, on_enriched).run(pages)
@@ -0,0 +1,268 @@
+# /api_gateway/recrawl.py
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+
+import tracing
+from catalogue import CATALOGUE_DB, Catalogue
+from pipeline import (ENRICH_BATCH_SIZE, ENRICHER, ENRICHER_URL, PAGE_TRANSPORT, PRODUCT_AI, PRODUCT_AI_URL, SCRAPER,
+                      SCRAPER_URL, post, product_hash)
+
+# --- Configuration ---
+RECRAWL_ENABLED = os.environ.get("RECRAWL_ENABLED", "true").lower() == "true"
+# Revisit intervals adapt between these bounds: shorter for pages that change, longer for ones that don't.
+RECRAWL_MIN_INTERVAL_HOURS = float(os.environ.get("RECRAWL_MIN_INTERVAL_HOURS", "6"))
+RECRAWL_MAX_INTERVAL_HOURS = float(os.environ.get("RECRAWL_MAX_INTERVAL_HOURS", "336"))
+RECRAWL_INITIAL_INTERVAL_HOURS = float(os.environ.get("RECRAWL_INITIAL_INTERVAL_HOURS", "24"))
+# Global bound on re-crawl fetches, across all sites, on top of the scraper's per-host politeness.
+RECRAWL_RATE_PER_MINUTE = float(os.environ.get("RECRAWL_RATE_PER_MINUTE", "30"))
+RECRAWL_CONCURRENCY = int(os.environ.get("RECRAWL_CONCURRENCY", "2"))
+RECRAWL_POLL_SECONDS = float(os.environ.get("RECRAWL_POLL_SECONDS", "30"))
+# Unchanged -> interval * GROWTH, changed -> interval * SHRINK, error -> interval * GROWTH ** 2.
+_GROWTH, _SHRINK = 1.5, 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recrawl_pages (
+    page_url TEXT PRIMARY KEY,
+    supplier_url TEXT NOT NULL,
+    next_due REAL NOT NULL,
+    interval_hours REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    block_hash TEXT,
+    product_hashes TEXT,
+    checks INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_checked REAL,
+    last_changed REAL,
+    last_outcome TEXT,
+    in_progress INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS recrawl_due ON recrawl_pages(in_progress, next_due);
+"""
+
+
+class _RateGate:
+    """Spaces out fetch starts so there are never more than `per_minute` in any minute."""
+    def __init__(self, per_minute: float):
+        self.spacing = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.spacing
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RecrawlScheduler:
+    """
+    Keeps known supplier pages fresh without rerunning discovery.
+
+    Pages live in a priority queue (ordered by their next due time) persisted in
+    SQLite next to the catalogue. Each check is as cheap as the page allows: a
+    conditional GET that comes back 304, then an unchanged product-block hash
+    from product_ai_service, and only then the products themselves, of which
+    just the new or changed ones are enriched again and written to the catalogue.
+    Revisit intervals grow while a page stays the same and shrink when it changes.
+    """
+
+    def __init__(self, catalogue: Catalogue, path: str = CATALOGUE_DB):
+        self.catalogue = catalogue
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            # Checks interrupted by a restart are simply due again.
+            self._db.execute("UPDATE recrawl_pages SET in_progress = 0")
+        self._gate = _RateGate(RECRAWL_RATE_PER_MINUTE)
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"not_modified": 0, "unchanged": 0, "changed": 0, "baseline": 0, "error": 0, "products_reenriched": 0}
+
+    # --- Queue ---
+    def enroll(self, pages: List[tuple], baselines: Optional[dict] = None):
+        """
+        Adds (supplier_url, page_url) pairs. Pages a pipeline run just processed (`baselines`
+        given, see SupplierPipeline) are first checked one initial interval later, against
+        the block and product hashes that run saw; other pages are due at once, and their
+        first check only records a baseline.
+        """
+        now = time.time()
+        next_due = now if baselines is None else now + RECRAWL_INITIAL_INTERVAL_HOURS * 3600
+        with self._lock:
+            self._db.executemany(
+                """INSERT OR IGNORE INTO recrawl_pages (page_url, supplier_url, next_due, interval_hours)
+                   VALUES (?, ?, ?, ?)""",
+                [(page, supplier, next_due, RECRAWL_INITIAL_INTERVAL_HOURS) for supplier, page in pages])
+            # Already-known pages take the run's view too, so products it just enriched are not enriched again.
+            self._db.executemany(
+                """UPDATE recrawl_pages SET block_hash = COALESCE(?, block_hash), product_hashes = ?
+                   WHERE page_url = ? AND in_progress = 0""",
+                [(seen["block_hash"], json.dumps(seen["product_hashes"]), page)
+                 for page, seen in (baselines or {}).items()])
+
+    def _claim_due(self, limit: int) -> List[sqlite3.Row]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM recrawl_pages WHERE in_progress = 0 AND next_due <= ? ORDER BY next_due LIMIT ?",
+                (time.time(), limit)).fetchall()
+            self._db.executemany("UPDATE recrawl_pages SET in_progress = 1 WHERE page_url = ?", [(r["page_url"],) for r in rows])
+        return rows
+
+    def _release(self, row: sqlite3.Row):
+        """Returns a claimed page to the queue unchanged, still due."""
+        with self._lock:
+            self._db.execute("UPDATE recrawl_pages SET in_progress = 0 WHERE page_url = ?", (row["page_url"],))
+
+    def _reschedule(self, row: sqlite3.Row, outcome: str, state: dict):
+        interval = row["interval_hours"]
+        if outcome == "changed":
+            interval *= _SHRINK
+        elif outcome == "error":
+            interval *= _GROWTH ** 2
+        elif outcome != "baseline":
+            interval *= _GROWTH
+        interval = min(RECRAWL_MAX_INTERVAL_HOURS, max(RECRAWL_MIN_INTERVAL_HOURS, interval))
+        now = time.time()
+        # Jitter keeps pages enrolled together from coming due together forever.
+        next_due = now + interval * 3600 * random.uniform(0.9, 1.1)
+        with self._lock:
+            self._db.execute(
+                """UPDATE recrawl_pages SET next_due = ?, interval_hours = ?, in_progress = 0, last_checked = ?,
+                       last_outcome = ?, checks = checks + 1,
+                       changes = changes + ?, last_changed = CASE WHEN ? THEN ? ELSE last_changed END,
+                       failures = CASE WHEN ? THEN failures + 1 ELSE 0 END,
+                       etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+                       block_hash = COALESCE(?, block_hash), product_hashes = COALESCE(?, product_hashes)
+                   WHERE page_url = ?""",
+                (next_due, interval, now, outcome, int(outcome == "changed"), outcome == "changed", now,
+                 outcome == "error", state.get("etag"), state.get("last_modified"), state.get("block_hash"),
+                 json.dumps(state["product_hashes"]) if state.get("product_hashes") is not None else None,
+                 row["page_url"]))
+
+    # --- One check ---
+    async def check(self, client: httpx.AsyncClient, row: sqlite3.Row) -> str:
+        page_url, supplier_url = row["page_url"], row["supplier_url"]
+        state: dict = {}
+        outcome = "error"
+        cancelled = False
+        span = tracing.start_span("recrawl", page_url=page_url)
+        try:
+            await self._gate.wait()
+            # Same breakers as live runs: while a service is down, checks fail fast and are retried later.
+            scraper_res = await SCRAPER.acall(lambda timeout: post(client, f"{SCRAPER_URL}/scrape/", timeout, json={
+                "url": page_url, "transport": PAGE_TRANSPORT, "etag": row["etag"], "last_modified": row["last_modified"]}))
+            scraped = scraper_res.json()
+            state.update(etag=scraped.get("etag"), last_modified=scraped.get("last_modified"))
+            if scraped.get("not_modified"):
+                outcome = "not_modified"
+                return outcome
+
+            product_ai_res = await PRODUCT_AI.acall(lambda timeout: post(
+                client, f"{PRODUCT_AI_URL}/identify_products/", timeout, content=scraper_res.content,
+                headers={"Content-Type": "application/json"}))
+            state["block_hash"] = product_ai_res.headers.get("X-Product-Block-Hash")
+            baseline = row["block_hash"] is None and row["product_hashes"] is None
+            if not baseline and state["block_hash"] and state["block_hash"] == row["block_hash"]:
+                outcome = "unchanged"
+                return outcome
+
+            products = product_ai_res.json()
+            hashes = [product_hash(p) for p in products]
+            state["product_hashes"] = hashes
+            if baseline:
+                # Nothing to compare against yet (enrolled without a pipeline run); remember the page and move on.
+                outcome = "baseline"
+                return outcome
+            known = set(json.loads(row["product_hashes"] or "[]"))
+            changed = [p for p, h in zip(products, hashes) if h not in known]
+            if not changed:
+                outcome = "unchanged"
+                return outcome
+            enriched = []
+            for i in range(0, len(changed), ENRICH_BATCH_SIZE):
+                enricher_res = await ENRICHER.acall(lambda timeout: post(
+                    client, f"{ENRICHER_URL}/enrich/", timeout, json={"products": changed[i:i + ENRICH_BATCH_SIZE]}))
+                enriched.extend(enricher_res.json())
+            for product in enriched:
+                product["supplier_url"] = supplier_url
+            if enriched:
+                await asyncio.to_thread(self.catalogue.add_products, enriched)
+            self._counters["products_reenriched"] += len(enriched)
+            span.set(changed_products=len(changed))
+            outcome = "changed"
+            return outcome
+        except asyncio.CancelledError:
+            # Shutting down: the check did not finish, so it is neither counted nor rescheduled.
+            cancelled = True
+            raise
+        except Exception as e:
+            span.fail(e)
+            print(f"Warning: Re-crawl of {page_url} failed: {e}")
+            return outcome
+        finally:
+            span.set(outcome="cancelled" if cancelled else outcome)
+            span.end()
+            if cancelled:
+                await asyncio.to_thread(self._release, row)
+            else:
+                self._counters[outcome] += 1
+                # A failed check keeps the previous validators and hashes: saving what it saw would make the
+                # next check answer 304 or "unchanged" for products that were never re-enriched.
+                await asyncio.to_thread(self._reschedule, row, outcome, {} if outcome == "error" else state)
+
+    # --- Background loop ---
+    async def _run(self):
+        gate = asyncio.Semaphore(RECRAWL_CONCURRENCY)
+        async with httpx.AsyncClient(event_hooks=tracing.httpx_event_hooks()) as client:
+            async def guarded(row):
+                async with gate:
+                    await self.check(client, row)
+
+            while True:
+                rows = await asyncio.to_thread(self._claim_due, RECRAWL_CONCURRENCY * 4)
+                if not rows:
+                    await asyncio.sleep(RECRAWL_POLL_SECONDS)
+                    continue
+                await asyncio.gather(*(guarded(row) for row in rows))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            print(f"✅ Re-crawl scheduler started ({RECRAWL_RATE_PER_MINUTE:g} fetches/min, {RECRAWL_CONCURRENCY} at a time).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            row = self._db.execute(
+                """SELECT COUNT(*) AS pages, SUM(next_due <= ?) AS due, AVG(interval_hours) AS avg_interval_hours,
+                          MIN(next_due) AS next_due FROM recrawl_pages""", (time.time(),)).fetchone()
+        return {
+            "enabled": self._task is not None,
+            "pages": row["pages"],
+            "due_now": row["due"] or 0,
+            "avg_interval_hours": round(row["avg_interval_hours"], 2) if row["avg_interval_hours"] else None,
+            "next_due_in_seconds": round(row["next_due"] - time.time()) if row["next_due"] else None,
+            **self._counters,
+        }
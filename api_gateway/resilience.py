@@ -0,0 +1,242 @@
+# resilience.py
+# Adaptive timeouts, circuit breakers and hedged requests for calls to other
+# services, shared (by copy) by the services that make them.
+# - Each downstream dependency gets a timeout derived from its own recent latency.
+# - Consecutive failures open its breaker: calls fail fast or take a fallback.
+# - Idempotent async calls can be hedged with a second attempt when slow.
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import tracing
+
+# --- Configuration ---
+# Timeout = clamp(TIMEOUT_MULTIPLIER x p99 of recent successful calls, floor, ceiling).
+TIMEOUT_MULTIPLIER = float(os.environ.get("RESILIENCE_TIMEOUT_MULTIPLIER", "2.0"))
+MIN_SAMPLES = int(os.environ.get("RESILIENCE_MIN_SAMPLES", "20"))
+# Consecutive failures that open a breaker, and how long it stays open before one trial call.
+FAILURE_THRESHOLD = int(os.environ.get("RESILIENCE_FAILURE_THRESHOLD", "5"))
+OPEN_SECONDS = float(os.environ.get("RESILIENCE_OPEN_SECONDS", "30"))
+# A hedge is sent once the first attempt has taken longer than this percentile of recent calls.
+HEDGE_PERCENTILE = float(os.environ.get("RESILIENCE_HEDGE_PERCENTILE", "0.95"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+def is_dependency_failure(error: Exception) -> bool:
+    """
+    Whether an error says something about the dependency's health. A 4xx
+    response (other than 429) is the caller's problem and must not open a breaker.
+    """
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status >= 500 or status == 429
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, asyncio.TimeoutError) or "timeout" in type(error).__name__.lower()
+
+
+class Dependency:
+    """
+    Guards calls to one downstream dependency.
+
+    The timeout of every call follows the dependency's own recent latency
+    instead of one fixed worst case; consecutive failures open a breaker so
+    further calls fail fast (or take the fallback) until a trial call after
+    OPEN_SECONDS succeeds; idempotent async calls can be hedged with a second
+    attempt when the first one is slower than usual.
+    """
+
+    def __init__(self, name: str, initial_timeout: float, floor: float, ceiling: float,
+                 failure_threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.name = name
+        self.initial_timeout = initial_timeout
+        self.floor = floor
+        self.ceiling = ceiling
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._counters = {"calls": 0, "failures": 0, "timeouts": 0, "short_circuited": 0, "fallbacks": 0,
+                          "hedges": 0, "hedges_won": 0, "opened": 0}
+        tracing.register_gauge("dependency_circuit_open", lambda: 1 if self.state() == "open" else 0, dependency=name)
+        tracing.register_gauge("dependency_timeout_seconds", self.timeout, dependency=name)
+
+    # --- Latency ---
+    def _percentile(self, q: float) -> float | None:
+        with self._lock:
+            values = sorted(self._latencies)
+        if len(values) < MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def timeout(self) -> float:
+        p99 = self._percentile(0.99)
+        if p99 is None:
+            return self.initial_timeout
+        return min(self.ceiling, max(self.floor, p99 * TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self) -> float | None:
+        """How long to wait before hedging, or None until there is enough history."""
+        p = self._percentile(HEDGE_PERCENTILE)
+        return None if p is None else max(0.01, p)
+
+    # --- Breaker ---
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "open" if time.monotonic() - self._opened_at < self.open_seconds else "half_open"
+
+    def _admit(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.open_seconds or self._trial_in_flight:
+                self._counters["short_circuited"] += 1
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+            self._trial_in_flight = True
+
+    def _record(self, ok: bool, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self._counters["calls"] += 1
+            self._trial_in_flight = False
+            if ok:
+                self._latencies.append(seconds)
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._counters["failures"] += 1
+            self._counters["timeouts"] += int(timed_out)
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self._counters["opened"] += 1
+                    print(f"⚠️ Circuit for {self.name} opened after {self._failures} consecutive failures.")
+                self._opened_at = time.monotonic()
+        tracing.inc("dependency_failures_total", dependency=self.name)
+
+    def _failed(self, error: Exception, started: float, fallback):
+        if not is_dependency_failure(error):
+            self._record(True, time.monotonic() - started)
+            raise error
+        self._record(False, time.monotonic() - started, timed_out=_is_timeout(error))
+        return self._fallback(fallback, error)
+
+    def _fallback(self, fallback, error: Exception):
+        if fallback is None:
+            raise error
+        with self._lock:
+            self._counters["fallbacks"] += 1
+        print(f"⚠️ {self.name} failed ({type(error).__name__}: {error}); using fallback.")
+        return fallback()
+
+    # --- Calls ---
+    def call(self, fn, fallback=None):
+        """Synchronous call: fn(timeout_seconds) -> result. Failures raise or return fallback()."""
+        try:
+            self._admit()
+        except CircuitOpenError as e:
+            return self._fallback(fallback, e)
+        started = time.monotonic()
+        try:
+            result = fn(self.timeout())
+        except Exception as e:
+            return self._failed(e, started, fallback)
+        self._record(True, time.monotonic() - started)
+        return result
+
+    async def _attempt(self, fn, timeout: float):
+        return await asyncio.wait_for(fn(timeout), timeout)
+
+    async def acall(self, fn, fallback=None, hedge: bool = False):
+        """
+        Async call: fn(timeout_seconds) -> awaitable. With hedge=True (idempotent
+        calls only) a second attempt starts if the first is slower than usual,
+        and whichever finishes first wins.
+        """
+        try:
+            self._admit()
+        except CircuitOpenError as e:
+            return self._fallback(fallback, e)
+        timeout = self.timeout()
+        started = time.monotonic()
+        delay = self.hedge_delay() if hedge else None
+        try:
+            if delay is None or delay >= timeout:
+                result = await self._attempt(fn, timeout)
+            else:
+                result, started = await self._hedged(fn, timeout, delay)
+        except asyncio.CancelledError:
+            # The caller gave up; that says nothing about the dependency, but a trial slot must be freed.
+            with self._lock:
+                self._trial_in_flight = False
+            raise
+        except Exception as e:
+            return self._failed(e, started, fallback)
+        self._record(True, time.monotonic() - started)
+        return result
+
+    async def _hedged(self, fn, timeout: float, delay: float) -> tuple:
+        """Returns (result, start time of the attempt that produced it)."""
+        first_started = time.monotonic()
+        first = asyncio.ensure_future(self._attempt(fn, timeout))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result(), first_started
+            with self._lock:
+                self._counters["hedges"] += 1
+            second_started = time.monotonic()
+            second = asyncio.ensure_future(self._attempt(fn, max(0.01, timeout - delay)))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            with self._lock:
+                                self._counters["hedges_won"] += 1
+                            # Latency history tracks the service, not the hedging delay in front of it.
+                            return task.result(), second_started
+                        return task.result(), first_started
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        p50, p99 = self._percentile(0.50), self._percentile(0.99)
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "state": self.state(),
+            "timeout_seconds": round(self.timeout(), 3),
+            "latency_p50_seconds": None if p50 is None else round(p50, 3),
+            "latency_p99_seconds": None if p99 is None else round(p99, 3),
+            **counters,
+        }
+
+
+_dependencies: dict = {}
+
+
+def dependency(name: str, initial_timeout: float, floor: float, ceiling: float, **kwargs) -> Dependency:
+    """The process-wide Dependency for `name`, created on first use."""
+    if name not in _dependencies:
+        _dependencies[name] = Dependency(name, initial_timeout, floor, ceiling, **kwargs)
+    return _dependencies[name]
+
+
+def stats() -> dict:
+    return {name: dep.stats() for name, dep in _dependencies.items()}
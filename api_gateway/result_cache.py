@@ -0,0 +1,166 @@
+# /api_gateway/result_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import tracing
+from catalogue import normalize_query
+
+# --- Configuration ---
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+# Younger results are served as they are...
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600"))
+# ...older ones up to this age are served at once while a fresh run replaces them in the background.
+RESULT_CACHE_STALE_SECONDS = float(os.environ.get("RESULT_CACHE_STALE_SECONDS", "86400"))
+# Least recently used results are evicted beyond this many bytes of (JSON-encoded) responses.
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 2**20)))
+# How often the deployed model and prompt versions are looked up for the keys.
+RESULT_CACHE_VERSIONS_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_VERSIONS_TTL_SECONDS", "60"))
+# Bump to invalidate every cached result by hand (e.g. after changing the enricher's prompt).
+RESULT_CACHE_VERSION = os.environ.get("RESULT_CACHE_VERSION", "1")
+
+
+class _Entry:
+    __slots__ = ("value", "size", "stored_at")
+
+    def __init__(self, value: dict, size: int):
+        self.value = value
+        self.size = size
+        self.stored_at = time.time()
+
+
+class ResultCache:
+    """
+    Whole /discover-and-enrich responses, keyed by the normalized query, its
+    budget and the versions of the NLP prompt and models that produced them.
+
+    The versions are the deployed ones, looked up from the search engine at most
+    once per RESULT_CACHE_VERSIONS_TTL_SECONDS (see versions_due) and also taken
+    from every complete live run. So a new prompt or model makes every older entry
+    unreachable (and, in time, evicted) within that interval, without any explicit
+    invalidation. Identical requests that arrive while a run is in flight wait for
+    that run instead of starting their own.
+    """
+
+    def __init__(self, ttl: float = RESULT_CACHE_TTL_SECONDS, stale: float = RESULT_CACHE_STALE_SECONDS,
+                 max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_bytes = max_bytes
+        self.versions: dict = {}
+        self._versions_checked_at: Optional[float] = None
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "joined": 0, "revalidations": 0, "evictions": 0}
+        tracing.register_gauge("result_cache_bytes", lambda: self._bytes)
+        tracing.register_gauge("result_cache_entries", lambda: len(self._entries))
+
+    # --- Keys ---
+    def versions_due(self) -> bool:
+        """True, once per RESULT_CACHE_VERSIONS_TTL_SECONDS, when the deployed versions should be looked up again."""
+        now = time.monotonic()
+        if self._versions_checked_at is not None and now - self._versions_checked_at < RESULT_CACHE_VERSIONS_TTL_SECONDS:
+            return False
+        self._versions_checked_at = now
+        return True
+
+    def note_versions(self, versions: Optional[dict]):
+        """Records the deployed versions (or those a complete live run reported); later keys are built from them."""
+        if versions:
+            self.versions = dict(versions)
+
+    def key(self, query: str, **params) -> str:
+        material = json.dumps({"query": normalize_query(query), "params": params, "versions": self.versions,
+                               "cache_version": RESULT_CACHE_VERSION}, sort_keys=True)
+        return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+    # --- Entries ---
+    def get(self, key: str) -> Optional[tuple]:
+        """Returns (value, age_seconds, fresh), or None if absent or too old even to serve stale."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            age = time.time() - entry.stored_at
+            if age > self.ttl + self.stale:
+                self._drop(key)
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            fresh = age <= self.ttl
+            self._counters["hits" if fresh else "stale_hits"] += 1
+            return entry.value, round(age), fresh
+
+    def put(self, key: str, value: dict):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _drop(self, key: str):
+        self._bytes -= self._entries.pop(key).size
+
+    # --- Runs ---
+    async def run(self, key: str, producer: Callable[[], Awaitable[dict]],
+                  cacheable: Callable[[dict], bool], key_after: Optional[Callable[[], str]] = None) -> dict:
+        """
+        Produces the value for `key`, sharing one run between identical concurrent
+        requests. Cacheable results are stored under key_after() (the key built
+        from the versions the run itself reported), or `key`. Only cacheable
+        results update the versions: a degraded run (say, the NLP step fell back
+        and reported no prompt version) must not move every query's key.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self._counters["joined"] += 1
+        else:
+            async def produce():
+                try:
+                    value = await producer()
+                    if cacheable(value):
+                        self.note_versions(value.get("versions"))
+                        self.put(key_after() if key_after else key, value)
+                    return value
+                finally:
+                    self._inflight.pop(key, None)
+            task = asyncio.ensure_future(produce())
+            self._inflight[key] = task
+        # Shielded: one caller disconnecting must not cancel the run the others are waiting for.
+        return await asyncio.shield(task)
+
+    def revalidate(self, key: str, producer: Callable[[], Awaitable[dict]], cacheable: Callable[[dict], bool],
+                   key_after: Optional[Callable[[], str]] = None):
+        """Refreshes `key` in the background, unless a run for it is already in flight."""
+        if key in self._inflight:
+            return
+        self._counters["revalidations"] += 1
+        task = asyncio.ensure_future(self.run(key, producer, cacheable, key_after))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception() is None or
+                               print(f"Warning: Background refresh failed: {t.exception()}"))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": RESULT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "in_flight": len(self._inflight),
+                "versions": self.versions,
+                **self._counters,
+            }
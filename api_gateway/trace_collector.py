@@ -0,0 +1,70 @@
+# /api_gateway/trace_collector.py
+import os
+import threading
+from collections import OrderedDict
+
+# --- Configuration ---
+# How many recent traces the collector keeps in memory.
+MAX_TRACES = int(os.environ.get("TRACE_COLLECTOR_MAX_TRACES", "500"))
+
+
+class TraceCollector:
+    """
+    A small in-memory collector for the spans every service exports.
+    It keeps the most recent MAX_TRACES traces and can show any of them as
+    a flat, time-ordered list or as a per-service/per-stage breakdown.
+    """
+
+    def __init__(self, max_traces: int = MAX_TRACES):
+        self.max_traces = max_traces
+        self._traces: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, spans: list):
+        with self._lock:
+            for record in spans:
+                trace_id = record.get("trace_id")
+                if not trace_id:
+                    continue
+                self._traces.setdefault(trace_id, []).append(record)
+                self._traces.move_to_end(trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> dict | None:
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        if not spans:
+            return None
+        spans.sort(key=lambda s: s["start_time"])
+        trace_start = spans[0]["start_time"]
+        by_stage = {}
+        for record in spans:
+            record = {**record, "offset_ms": round((record["start_time"] - trace_start) * 1000, 1)}
+            key = f"{record['service']}:{record['name']}"
+            stage = by_stage.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + record["duration_ms"], 1)
+            stage["max_ms"] = max(stage["max_ms"], record["duration_ms"])
+        roots = [s for s in spans if s["parent_id"] is None]
+        return {
+            "trace_id": trace_id,
+            "duration_ms": roots[0]["duration_ms"] if roots else None,
+            "span_count": len(spans),
+            "stages": dict(sorted(by_stage.items(), key=lambda item: -item[1]["total_ms"])),
+            "spans": spans,
+        }
+
+    def recent(self, limit: int = 20) -> list:
+        with self._lock:
+            items = list(self._traces.items())[-limit:]
+        summaries = []
+        for trace_id, spans in reversed(items):
+            roots = [s for s in spans if s["parent_id"] is None]
+            summaries.append({
+                "trace_id": trace_id,
+                "root": roots[0]["name"] if roots else None,
+                "duration_ms": roots[0]["duration_ms"] if roots else None,
+                "span_count": len(spans),
+            })
+        return summaries
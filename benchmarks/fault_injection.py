@@ -0,0 +1,186 @@
+# benchmarks/fault_injection.py
+"""
+Fault-injection checks for the resilience layer (api_gateway/resilience.py,
+copied into search-engine-service). Faults are injected into stubs.py through
+its /_faults endpoint, and each scenario asserts what the layer promises:
+
+  slow_tail   10% of calls hang; unhedged ones hit the timeout, hedged ones still succeed in time
+  hang        every call hangs; calls end at the adaptive timeout, then the breaker opens
+  errors      every call returns 503; the breaker opens and later calls fail in microseconds
+  recovery    faults cleared; after the open period one trial call closes the breaker
+
+By default the scenarios drive a Dependency directly against the stubs:
+
+    python stubs.py --port 9100 --search-latency-ms 50 &
+    python fault_injection.py --stubs http://localhost:9100
+
+With --gateway, the stack from docker-compose.bench.yml is exercised instead:
+the mock LLM hangs, and every discover-and-enrich request must still come back
+(degraded, with unenriched products) within --max-p99-seconds.
+
+    python fault_injection.py --stubs http://localhost:9100 --gateway http://localhost:8080
+
+Exits non-zero if any check fails.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api_gateway"))
+import resilience  # noqa: E402
+
+from run import QUERIES  # noqa: E402
+
+FAULT_ROUTE = "/customsearch"
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, name: str, ok: bool, detail: str):
+        self.failed += not ok
+        print(f"  {'✅' if ok else '❌'} {name}: {detail}")
+
+
+async def set_faults(client: httpx.AsyncClient, stubs: str, faults: dict | None):
+    if faults is None:
+        (await client.delete(f"{stubs}/_faults")).raise_for_status()
+    else:
+        (await client.post(f"{stubs}/_faults", json=faults)).raise_for_status()
+
+
+async def get(client: httpx.AsyncClient, url: str, timeout: float, **params) -> httpx.Response:
+    response = await client.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+async def timed_calls(dep: resilience.Dependency, client: httpx.AsyncClient, url: str, count: int,
+                      hedge: bool = False, concurrency: int = 4) -> tuple:
+    """Returns (sorted latencies in seconds, number of failed calls)."""
+    gate = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        async with gate:
+            started = time.monotonic()
+            try:
+                await dep.acall(lambda timeout: get(client, url, timeout, q=QUERIES[i % len(QUERIES)]), hedge=hedge)
+            except Exception:
+                failures += 1
+            latencies.append(time.monotonic() - started)
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return sorted(latencies), failures
+
+
+def p99(sorted_values: list) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(0.99 * len(sorted_values)))]
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms"
+
+
+async def layer_scenarios(args, checks: Checks):
+    url = f"{args.stubs}{FAULT_ROUTE}/v1"
+    async with httpx.AsyncClient() as client:
+        await set_faults(client, args.stubs, None)
+        hang = {FAULT_ROUTE: {"hang_ms": args.hang_ms}}
+
+        print("▶ slow_tail")
+        plain = resilience.Dependency("plain", initial_timeout=60, floor=0.05, ceiling=60)
+        hedged = resilience.Dependency("hedged", initial_timeout=60, floor=0.05, ceiling=60)
+        for dep in (plain, hedged):
+            await timed_calls(dep, client, url, resilience.MIN_SAMPLES)  # latency history, no faults
+        await set_faults(client, args.stubs, {FAULT_ROUTE: {"hang_ms": args.hang_ms, "hang_rate": 0.1}})
+        plain_lat, plain_failed = await timed_calls(plain, client, url, args.calls)
+        hedged_lat, hedged_failed = await timed_calls(hedged, client, url, args.calls, hedge=True)
+        checks.check("hedging absorbs the slow tail", hedged_failed == 0 and p99(hedged_lat) < plain.timeout(),
+                     f"unhedged {plain_failed}/{args.calls} failed at the {_ms(plain.timeout())} timeout; "
+                     f"hedged {hedged_failed} failed, p99 {_ms(p99(hedged_lat))} "
+                     f"({hedged.stats()['hedges']} hedges, {hedged.stats()['hedges_won']} won)")
+
+        print("▶ hang")
+        dep = resilience.Dependency("hang", initial_timeout=60, floor=0.05, ceiling=60, open_seconds=args.open_seconds)
+        await set_faults(client, args.stubs, None)
+        await timed_calls(dep, client, url, resilience.MIN_SAMPLES)
+        timeout = dep.timeout()
+        await set_faults(client, args.stubs, hang)
+        latencies, failures = await timed_calls(dep, client, url, args.calls, concurrency=1)
+        checks.check("calls end at the adaptive timeout", p99(latencies) < timeout + 0.5,
+                     f"timeout {_ms(timeout)} (learned), p99 {_ms(p99(latencies))} "
+                     f"against a {_ms(args.hang_ms / 1000)} hang, {failures}/{args.calls} failed")
+        checks.check("breaker opens on timeouts", dep.state() == "open" and dep.stats()["short_circuited"] > 0,
+                     f"state {dep.state()}, {dep.stats()['timeouts']} timeouts, {dep.stats()['short_circuited']} short-circuited")
+
+        print("▶ errors")
+        dep = resilience.Dependency("errors", initial_timeout=5, floor=0.05, ceiling=60, open_seconds=args.open_seconds)
+        await set_faults(client, args.stubs, {FAULT_ROUTE: {"error_rate": 1.0, "status": 503}})
+        await timed_calls(dep, client, url, dep.failure_threshold, concurrency=1)
+        latencies, _ = await timed_calls(dep, client, url, args.calls)
+        fallback = await dep.acall(lambda timeout: get(client, url, timeout), fallback=lambda: "fallback")
+        checks.check("open breaker fails fast", dep.state() == "open" and p99(latencies) < 0.005,
+                     f"state {dep.state()}, p99 {p99(latencies) * 1e6:.0f} µs while open")
+        checks.check("fallback served while open", fallback == "fallback", f"got {fallback!r}")
+
+        print("▶ recovery")
+        await set_faults(client, args.stubs, None)
+        await asyncio.sleep(args.open_seconds)
+        _, failures = await timed_calls(dep, client, url, 1)
+        checks.check("half-open trial closes the breaker", dep.state() == "closed" and not failures,
+                     f"state {dep.state()} after {args.open_seconds:g}s")
+
+
+async def gateway_scenario(args, checks: Checks):
+    print("▶ gateway with a hanging LLM")
+    async with httpx.AsyncClient(timeout=None) as client:
+        await set_faults(client, args.stubs, {"/openai": {"hang_ms": args.hang_ms}})
+        latencies, statuses, unenriched = [], {}, 0
+        try:
+            for i in range(args.gateway_requests):
+                started = time.monotonic()
+                res = await client.post(f"{args.gateway}/discover-and-enrich",
+                                        json={"query": QUERIES[i % len(QUERIES)], "refresh": True})
+                latencies.append(time.monotonic() - started)
+                statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+                if res.status_code == 200:
+                    unenriched += res.json().get("unenriched_products", 0)
+        finally:
+            await set_faults(client, args.stubs, None)
+        dependencies = (await client.get(f"{args.gateway}/stats")).json().get("dependencies", {})
+    latencies.sort()
+    checks.check("every request answered", set(statuses) == {200}, f"statuses {statuses}")
+    checks.check("p99 bounded", p99(latencies) <= args.max_p99_seconds,
+                 f"p99 {p99(latencies):.1f}s (limit {args.max_p99_seconds:g}s), {unenriched} products unenriched")
+    for name, dep in dependencies.items():
+        print(f"    {name:<24} {dep['state']:<9} timeout {dep['timeout_seconds']}s  failures {dep['failures']}  "
+              f"short-circuited {dep['short_circuited']}  fallbacks {dep['fallbacks']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stubs", default="http://localhost:9100", help="Base URL of stubs.py.")
+    parser.add_argument("--gateway", help="Run the end-to-end scenario against this gateway instead.")
+    parser.add_argument("--calls", type=int, default=40, help="Calls per scenario.")
+    parser.add_argument("--hang-ms", type=int, default=3000)
+    parser.add_argument("--open-seconds", type=float, default=2.0, help="Breaker open period in the scenarios.")
+    parser.add_argument("--gateway-requests", type=int, default=5)
+    parser.add_argument("--max-p99-seconds", type=float, default=300)
+    args = parser.parse_args()
+    args.stubs = args.stubs.rstrip("/")
+
+    checks = Checks()
+    asyncio.run(gateway_scenario(args, checks) if args.gateway else layer_scenarios(args, checks))
+    print(f"\n{'❌' if checks.failed else '✅'} {checks.failed} check(s) failed.")
+    sys.exit(1 if checks.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
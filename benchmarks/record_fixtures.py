@@ -0,0 +1,87 @@
+# benchmarks/record_fixtures.py
+"""
+Records live supplier pages into fixtures/ so benchmarks can replay them offline.
+
+    python record_fixtures.py https://www.example-supplier.com/ --label 1
+    python record_fixtures.py --from ../search-engine-service/verified_data_batch_4.txt
+
+Each page is saved as fixtures/sites/<name>.html and added to fixtures/manifest.json
+with its title and meta description (used as the fake search snippet) and its label.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+def parse_batch_file(path: str) -> list:
+    """Reads the '# Class N' / URL format of the verified_data_batch_*.txt files."""
+    entries, label = [], None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("# Class"):
+                label = int(re.search(r"\d+", line).group())
+            elif line.startswith("http") and label is not None:
+                entries.append((line.strip(), label))
+    return entries
+
+
+def fixture_name(url: str) -> str:
+    name = re.sub(r"^https?://(www\.)?", "", url).strip("/")
+    return re.sub(r"[^\w-]+", "-", name)[:80].strip("-").lower()
+
+
+def extract(pattern: str, html: str) -> str:
+    match = re.search(pattern, html, re.I | re.S)
+    return re.sub(r"\s+", " ", match.group(1)).strip() if match else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("--label", type=int, help="Class label for URLs given on the command line.")
+    parser.add_argument("--from", dest="batch_file", help="A verified_data_batch_*.txt file to record.")
+    args = parser.parse_args()
+
+    entries = [(url, args.label) for url in args.urls]
+    if args.batch_file:
+        entries += parse_batch_file(args.batch_file)
+    if not entries:
+        parser.error("Give URLs or --from <batch file>.")
+
+    manifest_path = os.path.join(FIXTURE_DIR, "manifest.json")
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = {site["name"]: site for site in json.load(f)}
+
+    with httpx.Client(headers={"User-Agent": USER_AGENT}, follow_redirects=True, timeout=20) as client:
+        for url, label in entries:
+            try:
+                html = client.get(url).text
+            except Exception as e:
+                print(f"❗️ Could not record {url}: {e}", file=sys.stderr)
+                continue
+            name = fixture_name(url)
+            with open(os.path.join(FIXTURE_DIR, "sites", f"{name}.html"), "w", encoding="utf-8") as f:
+                f.write(html)
+            manifest[name] = {
+                "name": name,
+                "title": extract(r"<title[^>]*>(.*?)</title>", html),
+                "snippet": extract(r"<meta[^>]+name=[\"']description[\"'][^>]+content=[\"'](.*?)[\"']", html),
+                "label": label,
+                "source_url": url,
+            }
+            print(f"✅ Recorded {url} as {name} ({len(html) / 1024:.0f} KB)")
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(list(manifest.values()), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
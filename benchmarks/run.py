@@ -0,0 +1,248 @@
+# benchmarks/run.py
+"""
+Load-test driver for the services. Sends a fixed number of requests at a set
+concurrency to one target, then reports p50/p95/p99 latency, throughput,
+error count and the peak RSS every listed service reports on /metrics (summed
+over the service's process tree, so the scraper's Chrome processes count).
+
+Results are written as JSON to results/ so two runs can be compared:
+
+    python run.py --target scraper --concurrency 8 --requests 200 --label pooled
+    python run.py --target gateway --concurrency 4 --requests 20 --compare results/baseline-gateway.json
+
+Targets and their default base URLs (as published by docker-compose.bench.yml):
+    gateway     POST /discover-and-enrich     http://localhost:8080
+    search      POST /api/discover            http://localhost:5001
+    nlp         POST /process-query           http://localhost:8000
+    scraper     POST /scrape/                 http://localhost:8001
+    product_ai  POST /identify_products/      http://localhost:8002
+    enricher    POST /enrich/                 http://localhost:8003
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+RESULTS_DIR = os.path.join(HERE, "results")
+
+QUERIES = ["cherry tomatoes wholesale", "extra virgin olive oil bulk", "pomodoro ciliegino 5kg bio",
+           "baking flour supplier", "italian pasta distributor"]
+
+DEFAULT_BASE_URLS = {
+    "gateway": "http://localhost:8080",
+    "search": "http://localhost:5001",
+    "nlp": "http://localhost:8000",
+    "scraper": "http://localhost:8001",
+    "product_ai": "http://localhost:8002",
+    "enricher": "http://localhost:8003",
+}
+ALL_SERVICE_METRICS = list(DEFAULT_BASE_URLS.values())
+
+
+def load_fixtures() -> tuple:
+    with open(os.path.join(FIXTURE_DIR, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    pages = {}
+    for site in manifest:
+        with open(os.path.join(FIXTURE_DIR, "sites", f"{site['name']}.html"), encoding="utf-8") as f:
+            pages[site["name"]] = f.read()
+    return manifest, pages
+
+
+def build_requests(target: str, fixture_base_url: str) -> tuple:
+    """Returns (path, payload_factory) for a target; the factory takes the request index."""
+    manifest, pages = load_fixtures()
+    names = [site["name"] for site in manifest]
+    if target in ("gateway", "search", "nlp"):
+        path = {"gateway": "/discover-and-enrich", "search": "/api/discover", "nlp": "/process-query"}[target]
+        return path, lambda i: {"query": QUERIES[i % len(QUERIES)]}
+    if target == "scraper":
+        return "/scrape/", lambda i: {"url": f"{fixture_base_url}/sites/{names[i % len(names)]}/"}
+    if target == "product_ai":
+        return "/identify_products/", lambda i: {"html": pages[names[i % len(names)]]}
+    if target == "enricher":
+        products = [{"name": "Cherry Tomatoes 5kg crate", "price": "€18.50", "product_url": "/p/1", "image_url": "/i/1.jpg"},
+                    {"name": "Extra Virgin Olive Oil 5L", "price": "€39.90", "product_url": "/p/2", "image_url": "/i/2.jpg"}]
+        return "/enrich/", lambda i: {"products": products}
+    raise SystemExit(f"Unknown target '{target}'. Choose from {sorted(DEFAULT_BASE_URLS)}.")
+
+
+def percentile(sorted_values: list, q: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[index], 1)
+
+
+# How often /metrics is read during the run; each read updates the service's process-tree peak.
+RSS_SAMPLE_SECONDS = 0.5
+
+
+async def peak_rss(client: httpx.AsyncClient, base_url: str):
+    try:
+        res = await client.get(f"{base_url}/metrics", timeout=5)
+        # Services without the tree gauge only report their own process.
+        for name in ("process_tree_peak_resident_memory_bytes", "process_peak_resident_memory_bytes"):
+            match = re.search(rf"^{name}\{{[^}}]*\}} ([\d.e+]+)$", res.text, re.M)
+            if match:
+                return int(float(match.group(1)))
+        return None
+    except Exception:
+        return None
+
+
+async def sample_rss(client: httpx.AsyncClient, metrics_urls: list):
+    """Reads /metrics periodically until cancelled, so short-lived child processes are caught at their peak."""
+    while True:
+        await asyncio.gather(*(peak_rss(client, base) for base in metrics_urls))
+        await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+
+async def run_load(args) -> dict:
+    path, payload_for = build_requests(args.target, args.fixture_base_url)
+    url = f"{args.base_url}{path}"
+    latencies, errors, statuses = [], 0, {}
+    counter = iter(range(args.warmup + args.requests))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    res = await client.post(url, json=payload_for(i))
+                    status = res.status_code
+                except Exception as e:
+                    status = type(e).__name__
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if i < args.warmup:
+                    continue
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if isinstance(status, int) and status < 400:
+                    latencies.append(elapsed_ms)
+                else:
+                    errors += 1
+
+        print(f"▶ {args.target}: {args.requests} requests (+{args.warmup} warm-up) at concurrency {args.concurrency} -> {url}")
+        metrics_urls = args.metrics_url or ([args.base_url] if args.target != "gateway" else ALL_SERVICE_METRICS)
+        # Its own client, so sampling never waits for one of the load's connections.
+        async with httpx.AsyncClient() as metrics_client:
+            sampler = asyncio.create_task(sample_rss(metrics_client, metrics_urls))
+            wall_started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            wall = time.perf_counter() - wall_started
+            sampler.cancel()
+
+        rss = {base: await peak_rss(client, base) for base in metrics_urls}
+
+    latencies.sort()
+    completed = len(latencies)
+    return {
+        "label": args.label,
+        "target": args.target,
+        "url": url,
+        "git_rev": git_rev(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "completed": completed,
+        "errors": errors,
+        "statuses": statuses,
+        "wall_seconds": round(wall, 3),
+        # Throughput counts only the measured requests; warm-up requests overlap the start.
+        "throughput_rps": round(completed / wall, 3) if wall else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "mean": round(sum(latencies) / completed, 1) if completed else None,
+            "max": round(latencies[-1], 1) if latencies else None,
+        },
+        "peak_rss_bytes": rss,
+    }
+
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def print_report(result: dict):
+    lat = result["latency_ms"]
+    print(f"  completed {result['completed']}/{result['requests']}  errors {result['errors']}  statuses {result['statuses']}")
+    print(f"  latency ms  p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  mean {lat['mean']}  max {lat['max']}")
+    print(f"  throughput  {result['throughput_rps']} req/s over {result['wall_seconds']}s")
+    for base, rss in result["peak_rss_bytes"].items():
+        print(f"  peak RSS    {base}: {'n/a' if rss is None else f'{rss / 2**20:.1f} MiB'}")
+
+
+def compare(result: dict, baseline: dict, max_regression_pct: float) -> bool:
+    """Prints the change against a baseline; returns False if any metric regressed past the limit."""
+    ok = True
+    rows = [("p50 ms", result["latency_ms"]["p50"], baseline["latency_ms"]["p50"], False),
+            ("p95 ms", result["latency_ms"]["p95"], baseline["latency_ms"]["p95"], False),
+            ("p99 ms", result["latency_ms"]["p99"], baseline["latency_ms"]["p99"], False),
+            ("throughput", result["throughput_rps"], baseline["throughput_rps"], True)]
+    for base, rss in result["peak_rss_bytes"].items():
+        rows.append((f"RSS {base}", rss, baseline.get("peak_rss_bytes", {}).get(base), False))
+    print(f"\n  vs baseline '{baseline.get('label')}' ({baseline.get('git_rev')}, {baseline.get('started_at')}):")
+    for name, new, old, higher_is_better in rows:
+        if new is None or not old:
+            continue
+        change = (new - old) / old * 100
+        regressed = (change < -max_regression_pct) if higher_is_better else (change > max_regression_pct)
+        ok = ok and not regressed
+        print(f"    {name:<38} {old:>12} -> {new:<12} {change:+6.1f}% {'❌ REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", required=True, choices=sorted(DEFAULT_BASE_URLS))
+    parser.add_argument("--base-url", help="Override the target's base URL.")
+    parser.add_argument("--fixture-base-url", default="http://bench_stubs:9100",
+                        help="Where the SCRAPER reaches the stub server (scraper target only).")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=2, help="Requests sent first and excluded from the stats.")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--metrics-url", action="append", help="Service base URL(s) to read peak RSS from (repeatable).")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out", help="Result file (default results/<label>-<target>-<timestamp>.json).")
+    parser.add_argument("--compare", help="A previous result file to compare against.")
+    parser.add_argument("--max-regression-pct", type=float, default=10.0)
+    args = parser.parse_args()
+    args.base_url = (args.base_url or DEFAULT_BASE_URLS[args.target]).rstrip("/")
+
+    result = asyncio.run(run_load(args))
+    print_report(result)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.out or os.path.join(RESULTS_DIR, f"{args.label}-{args.target}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"  saved to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("target") != result["target"]:
+            raise SystemExit(f"Baseline is for target '{baseline.get('target')}', not '{result['target']}'.")
+        if not compare(result, baseline, args.max_regression_pct):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
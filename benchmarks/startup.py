@@ -0,0 +1,204 @@
+# benchmarks/startup.py
+"""
+Cold-start benchmark. Starts each service as a fresh process, the way its
+Dockerfile does, and measures how long it takes to:
+
+  health    answer GET /health (the process is up: imports done, server listening)
+  ready     answer GET /ready with 200 (every warm-up step has run, see readiness.py)
+  first     serve one real request after that (only for targets with a cheap probe)
+
+and which warm-up steps took the time. Each service is started --runs times
+and the median is reported; results are written as JSON to results/.
+
+    python startup.py                                   # every service
+    python startup.py --target product_ai --runs 5
+    python startup.py --target product_ai --no-warmup   # WARMUP_ENABLED=false, for comparison
+
+Services run on free local ports with their state files in a temporary
+directory. Missing API keys or Chrome only fail the optional warm-up steps.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from run import RESULTS_DIR, git_rev, load_fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _uvicorn(module: str) -> list:
+    return [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", "{port}"]
+
+
+def _search_engine_command() -> list:
+    try:
+        import gunicorn  # noqa: F401
+        return [sys.executable, "-m", "gunicorn", "--bind", "127.0.0.1:{port}", "--workers", "1", "--threads", "8",
+                "--timeout", "300", "app:app"]
+    except ImportError:
+        # Same application, started by Flask's development server.
+        return [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1", "--port", "{port}"]
+
+
+# target -> (directory, command)
+SERVICES = {
+    "gateway": ("api_gateway", _uvicorn("main:app")),
+    "search": ("search-engine-service", _search_engine_command()),
+    "nlp": ("nlp_service", _uvicorn("app.main:app")),
+    "scraper": ("scraper_service", _uvicorn("main:app")),
+    "product_ai": ("product_ai_service", _uvicorn("main:app")),
+    "enricher": ("enrichment_llm_service", _uvicorn("main:app")),
+}
+
+
+def first_request(target: str) -> tuple | None:
+    """(method, path, json body) of a request that needs no other service, or None."""
+    if target == "product_ai":
+        manifest, pages = load_fixtures()
+        return "POST", "/identify_products/", {"html": pages[manifest[0]["name"]]}
+    if target == "gateway":
+        return "GET", "/search?q=olive+oil", None
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, url: str, process: subprocess.Popen, deadline: float) -> httpx.Response | None:
+    """Polls url until it answers 200; None if the process exits or the deadline passes first."""
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            response = client.get(url, timeout=1.0)
+            if response.status_code == 200:
+                return response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def start_once(target: str, warmup: bool, timeout: float) -> dict:
+    directory, command = SERVICES[target]
+    port = free_port()
+    with tempfile.TemporaryDirectory() as state:
+        env = {**os.environ, "WARMUP_ENABLED": str(warmup).lower(), "PYTHONUNBUFFERED": "1",
+               "CATALOGUE_DB": os.path.join(state, "catalogue.db"), "RECRAWL_ENABLED": "false",
+               "TIER_STATE_FILE": os.path.join(state, "tier_memory.json"), "BLOB_DIR": os.path.join(state, "blobs"),
+               "LABEL_QUEUE_FILE": os.path.join(state, "label_queue.jsonl"),
+               "LABELS_FILE": os.path.join(state, "label_decisions.jsonl")}
+        started = time.monotonic()
+        process = subprocess.Popen([arg.format(port=port) for arg in command], cwd=os.path.join(ROOT, directory),
+                                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        base = f"http://127.0.0.1:{port}"
+        result = {"health_seconds": None, "ready_seconds": None, "first_request_ms": None, "steps": {}}
+        try:
+            with httpx.Client() as client:
+                deadline = started + timeout
+                if wait_for(client, f"{base}/health", process, deadline) is None:
+                    result["error"] = f"no /health (exit code {process.poll()})"
+                    return result
+                result["health_seconds"] = round(time.monotonic() - started, 3)
+                ready = wait_for(client, f"{base}/ready", process, deadline)
+                if ready is None:
+                    result["error"] = "never ready"
+                    try:
+                        result["steps"] = client.get(f"{base}/ready", timeout=1.0).json().get("steps", {})
+                    except (httpx.HTTPError, ValueError):
+                        pass
+                    return result
+                result["ready_seconds"] = round(time.monotonic() - started, 3)
+                result["steps"] = ready.json().get("steps", {})
+                probe = first_request(target)
+                if probe:
+                    method, path, body = probe
+                    sent = time.monotonic()
+                    response = client.request(method, f"{base}{path}", json=body, timeout=timeout)
+                    result["first_request_ms"] = round((time.monotonic() - sent) * 1000, 1)
+                    result["first_request_status"] = response.status_code
+        finally:
+            process.terminate()
+            try:
+                _, stderr = process.communicate(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                _, stderr = process.communicate()
+            if result.get("error") and stderr:
+                result["stderr_tail"] = stderr.strip().splitlines()[-5:]
+    return result
+
+
+def _median(runs: list, key: str):
+    values = [run[key] for run in runs if run.get(key) is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def summarize(target: str, runs: list) -> dict:
+    steps = {}
+    for run in runs:
+        for name, step in run["steps"].items():
+            steps.setdefault(name, []).append(step)
+    return {
+        "health_seconds": _median(runs, "health_seconds"),
+        "ready_seconds": _median(runs, "ready_seconds"),
+        "first_request_ms": _median(runs, "first_request_ms"),
+        "steps": {name: {"seconds": round(statistics.median(s["seconds"] for s in values), 3),
+                         "failed": sum(1 for s in values if not s["ok"])}
+                  for name, values in steps.items()},
+        "errors": [run["error"] for run in runs if run.get("error")],
+        "runs": runs,
+    }
+
+
+def print_report(target: str, summary: dict):
+    def fmt(value, unit):
+        return "n/a" if value is None else f"{value}{unit}"
+    print(f"  {target:<11} health {fmt(summary['health_seconds'], 's'):<8} ready {fmt(summary['ready_seconds'], 's'):<8} "
+          f"first request {fmt(summary['first_request_ms'], ' ms')}")
+    for name, step in summary["steps"].items():
+        print(f"  {'':<11}   {name:<16} {step['seconds']}s{'  (failed in %d run(s))' % step['failed'] if step['failed'] else ''}")
+    for error in summary["errors"]:
+        print(f"  {'':<11}   ❌ {error}")
+    for run in summary["runs"]:
+        for line in run.get("stderr_tail", []):
+            print(f"  {'':<11}      {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", choices=sorted(SERVICES), help="Service(s) to start (default: all).")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-warmup", action="store_true", help="Start with WARMUP_ENABLED=false.")
+    parser.add_argument("--timeout", type=float, default=180, help="Seconds a service gets to become ready.")
+    parser.add_argument("--label", default="startup")
+    parser.add_argument("--out", help="Result file (default results/<label>-<timestamp>.json).")
+    args = parser.parse_args()
+
+    result = {"label": args.label, "git_rev": git_rev(), "started_at": datetime.now(timezone.utc).isoformat(),
+              "warmup": not args.no_warmup, "runs": args.runs, "services": {}}
+    for target in args.target or list(SERVICES):
+        runs = [start_once(target, not args.no_warmup, args.timeout) for _ in range(args.runs)]
+        result["services"][target] = summarize(target, runs)
+        print_report(target, result["services"][target])
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.out or os.path.join(RESULTS_DIR, f"{args.label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"  saved to {out}")
+    sys.exit(1 if any(s["errors"] for s in result["services"].values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/stubs.py
+"""
+Local stand-ins for everything outside our network, so the whole stack can be
+benchmarked offline and deterministically:
+
+  /sites/<name>/...                 recorded supplier pages from fixtures/sites/
+  /customsearch/v1                  a fake Google Custom Search JSON API
+  /openai/v1/chat/completions       a mock Groq (OpenAI-compatible) endpoint
+  /_faults                          GET/POST/DELETE injected faults per route prefix
+
+Point the services at it with GOOGLE_API_BASE_URL and GROQ_BASE_URL
+(see docker-compose.bench.yml).
+
+    python stubs.py --port 9100 --public-url http://bench_stubs:9100 --llm-latency-ms 400
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# route prefix -> {"latency_ms": int, "error_rate": float, "status": int, "hang_ms": int, "hang_rate": float}
+# hang_ms applies to every request, or to a hang_rate fraction of them (a slow tail).
+FAULTS = {}
+FAULTS_LOCK = threading.Lock()
+
+
+def load_manifest() -> list:
+    with open(os.path.join(FIXTURE_DIR, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None      # argparse namespace, set in main()
+    manifest = []
+
+    def log_message(self, fmt, *args):
+        if self.config.verbose:
+            super().log_message(fmt, *args)
+
+    # --- helpers ---
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _json(self, status: int, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _apply_faults(self, path: str, base_latency_ms: int) -> bool:
+        """Sleeps for configured latency; returns False if the request was answered with a fault."""
+        with FAULTS_LOCK:
+            fault = next((f for prefix, f in FAULTS.items() if path.startswith(prefix)), {})
+        latency = fault.get("latency_ms", base_latency_ms)
+        if latency:
+            time.sleep(random.uniform(0.8, 1.2) * latency / 1000)
+        if fault.get("hang_ms") and random.random() < fault.get("hang_rate", 1.0):
+            time.sleep(fault["hang_ms"] / 1000)
+        if fault.get("error_rate") and random.random() < fault["error_rate"]:
+            self._json(fault.get("status", 503), {"error": "injected fault"})
+            return False
+        return True
+
+    # --- routing ---
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/_faults":
+            with FAULTS_LOCK:
+                return self._json(200, FAULTS)
+        if parsed.path == "/robots.txt":
+            return self._send(200, b"User-agent: *\nAllow: /\n", "text/plain")
+        if parsed.path.startswith("/customsearch/v1"):
+            if self._apply_faults(parsed.path, self.config.search_latency_ms):
+                self._custom_search(parse_qs(parsed.query))
+            return
+        if parsed.path.startswith("/sites/"):
+            if self._apply_faults(parsed.path, self.config.fixture_latency_ms):
+                self._site(parsed.path)
+            return
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        body = self._body()
+        if parsed.path == "/_faults":
+            with FAULTS_LOCK:
+                FAULTS.update(json.loads(body or b"{}"))
+                return self._json(200, FAULTS)
+        if parsed.path.endswith("/chat/completions"):
+            if self._apply_faults(parsed.path, self.config.llm_latency_ms):
+                self._chat_completion(json.loads(body or b"{}"))
+            return
+        self._json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        if urlparse(self.path).path == "/_faults":
+            with FAULTS_LOCK:
+                FAULTS.clear()
+            return self._json(200, {})
+        self._json(404, {"error": "not found"})
+
+    # --- fake Custom Search API ---
+    def _custom_search(self, params: dict):
+        query = (params.get("q") or [""])[0]
+        start = int((params.get("start") or ["1"])[0])
+        num = min(10, int((params.get("num") or ["10"])[0]))
+        # Deterministic per query: rotate the fixture list by a hash of the query.
+        offset = int(hashlib.md5(query.encode("utf-8")).hexdigest(), 16) % len(self.manifest)
+        ordered = self.manifest[offset:] + self.manifest[:offset]
+        window = ordered[(start - 1) % len(ordered):][:min(num, self.config.results_per_query)]
+        items = []
+        for site in window:
+            link = f"{self.config.public_url}/sites/{site['name']}/"
+            items.append({"title": site["title"], "link": link, "snippet": site["snippet"],
+                          "displayLink": urlparse(link).netloc})
+        if items and start == 1:
+            # Search results routinely carry the same site under a tracking URL.
+            items.append({**items[0], "link": items[0]["link"] + "?utm_source=google&utm_medium=organic"})
+        self._json(200, {"kind": "customsearch#search", "items": items})
+
+    # --- recorded supplier pages ---
+    def _site(self, path: str):
+        match = re.match(r"^/sites/([\w-]+)", path)
+        file_path = os.path.join(FIXTURE_DIR, "sites", f"{match.group(1)}.html") if match else ""
+        if not file_path or not os.path.exists(file_path):
+            return self._send(404, b"<html><body><h1>Not found</h1></body></html>", "text/html")
+        with open(file_path, "rb") as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        mtime = os.path.getmtime(file_path)
+        validators = {"ETag": etag, "Last-Modified": formatdate(mtime, usegmt=True)}
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, b"", "text/html", validators)
+        since = self.headers.get("If-Modified-Since")
+        if since:
+            try:
+                if int(mtime) <= parsedate_to_datetime(since).timestamp():
+                    return self._send(304, b"", "text/html", validators)
+            except (TypeError, ValueError):
+                pass
+        self._send(200, body, "text/html; charset=utf-8", validators)
+
+    # --- mock Groq ---
+    def _chat_completion(self, request: dict):
+        messages = request.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        if "B2B sourcing expert" in system:
+            content = self._nlp_answer(user)
+        else:
+            content = self._enrichment_answer(user)
+        self._json(200, {
+            "id": f"chatcmpl-stub-{random.getrandbits(32):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(system + user) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(system + user) + len(content)) // 4},
+        })
+
+    @staticmethod
+    def _nlp_answer(user_prompt: str) -> str:
+        queries = re.findall(r'User Query: "(.*)"', user_prompt)
+        product = (queries[-1] if queries else "product").strip() or "product"
+        return json.dumps({
+            "english": {"product": product, "attributes": [],
+                        "b2b_search_queries": [f"wholesale {product} suppliers", f"bulk {product} distributor"]},
+            "french": {"product": product, "attributes": [],
+                       "b2b_search_queries": [f"fournisseur {product} en gros"]},
+        })
+
+    @staticmethod
+    def _enrichment_answer(user_prompt: str) -> str:
+        try:
+            data = json.loads(user_prompt.split("following data:", 1)[1])
+        except (IndexError, ValueError):
+            data = {}
+        price_text = str(data.get("price") or "")
+        number = re.search(r"\d+(?:[.,]\d+)?", price_text)
+        currency = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}.get(next((c for c in price_text if c in "$€£¥"), ""), None)
+        return json.dumps({
+            "cleaned_name": " ".join(str(data.get("name") or "Unknown").split()),
+            "price_as_float": float(number.group().replace(",", ".")) if number else None,
+            "currency": currency,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("STUB_PORT", "9100")))
+    parser.add_argument("--public-url", default=os.environ.get("STUB_PUBLIC_URL"),
+                        help="Base URL the services use to reach this server (default http://localhost:PORT).")
+    parser.add_argument("--fixture-latency-ms", type=int, default=int(os.environ.get("FIXTURE_LATENCY_MS", "150")))
+    parser.add_argument("--search-latency-ms", type=int, default=int(os.environ.get("SEARCH_LATENCY_MS", "300")))
+    parser.add_argument("--llm-latency-ms", type=int, default=int(os.environ.get("LLM_LATENCY_MS", "400")))
+    parser.add_argument("--results-per-query", type=int, default=int(os.environ.get("RESULTS_PER_QUERY", "8")))
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    args.public_url = (args.public_url or f"http://localhost:{args.port}").rstrip("/")
+
+    StubHandler.config = args
+    StubHandler.manifest = load_manifest()
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"✅ Benchmark stubs listening on {args.host}:{args.port} (public URL {args.public_url}), "
+          f"{len(StubHandler.manifest)} recorded sites.")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
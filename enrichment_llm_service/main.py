@@ -1,22 +1,52 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import json
 import os
-from groq import Groq
+import threading
+import readiness
+import tracing
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+tracing.instrument_fastapi(app, "enrichment_llm_service")
+readiness.instrument_fastapi(app)
 
 # --- Configuration and Client Setup ---
 # Your code uses GROQ_API_KEY1, which is fine, we just need to ensure the variable is set via docker-compose.
 api_key = os.environ.get("GROQ_API_KEY1") 
-client = Groq(api_key=api_key) if api_key else None
+# Bound every LLM call so one stuck request cannot stall a whole batch.
+GROQ_TIMEOUT_SECONDS = float(os.environ.get("GROQ_TIMEOUT_SECONDS", "20"))
+GROQ_MAX_RETRIES = int(os.environ.get("GROQ_MAX_RETRIES", "1"))
+_client = None
+_client_lock = threading.Lock()
 
 if not api_key:
     # Use the correct variable name in the warning message
     print("❌ WARNING: GROQ_API_KEY1 environment variable not set. The /enrich/ endpoint will fail.")
-else:
-    print("✅ GROQ_API_KEY1 found and initializing client.")
+
+def get_client():
+    """The Groq client, built on first use (or during warm-up); None without an API key."""
+    global _client
+    if not api_key:
+        return None
+    with _client_lock:
+        if _client is None:
+            # Importing groq is a noticeable share of start-up, so it waits until a client is needed.
+            from groq import Groq
+            _client = Groq(api_key=api_key, timeout=GROQ_TIMEOUT_SECONDS, max_retries=GROQ_MAX_RETRIES)
+            print("✅ GROQ_API_KEY1 found and client initialized.")
+        return _client
+
+@readiness.step("groq_client", required=False)
+def warm_groq_client():
+    if get_client() is None:
+        raise RuntimeError("Groq client not configured (GROQ_API_KEY1).")
 
 # --- Pydantic Models ---
 
@@ -47,6 +77,7 @@ class EnrichedProductData(BaseModel):
 # And the response is a list of EnrichedProductData
 @app.post("/enrich/", response_model=List[EnrichedProductData])
 async def enrich_product_data(request: EnrichmentRequest):
+    client = get_client()
     if not client:
         raise HTTPException(status_code=500, detail="LLM Client not configured.")
 
@@ -76,15 +107,18 @@ async def enrich_product_data(request: EnrichmentRequest):
         user_prompt = f"Please process the following data: {json.dumps(user_prompt_data)}"
 
         try:
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                model="llama3-8b-8192", # Llama 3 8B is excellent for this specific task
-                temperature=0.1,
-                response_format={"type": "json_object"},
-            )
+            with tracing.span("llm_call", model="llama3-8b-8192") as llm_span:
+                chat_completion = client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    model="llama3-8b-8192", # Llama 3 8B is excellent for this specific task
+                    temperature=0.1,
+                    response_format={"type": "json_object"},
+                )
+                if chat_completion.usage:
+                    llm_span.set(total_tokens=chat_completion.usage.total_tokens)
 
             response_content = chat_completion.choices[0].message.content
             print("🧠 Raw LLM response:", repr(response_content))
@@ -0,0 +1,407 @@
+# tracing.py
+# Minimal, dependency-free tracing and metrics shared (by copy) across the services.
+# - Trace context travels between services in the W3C `traceparent` header.
+# - Finished spans are batched by a background thread and exported to a JSONL
+#   file (TRACE_EXPORT_PATH) and/or POSTed to a collector (TRACE_COLLECTOR_URL).
+# - Span durations, request counts and process memory are exposed in the
+#   Prometheus text format by render_metrics() (served on /metrics).
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import resource
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+# --- Configuration ---
+SERVICE_NAME = os.environ.get("SERVICE_NAME", "service")
+TRACE_COLLECTOR_URL = os.environ.get("TRACE_COLLECTOR_URL")
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+EXPORT_BATCH_SIZE = 100
+EXPORT_INTERVAL_SECONDS = 1.0
+
+# Requests to these paths are neither traced nor counted (scrapes, span uploads and probes).
+UNTRACED_PATHS = ("/metrics", "/traces", "/health", "/ready")
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_local_sinks = []
+
+
+def _new_id(num_bytes: int) -> str:
+    return "%0*x" % (num_bytes * 2, random.getrandbits(num_bytes * 8))
+
+
+class Span:
+    """One timed operation. Create through span() or start_span(); never directly."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, sampled: bool, attrs: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attrs = attrs
+        self.status = "ok"
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self._token = None
+        self.duration_ms = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error: Exception):
+        self.status = "error"
+        self.attrs["error"] = f"{type(error).__name__}: {error}"[:500]
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self):
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from a different context (e.g. a Flask teardown); nothing to restore.
+                pass
+            self._token = None
+        observe("span_duration_seconds", self.duration_ms / 1000, span=self.name)
+        if self.status == "error":
+            inc("span_errors_total", span=self.name)
+        if self.sampled:
+            _exporter.submit(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "service": SERVICE_NAME, "name": self.name, "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms or 0.0, 3), "status": self.status, "attrs": self.attrs,
+        }
+
+
+def parse_traceparent(value: str | None):
+    """Returns (trace_id, parent_span_id, sampled) or None for a missing/invalid header."""
+    try:
+        version, trace_id, span_id, flags = (value or "").strip().split("-")
+        if len(trace_id) != 32 or len(span_id) != 16 or int(trace_id, 16) == 0:
+            return None
+        return trace_id, span_id, int(flags, 16) & 1 == 1
+    except ValueError:
+        return None
+
+
+def start_span(name: str, traceparent: str | None = None, **attrs) -> Span:
+    """
+    Starts a span and makes it current. It becomes a child of the current span,
+    or of the remote parent in `traceparent`, or the root of a new trace.
+    """
+    parent = _current_span.get()
+    remote = parse_traceparent(traceparent) if traceparent else None
+    if remote:
+        trace_id, parent_id, sampled = remote
+    elif parent is not None:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    else:
+        trace_id, parent_id, sampled = _new_id(16), None, random.random() < TRACE_SAMPLE_RATE
+    new_span = Span(name, trace_id, parent_id, sampled, attrs)
+    new_span._token = _current_span.set(new_span)
+    return new_span
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """`with span("predict", rows=3):` times a block as a child of the current span."""
+    current = start_span(name, **attrs)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end()
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def inject_headers(headers: dict | None = None) -> dict:
+    """Adds the current trace context to outgoing headers for another of OUR services."""
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent
+    return headers
+
+
+def httpx_event_hooks() -> dict:
+    """event_hooks for an httpx.AsyncClient that talks to our own services."""
+    async def add_traceparent(request):
+        request.headers.update(inject_headers())
+    return {"request": [add_traceparent]}
+
+
+def wrap(fn):
+    """Carries the current trace context into a thread-pool or executor job."""
+    ctx = contextvars.copy_context()
+    @functools.wraps(fn)
+    def runner(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return runner
+
+
+# --- Export ---
+class _Exporter:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, record: dict):
+        for sink in _local_sinks:
+            sink([record])
+        if not (TRACE_COLLECTOR_URL or TRACE_EXPORT_PATH):
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            inc("spans_dropped_total")
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+            while len(batch) < EXPORT_BATCH_SIZE and time.monotonic() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def _export(self, batch: list):
+        if TRACE_EXPORT_PATH:
+            try:
+                with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in batch)
+            except OSError as e:
+                print(f"⚠️ Could not write spans to {TRACE_EXPORT_PATH}: {e}")
+        if TRACE_COLLECTOR_URL:
+            try:
+                body = json.dumps({"spans": batch}).encode("utf-8")
+                req = urllib.request.Request(TRACE_COLLECTOR_URL, data=body, headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(req, timeout=2).close()
+            except Exception:
+                inc("spans_dropped_total", len(batch))
+
+_exporter = _Exporter()
+
+
+def add_local_sink(fn):
+    """Delivers finished spans in-process (used by the gateway's own collector)."""
+    _local_sinks.append(fn)
+
+
+# --- Metrics ---
+_metrics_lock = threading.Lock()
+_counters: dict = {}
+_histograms: dict = {}
+_gauges: dict = {}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    with _metrics_lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels):
+    with _metrics_lock:
+        key = _key(name, labels)
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+
+def register_gauge(name: str, fn, **labels):
+    """`fn` is called at scrape time and must return a number."""
+    _gauges[_key(name, labels)] = fn
+
+
+def _fmt_labels(labels, extra=()) -> str:
+    pairs = [("service", SERVICE_NAME), *labels, *extra]
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs) + "}"
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _metrics_lock:
+        counters = dict(_counters)
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]} for k, v in _histograms.items()}
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        for bound, count in zip(HISTOGRAM_BUCKETS, hist["buckets"]):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist['sum']:.6f}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {hist['count']}")
+    for (name, labels), fn in sorted(_gauges.items(), key=lambda item: item[0]):
+        try:
+            lines.append(f"{name}{_fmt_labels(labels)} {float(fn())}")
+        except Exception:
+            continue
+    return "\n".join(lines) + "\n"
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+register_gauge("process_resident_memory_bytes", _rss_bytes)
+# ru_maxrss is in KB on Linux
+register_gauge("process_peak_resident_memory_bytes", lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+_tree_peak = {"bytes": 0}
+
+
+def _tree_rss_bytes() -> int:
+    """RSS of this process and all its descendants (e.g. the scraper's Chrome processes), in bytes."""
+    children, rss = {}, {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * resource.getpagesize()
+    total, pending = 0, [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        total += rss.get(pid, 0)
+        pending.extend(children.get(pid, []))
+    _tree_peak["bytes"] = max(_tree_peak["bytes"], total)
+    return total
+
+
+def _tree_peak_rss_bytes() -> int:
+    """Highest tree RSS seen so far; only as fine-grained as /metrics is scraped (benchmarks/run.py samples it)."""
+    _tree_rss_bytes()
+    return max(_tree_peak["bytes"], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+register_gauge("process_tree_resident_memory_bytes", _tree_rss_bytes)
+register_gauge("process_tree_peak_resident_memory_bytes", _tree_peak_rss_bytes)
+
+
+# --- Framework integration ---
+def _record_request(method: str, path: str, status: int, seconds: float):
+    inc("http_requests_total", method=method, path=path, status=status)
+    observe("http_request_duration_seconds", seconds, method=method, path=path)
+
+
+def instrument_fastapi(app, service_name: str | None = None):
+    """Server span per request (joining the caller's trace) and a GET /metrics endpoint."""
+    global SERVICE_NAME
+    if service_name:
+        SERVICE_NAME = service_name
+    from starlette.responses import PlainTextResponse
+
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        if request.url.path.startswith(UNTRACED_PATHS):
+            return await call_next(request)
+        route_path = request.url.path
+        server_span = start_span(f"{request.method} {route_path}", traceparent=request.headers.get("traceparent"))
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            # Label by route template (/traces/{trace_id}), not by raw path.
+            route = request.scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                route_path = route.path
+                server_span.name = f"{request.method} {route_path}"
+            status = response.status_code
+            response.headers["traceparent"] = server_span.traceparent
+            response.headers["X-Trace-Id"] = server_span.trace_id
+            return response
+        except Exception as e:
+            server_span.fail(e)
+            raise
+        finally:
+            server_span.set(status=status)
+            if status >= 500:
+                server_span.status = "error"
+            server_span.end()
+            _record_request(request.method, route_path, status, time.perf_counter() - started)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def instrument_flask(app, service_name: str | None = None):
+    """Flask equivalent of instrument_fastapi()."""
+    global SERVICE_NAME
+    if service_name:
+        SERVICE_NAME = service_name
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_span():
+        if request.path.startswith(UNTRACED_PATHS):
+            return
+        g._trace_span = start_span(f"{request.method} {request.path}", traceparent=request.headers.get("traceparent"))
+        g._trace_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_span(response):
+        server_span = g.pop("_trace_span", None)
+        if server_span is not None:
+            server_span.set(status=response.status_code)
+            if response.status_code >= 500:
+                server_span.status = "error"
+            response.headers["traceparent"] = server_span.traceparent
+            response.headers["X-Trace-Id"] = server_span.trace_id
+            server_span.end()
+            _record_request(request.method, request.path, response.status_code, time.perf_counter() - g.pop("_trace_started"))
+        return response
+
+    @app.teardown_request
+    def _abort_request_span(error):
+        server_span = g.pop("_trace_span", None)
+        if server_span is not None:
+            if error is not None:
+                server_span.fail(error)
+            server_span.end()
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
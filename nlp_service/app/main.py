@@ -1,17 +1,38 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.model.query_model import QueryRequest, FinalResponse, SearchData
-from app.service.nlp_pipeline import process_query_with_llm
+from app.service.nlp_pipeline import PROMPT_VERSION, get_client, process_query_with_llm
+from app import readiness, tracing
+
+@readiness.step("groq_client", required=False)
+def warm_groq_client():
+    # Without a key the service still answers; callers fall back to searching the raw query.
+    if get_client() is None:
+        raise RuntimeError("Groq client not configured (GROQ_API_KEY).")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.start()
+    yield
 
 app = FastAPI(
     title="Agro-Food NLP Microservice",
     description="Processes multilingual queries into structured, expanded B2B search data.",
-    version="16.0.0" # THE FINAL QUERY EXPANSION BUILD
+    version="16.0.0", # THE FINAL QUERY EXPANSION BUILD
+    lifespan=lifespan
 )
+tracing.instrument_fastapi(app, "nlp_service")
+readiness.instrument_fastapi(app)
 
 @app.get("/")
 async def root():
     return {"message": "NLP Service is running!"}
 
+@app.get("/versions")
+async def versions():
+    """The prompt version /process-query answers with now (callers key their caches on it)."""
+    return {"prompt_version": PROMPT_VERSION}
+
 @app.post("/process-query", response_model=FinalResponse)
 async def process_query_endpoint(request: QueryRequest):
     """
@@ -25,5 +46,6 @@ async def process_query_endpoint(request: QueryRequest):
 
     return FinalResponse(
         original_query=request.query,
-        search_data=search_data
+        search_data=search_data,
+        prompt_version=PROMPT_VERSION
     )
\ No newline at end of file
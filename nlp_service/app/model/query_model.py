@@ -17,4 +17,6 @@ class QueryRequest(BaseModel):
 
 class FinalResponse(BaseModel):
     original_query: str
-    search_data: Optional[SearchData] = None
\ No newline at end of file
+    search_data: Optional[SearchData] = None
+    # Identifies the prompts and model that produced search_data (for downstream caches).
+    prompt_version: Optional[str] = None
\ No newline at end of file
@@ -1,23 +1,40 @@
+import hashlib
 import os
 import json
-from groq import Groq
+import threading
 from dotenv import load_dotenv
+from app import tracing
 
 load_dotenv()
 
-try:
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-    if not client.api_key:
-        raise ValueError("GROQ_API_KEY not found.")
-except Exception as e:
-    print(f"CRITICAL ERROR Initializing Groq Client: {e}")
-    client = None
+# A stuck Groq call must not hold the query for minutes: bound it and retry at most this often.
+GROQ_TIMEOUT_SECONDS = float(os.environ.get("GROQ_TIMEOUT_SECONDS", "20"))
+GROQ_MAX_RETRIES = int(os.environ.get("GROQ_MAX_RETRIES", "1"))
 
-def process_query_with_llm(text: str) -> dict:
-    if not client:
-        return {}
+_client = None
+_client_initialized = False
+_client_lock = threading.Lock()
 
-    system_prompt = """
+def get_client():
+    """The Groq client, built on first use (or during warm-up); None if it cannot be configured."""
+    global _client, _client_initialized
+    with _client_lock:
+        if not _client_initialized:
+            # Importing groq is a noticeable share of start-up, so it waits until a client is needed.
+            from groq import Groq
+            try:
+                _client = Groq(api_key=os.environ.get("GROQ_API_KEY"), timeout=GROQ_TIMEOUT_SECONDS, max_retries=GROQ_MAX_RETRIES)
+                if not _client.api_key:
+                    raise ValueError("GROQ_API_KEY not found.")
+            except Exception as e:
+                print(f"CRITICAL ERROR Initializing Groq Client: {e}")
+                _client = None
+            _client_initialized = True
+        return _client
+
+LLM_MODEL = "llama3-70b-8192"
+
+SYSTEM_PROMPT = """
 You are a world-class B2B sourcing expert and multilingual data structuring AI.
 Your sole job is to analyze a user's messy query and respond with a single, valid JSON object.
 The JSON must have two top-level keys: "english" and "french".
@@ -29,7 +46,8 @@ Each of these keys will contain an object with three keys:
 Your entire response must be ONLY the JSON object.
 """
 
-    user_prompt = f"""
+# Filled in with str.format(query=...); literal braces are doubled.
+USER_PROMPT_TEMPLATE = """
 Here is an example of the required output format:
 ---
 User Query: "pomee de terra 5kg bio"
@@ -57,22 +75,36 @@ JSON Response: {{
 
 Now, process the following query. Remember, respond with ONLY the JSON object.
 
-User Query: "{text}"
+User Query: "{query}"
 JSON Response:
 """
 
+# Changes whenever the prompts or the model change, so callers can tell when cached expansions are outdated.
+PROMPT_VERSION = hashlib.sha1((LLM_MODEL + SYSTEM_PROMPT + USER_PROMPT_TEMPLATE).encode("utf-8")).hexdigest()[:12]
+
+def process_query_with_llm(text: str) -> dict:
+    client = get_client()
+    if not client:
+        return {}
+
+    system_prompt = SYSTEM_PROMPT
+    user_prompt = USER_PROMPT_TEMPLATE.format(query=text)
+
     try:
         print(f"DEBUG (NLP Service): Sending prompt to Groq for query: '{text}'")
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            model="llama3-70b-8192",
-            temperature=0.2,
-            max_tokens=1024,
-            response_format={"type": "json_object"},
-        )
+        with tracing.span("llm_call", model=LLM_MODEL) as llm_span:
+            chat_completion = client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                model=LLM_MODEL,
+                temperature=0.2,
+                max_tokens=1024,
+                response_format={"type": "json_object"},
+            )
+            if chat_completion.usage:
+                llm_span.set(total_tokens=chat_completion.usage.total_tokens)
         
         raw_output = chat_completion.choices[0].message.content
         print(f"DEBUG (NLP Service): Raw LLM output: '{raw_output}'")
@@ -1,16 +1,25 @@
 # /product_ai_service/main.py
+import asyncio
+import hashlib
 import joblib
 import json
 import pandas as pd
 import re
-from fastapi import FastAPI, HTTPException
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
 from bs4 import BeautifulSoup, Tag
 from typing import List
+import blob_store
+import readiness
+import tracing
 
 # --- DATA MODELS ---
 class HTMLPayload(BaseModel):
-    html: str
+    # Either the page itself, or a handle to it in the shared blob store.
+    html: str | None = None
+    blob_id: str | None = None
 
 class Product(BaseModel):
     name: str | None = None
@@ -19,16 +28,28 @@ class Product(BaseModel):
     image_url: str | None = None
 
 # --- GLOBAL VARIABLES ---
-# Load the model and features ONCE when the service starts
-try:
-    model = joblib.load("product_model.joblib")
-    with open("model_features.json", 'r') as f:
-        model_features = json.load(f)
-    print("✅ Model and features loaded successfully.")
-except FileNotFoundError:
-    print("❌ Critical Error: Model or features file not found.")
-    model = None
-    model_features = []
+# Loaded ONCE, by the warm-up or by the first request: unpickling imports scikit-learn,
+# which is most of the service's start-up time.
+_model = None
+_model_features = []
+_model_loaded = False
+_model_lock = threading.Lock()
+
+def get_model() -> tuple:
+    """Returns (model, feature names); (None, []) if the files are missing."""
+    global _model, _model_features, _model_loaded
+    with _model_lock:
+        if not _model_loaded:
+            try:
+                _model = joblib.load("product_model.joblib")
+                with open("model_features.json", 'r') as f:
+                    _model_features = json.load(f)
+                print("✅ Model and features loaded successfully.")
+            except FileNotFoundError:
+                print("❌ Critical Error: Model or features file not found.")
+                _model, _model_features = None, []
+            _model_loaded = True
+        return _model, _model_features
 
 
 # --- HELPER FUNCTIONS (Adapted from your notebook) ---
@@ -76,18 +97,49 @@ def extract_final_data(tag: Tag) -> Product:
         image_url=image_url
     )
 
+def product_block_hash(blocks: List[Tag]) -> str:
+    """Content hash of the product region only, so ads, dates and session tokens elsewhere don't count as changes."""
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(" ".join(block.get_text(" ", strip=True).split()).encode("utf-8"))
+        link, img = block.find('a', href=True), block.find('img')
+        digest.update(f"|{link['href'] if link else ''}|{img.get('src', '') if img else ''}\n".encode("utf-8"))
+    return digest.hexdigest()
+
 # --- FASTAPI APP ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.start()
+    yield
+
 app = FastAPI(
     title="Product AI Service",
-    description="Uses a trained ML model to find and extract product info from HTML."
+    description="Uses a trained ML model to find and extract product info from HTML.",
+    lifespan=lifespan
 )
+tracing.instrument_fastapi(app, "product_ai_service")
+readiness.instrument_fastapi(app)
 
 @app.post("/identify_products/", response_model=List[Product])
-async def identify_products(payload: HTMLPayload):
+async def identify_products(payload: HTMLPayload, response: Response):
+    """Returns the products on the page; the X-Product-Block-Hash header fingerprints their blocks."""
+    model, model_features = get_model()
     if not model or not model_features:
         raise HTTPException(status_code=500, detail="Model is not loaded.")
 
-    soup = BeautifulSoup(payload.html, 'lxml')
+    if payload.html is not None:
+        html = payload.html
+    elif payload.blob_id:
+        try:
+            with tracing.span("blob_store.get"):
+                html = await asyncio.to_thread(tracing.wrap(blob_store.get), payload.blob_id)
+        except (FileNotFoundError, ValueError) as e:
+            raise HTTPException(status_code=404, detail=f"Page blob not available: {e}")
+    else:
+        raise HTTPException(status_code=422, detail="Provide either 'html' or 'blob_id'.")
+
+    with tracing.span("parse", html_bytes=len(html)):
+        soup = BeautifulSoup(html, 'lxml')
     
     # ==================== NEW ACCURACY IMPROVEMENT LOGIC ====================
     # 1. First, try to find a main content area to reduce noise from headers/footers.
@@ -114,10 +166,12 @@ async def identify_products(payload: HTMLPayload):
     # ======================================================================
 
     if not candidates:
+        response.headers["X-Product-Block-Hash"] = product_block_hash([])
         return []
 
     # Continue the process with the much cleaner `candidates` list
-    candidate_data = [extract_features_improved(tag) for tag in candidates]
+    with tracing.span("extract_features", candidates=len(candidates)):
+        candidate_data = [extract_features_improved(tag) for tag in candidates]
     
     # Create DataFrame, ensuring it matches the model's expected features
     candidates_df = pd.DataFrame(candidate_data)
@@ -128,7 +182,8 @@ async def identify_products(payload: HTMLPayload):
     candidates_df = candidates_df[model_features]
 
     # Predict which of the filtered candidates are actual products
-    predictions = model.predict(candidates_df)
+    with tracing.span("predict", rows=len(candidates_df)):
+        predictions = model.predict(candidates_df)
     
     # Get the actual BeautifulSoup tags for the items predicted as products (1)
     product_blocks = [tag for i, tag in enumerate(candidates) if predictions[i] == 1]
@@ -136,6 +191,23 @@ async def identify_products(payload: HTMLPayload):
     # Apply a final confidence filter: a real product block should have both a link and an image
     final_blocks = [block for block in product_blocks if block.find('a', href=True) and block.find('img')]
     
-    extracted_data = [extract_final_data(block) for block in final_blocks]
+    with tracing.span("extract_products", blocks=len(final_blocks)):
+        extracted_data = [extract_final_data(block) for block in final_blocks]
+        response.headers["X-Product-Block-Hash"] = product_block_hash(final_blocks)
     print(f"✅ Identified {len(extracted_data)} final products after ML prediction and confidence filtering.")
-    return extracted_data
\ No newline at end of file
+    return extracted_data
+
+# --- WARM-UP (see readiness.py) ---
+# A tiny listing page with one product-like block.
+WARMUP_HTML = ("<html><body><main><ul><li><a href='/p/1'><img src='/p/1.jpg'></a>"
+               "<h3 class='title'>Sample product</h3><span>$1.00</span></li></ul></main></body></html>")
+
+@readiness.step("model")
+def warm_model():
+    if get_model()[0] is None:
+        raise RuntimeError("Model or features file not found.")
+
+@readiness.step("first_inference")
+def warm_first_inference():
+    # The whole request path once: lxml's parser, feature extraction, pandas and the model's first predict.
+    asyncio.run(identify_products(HTMLPayload(html=WARMUP_HTML), Response()))
@@ -0,0 +1,134 @@
+# readiness.py
+# Liveness, readiness and warm-up, shared (by copy) by every service.
+# - GET /health answers as soon as the process serves HTTP (liveness: restart me if this fails).
+# - GET /ready answers 200 only once every required warm-up step has run (readiness: send me traffic).
+# - Warm-up steps pay one-time costs (model loads, a first inference, client construction,
+#   browser launches) in a background thread, before the first real request would.
+import os
+import threading
+import time
+
+import tracing
+
+# --- Configuration ---
+# With warm-up off the service is ready at once, and the first requests load what they need lazily.
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"
+
+
+def _process_start_time() -> float:
+    """Wall-clock start of this process (so interpreter start-up and imports count), or now."""
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_STARTED = _process_start_time()
+
+_steps: list = []  # (name, fn, required), run in registration order
+_results: dict = {}
+_lock = threading.Lock()
+_state = {"started": False, "finished_at": None}
+
+
+def step(name: str, required: bool = True):
+    """
+    Registers a warm-up step (decorator). A required step that fails keeps the
+    service unready; an optional one (e.g. a browser launch) is only reported.
+    """
+    def register(fn):
+        _steps.append((name, fn, required))
+        return fn
+    return register
+
+
+def warm_up():
+    """Runs every step once, in order, recording how long each took."""
+    for name, fn, required in _steps:
+        started = time.monotonic()
+        result = {"required": required}
+        try:
+            with tracing.span("warmup", step=name):
+                fn()
+            result["ok"] = True
+        except Exception as e:
+            result.update(ok=False, error=f"{type(e).__name__}: {e}")
+            print(f"{'❗️' if required else '⚠️'} Warm-up step '{name}' failed: {e}")
+        result["seconds"] = round(time.monotonic() - started, 3)
+        with _lock:
+            _results[name] = result
+    with _lock:
+        _state["finished_at"] = time.time()
+    print(f"✅ Warm-up finished {time.time() - PROCESS_STARTED:.1f}s after process start: "
+          + ", ".join(f"{name} {r['seconds']}s" for name, r in _results.items()))
+
+
+def start():
+    """Starts warm-up in the background (once); /health answers meanwhile, /ready does not."""
+    with _lock:
+        if _state["started"]:
+            return
+        _state["started"] = True
+        if not WARMUP_ENABLED:
+            _state["finished_at"] = time.time()
+            return
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+def is_ready() -> bool:
+    with _lock:
+        return _state["finished_at"] is not None and all(r["ok"] or not r["required"] for r in _results.values())
+
+
+def status() -> dict:
+    with _lock:
+        finished_at = _state["finished_at"]
+        steps = {name: dict(r) for name, r in _results.items()}
+    return {
+        "ready": is_ready(),
+        "warmup_enabled": WARMUP_ENABLED,
+        "uptime_seconds": round(time.time() - PROCESS_STARTED, 3),
+        "warmed_up_after_seconds": None if finished_at is None else round(finished_at - PROCESS_STARTED, 3),
+        "steps": steps,
+        "pending": [name for name, _, _ in _steps if name not in steps],
+    }
+
+
+tracing.register_gauge("service_ready", lambda: 1 if is_ready() else 0)
+tracing.register_gauge("process_uptime_seconds", lambda: round(time.time() - PROCESS_STARTED, 3))
+
+
+def _health() -> dict:
+    return {"status": "ok", "uptime_seconds": round(time.time() - PROCESS_STARTED, 3)}
+
+
+def instrument_fastapi(app):
+    """Adds GET /health and GET /ready (503 until warmed up) to a FastAPI app."""
+    from starlette.responses import JSONResponse
+
+    @app.get("/health", include_in_schema=False)
+    async def health():
+        return _health()
+
+    @app.get("/ready", include_in_schema=False)
+    async def ready():
+        body = status()
+        return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+def instrument_flask(app):
+    """Flask equivalent of instrument_fastapi()."""
+    from flask import jsonify
+
+    @app.route("/health")
+    def health():
+        return jsonify(_health())
+
+    @app.route("/ready")
+    def ready():
+        body = status()
+        return jsonify(body), 200 if body["ready"] else 503
@@ -0,0 +1,72 @@
+# blob_store.py
+# A content-addressed, zstd-compressed page store on a volume shared by
+# scraper_service (writer) and product_ai_service (reader), so page HTML
+# can be passed between them by reference instead of through the gateway.
+import hashlib
+import os
+import re
+import time
+
+import zstandard
+
+# --- Configuration ---
+BLOB_DIR = os.environ.get("BLOB_DIR", "/blobs")
+BLOB_TTL_SECONDS = int(os.environ.get("BLOB_TTL_SECONDS", "900"))
+ZSTD_LEVEL = int(os.environ.get("BLOB_ZSTD_LEVEL", "3"))
+SWEEP_INTERVAL_SECONDS = 60
+
+_BLOB_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+_last_sweep = 0.0
+
+
+def _path(blob_id: str) -> str:
+    if not _BLOB_ID_RE.match(blob_id or ""):
+        raise ValueError(f"Invalid blob id: {blob_id!r}")
+    return os.path.join(BLOB_DIR, f"{blob_id}.html.zst")
+
+
+def put(html: str) -> dict:
+    """Stores a page and returns its handle. Identical pages share one blob."""
+    raw = html.encode("utf-8")
+    blob_id = hashlib.sha256(raw).hexdigest()
+    path = _path(blob_id)
+    if os.path.exists(path):
+        os.utime(path)
+        stored = os.path.getsize(path)
+    else:
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        # Write-then-rename so a reader never sees a half-written blob.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        stored = len(compressed)
+    sweep()
+    return {"blob_id": blob_id, "size": len(raw), "stored_bytes": stored}
+
+
+def get(blob_id: str) -> str:
+    """Reads a page back. Raises FileNotFoundError if it expired or never existed."""
+    with open(_path(blob_id), "rb") as f:
+        return zstandard.ZstdDecompressor().decompress(f.read()).decode("utf-8")
+
+
+def sweep(force: bool = False):
+    """Deletes blobs older than the TTL, at most once per SWEEP_INTERVAL_SECONDS."""
+    global _last_sweep
+    now = time.time()
+    if not force and now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    try:
+        entries = os.scandir(BLOB_DIR)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > BLOB_TTL_SECONDS:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,181 @@
+# /scraper_service/block_detector.py
+import json
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+# --- Configuration ---
+# Below this much visible text a page with a JS app root is treated as an empty shell.
+MIN_VISIBLE_TEXT = int(os.environ.get("MIN_VISIBLE_TEXT", "200"))
+TIER_STATE_FILE = os.environ.get("TIER_STATE_FILE", "tier_memory.json")
+TIER_MIN_SAMPLES = int(os.environ.get("TIER_MIN_SAMPLES", "3"))
+TIER_WINDOW = int(os.environ.get("TIER_WINDOW", "10"))
+# Every Nth request to a browser-tier domain still tries the fast path, so a site can earn its way back.
+TIER_REPROBE_EVERY = int(os.environ.get("TIER_REPROBE_EVERY", "20"))
+
+# Phrases that only ever appear on bot-challenge / WAF interstitials.
+STRONG_BLOCK_SIGNATURES = [
+    "human verification", "verify you are human", "are you a robot", "are you human",
+    "checking your browser", "cf-browser-verification", "cf_chl_",
+    "attention required! | cloudflare", "just a moment...",
+    "request unsuccessful. incapsula", "px-captcha", "captcha-delivery.com",
+    "geo.captcha-delivery", "pardon our interruption", "distil_r_captcha",
+    "unusual traffic from your computer",
+]
+# Bot-protection vendors' script and tag markers. They are injected into the normal pages
+# they protect as well, so they only count in the title or on a near-empty interstitial.
+VENDOR_MARKERS = ["challenge-platform", "perimeterx", "datadome", "_incapsula_resource"]
+# Phrases that legitimate pages also use (e.g. a reCAPTCHA on a contact form);
+# they only count when the page has almost no real content.
+WEAK_BLOCK_SIGNATURES = ["captcha", "access denied", "forbidden", "bot detection", "request blocked"]
+GONE_STATUSES = {404, 410}
+
+_SCRIPT_STYLE_RE = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>", re.S | re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.S | re.I)
+_EMPTY_APP_ROOT_RE = re.compile(r"<div[^>]+id=[\"'](root|app|__next|__nuxt|svelte|main-app)[\"'][^>]*>\s*</div>", re.I)
+_NOSCRIPT_RE = re.compile(r"<noscript\b[^>]*>(.*?)</noscript\s*>", re.S | re.I)
+_META_REFRESH_RE = re.compile(r"<meta[^>]+http-equiv=[\"']?refresh", re.I)
+
+
+@dataclass
+class PageVerdict:
+    kind: str      # ok | blocked | js_shell | gone
+    reason: str
+
+    @property
+    def usable(self) -> bool:
+        return self.kind == "ok"
+
+
+def visible_text(html: str) -> str:
+    text = _TAG_RE.sub(" ", _SCRIPT_STYLE_RE.sub(" ", html))
+    return _WS_RE.sub(" ", text).strip()
+
+
+def classify_page(status_code: int, html: str) -> PageVerdict:
+    """
+    Decides whether a fast-path response is a real page, a bot challenge,
+    an empty JavaScript shell, or a page that does not exist.
+    Small but genuine pages are accepted; size alone decides nothing.
+    """
+    if status_code in GONE_STATUSES:
+        return PageVerdict("gone", f"HTTP {status_code}")
+
+    head = html[:50000].lower()
+    title_match = _TITLE_RE.search(head)
+    title = title_match.group(1).strip() if title_match else ""
+    for signature in STRONG_BLOCK_SIGNATURES:
+        if signature in head:
+            return PageVerdict("blocked", f"challenge signature '{signature}'")
+    for marker in VENDOR_MARKERS:
+        if marker in title:
+            return PageVerdict("blocked", f"bot-protection marker '{marker}' in the title")
+
+    text = visible_text(html)
+    if status_code >= 400:
+        return PageVerdict("blocked", f"HTTP {status_code}")
+
+    if len(text) < 1500:
+        for marker in VENDOR_MARKERS:
+            if marker in head:
+                return PageVerdict("blocked", f"bot-protection marker '{marker}' on a near-empty page")
+        for signature in WEAK_BLOCK_SIGNATURES:
+            if signature in title or signature in text[:1500].lower():
+                return PageVerdict("blocked", f"challenge signature '{signature}' on a near-empty page")
+
+    if len(text) < MIN_VISIBLE_TEXT:
+        if _EMPTY_APP_ROOT_RE.search(html):
+            return PageVerdict("js_shell", "empty single-page-app root")
+        for noscript in _NOSCRIPT_RE.findall(html):
+            lowered = noscript.lower()
+            if _META_REFRESH_RE.search(noscript) or "enable javascript" in lowered or "javascript is required" in lowered:
+                return PageVerdict("js_shell", "noscript redirect / JavaScript required")
+        if head.count("<script") >= 3:
+            return PageVerdict("js_shell", "script-only page with no visible text")
+        if not text:
+            return PageVerdict("js_shell", "no visible text")
+
+    return PageVerdict("ok", "content")
+
+
+def domain_key(url: str) -> str:
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class TierMemory:
+    """
+    Learns, per domain, whether the fast HTTP path is enough or a browser is needed.
+
+    Each domain keeps a sliding window of fast-path outcomes (True = usable).
+    A domain whose window is mostly failures goes straight to the browser;
+    one whose window is all successes never escalates to it.
+    """
+
+    def __init__(self, path: str = TIER_STATE_FILE):
+        self.path = path
+        self._outcomes: dict[str, deque] = {}
+        self._requests: dict[str, int] = {}
+        self._dirty = 0
+        self.load()
+
+    def _window(self, domain: str) -> deque:
+        if domain not in self._outcomes:
+            self._outcomes[domain] = deque(maxlen=TIER_WINDOW)
+        return self._outcomes[domain]
+
+    def tier(self, url: str) -> str:
+        """Returns 'browser', 'fast' or 'auto' for the domain of `url`."""
+        window = self._window(domain_key(url))
+        if len(window) < TIER_MIN_SAMPLES:
+            return "auto"
+        success_rate = sum(window) / len(window)
+        if success_rate <= 0.2:
+            return "browser"
+        if success_rate == 1.0:
+            return "fast"
+        return "auto"
+
+    def should_skip_fast(self, url: str) -> bool:
+        domain = domain_key(url)
+        if self.tier(url) != "browser":
+            return False
+        self._requests[domain] = self._requests.get(domain, 0) + 1
+        return self._requests[domain] % TIER_REPROBE_EVERY != 0
+
+    def record_fast(self, url: str, usable: bool):
+        self._window(domain_key(url)).append(bool(usable))
+        self._dirty += 1
+        if self._dirty >= 25:
+            self.save()
+
+    # --- Persistence ---
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            for domain, outcomes in data.items():
+                self._outcomes[domain] = deque((bool(o) for o in outcomes), maxlen=TIER_WINDOW)
+            print(f"✅ Loaded fetch-tier memory for {len(self._outcomes)} domains.")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Could not load tier memory from {self.path}: {e}")
+
+    def save(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump({d: list(o) for d, o in self._outcomes.items()}, f)
+            self._dirty = 0
+        except Exception as e:
+            print(f"⚠️ Could not save tier memory to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        tiers = {"fast": 0, "browser": 0, "auto": 0}
+        for domain in self._outcomes:
+            tiers[self.tier("http://" + domain)] += 1
+        return {"domains": len(self._outcomes), **tiers}
@@ -0,0 +1,292 @@
+# /scraper_service/browser_pool.py
+import asyncio
+import functools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium_stealth import stealth
+
+import tracing
+from browser_supervisor import BrowserSupervisor
+
+# --- Configuration ---
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "2"))
+# A browser is recycled after this many renders to keep its memory in check.
+BROWSER_MAX_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", "50"))
+# Browsers started during warm-up, so the first renders do not pay for a Chrome launch.
+BROWSER_PREWARM = int(os.environ.get("BROWSER_PREWARM", str(BROWSER_POOL_SIZE)))
+# normal = full 'load' event, eager = DOMContentLoaded, none = return immediately.
+PAGE_LOAD_STRATEGY = os.environ.get("PAGE_LOAD_STRATEGY", "eager")
+PAGE_LOAD_TIMEOUT = int(os.environ.get("PAGE_LOAD_TIMEOUT", "30"))
+# dom | load | selector | stable (see BrowserPool._wait)
+DEFAULT_WAIT_STRATEGY = os.environ.get("WAIT_STRATEGY", "dom")
+WAIT_TIMEOUT = float(os.environ.get("WAIT_TIMEOUT", "10"))
+WAIT_STABLE_MS = int(os.environ.get("WAIT_STABLE_MS", "500"))
+BLOCK_STYLESHEETS = os.environ.get("BLOCK_STYLESHEETS", "true").lower() == "true"
+
+WAIT_STRATEGIES = ("dom", "load", "selector", "stable")
+
+# Resources we never need to get at the HTML: images, media, fonts and trackers.
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.bmp",
+    "*.mp4", "*.webm", "*.ogg", "*.mp3", "*.wav", "*.m3u8",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*connect.facebook.com*",
+    "*hotjar.com*", "*segment.io*", "*segment.com*", "*mixpanel.com*",
+    "*clarity.ms*", "*adservice.google.*", "*criteo.*", "*taboola.com*",
+]
+if BLOCK_STYLESHEETS:
+    BLOCKED_URL_PATTERNS.append("*.css")
+
+
+def resolve_driver_path() -> str | None:
+    """
+    Resolves the chromedriver binary ONCE. An explicit CHROMEDRIVER_PATH wins,
+    then webdriver_manager. Returning None lets Selenium Manager find it.
+    """
+    explicit = os.environ.get("CHROMEDRIVER_PATH")
+    if explicit:
+        return explicit
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        return ChromeDriverManager().install()
+    except Exception as e:
+        print(f"⚠️ webdriver_manager could not resolve chromedriver ({e}), using Selenium Manager.")
+        return None
+
+
+class _Slot:
+    """One pool member: a (lazily started) Chrome instance, its supervisor lease and its page counter."""
+    def __init__(self, index: int):
+        self.index = index
+        self.driver = None
+        self.lease = None
+        self.pages = 0
+
+
+class BrowserPool:
+    """
+    A fixed-size pool of long-lived headless Chrome instances.
+
+    Renders run on a dedicated thread executor with exactly one worker per
+    browser, so the event loop never blocks on Selenium and a render never
+    waits for a browser that another thread holds. Every browser holds a lease
+    from the supervisor for its whole life, so it only starts when there is
+    memory for it, and it is killed if it grows too large or hangs.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, supervisor: BrowserSupervisor | None = None):
+        self.supervisor = supervisor or BrowserSupervisor()
+        self.size = max(1, min(size, self.supervisor.capacity))
+        if self.size < size:
+            print(f"⚠️ Browser pool reduced to {self.size} slot(s): memory only fits {self.supervisor.capacity} browser(s).")
+        self.driver_path = None
+        self._slots = queue.Queue()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._render_ms = deque(maxlen=500)
+        self._wait_ms = deque(maxlen=500)
+        self._counters = {"renders": 0, "failures": 0, "browsers_started": 0, "browsers_recycled": 0}
+        self._submitted = 0
+        self._in_flight = 0
+
+    # --- Lifecycle ---
+    def start(self):
+        """Resolves the driver binary and prepares the executor. Browsers start lazily."""
+        self.driver_path = resolve_driver_path()
+        for i in range(self.size):
+            self._slots.put(_Slot(i))
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="browser")
+        print(f"✅ Browser pool ready: {self.size} slot(s), driver={self.driver_path or 'selenium-manager'}")
+
+    def prewarm(self, count: int = BROWSER_PREWARM) -> int:
+        """Launches up to `count` browsers ahead of the first render; returns how many are running."""
+        slots = [self._slots.get() for _ in range(min(count, self.size))]
+        try:
+            for slot in slots:
+                if slot.driver is None:
+                    self._launch(slot)
+                    # The first navigation initializes the renderer and its caches.
+                    slot.driver.get("about:blank")
+        finally:
+            for slot in slots:
+                self._slots.put(slot)
+        return sum(1 for slot in slots if slot.driver is not None)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        while not self._slots.empty():
+            self._quit(self._slots.get_nowait())
+
+    # --- Browser management ---
+    def _options(self) -> Options:
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--mute-audio")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.media_stream": 2,
+        })
+        options.page_load_strategy = PAGE_LOAD_STRATEGY
+        return options
+
+    def _launch(self, slot: _Slot):
+        # Blocks until memory allows another browser (BrowserCapacityError after the acquire timeout).
+        lease = self.supervisor.acquire()
+        service = Service(self.driver_path) if self.driver_path else Service()
+        try:
+            driver = webdriver.Chrome(service=service, options=self._options())
+        except Exception:
+            self.supervisor.release(lease)
+            raise
+        lease.attach(driver)
+        slot.lease = lease
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        stealth(driver, languages=["en-US", "en"], vendor="Google Inc.", platform="Win32", webgl_vendor="Intel Inc.", renderer="Intel Iris OpenGL Engine", fix_hairline=True)
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            print(f"⚠️ Could not install request blocking on browser {slot.index}: {e}")
+        slot.driver = driver
+        slot.pages = 0
+        with self._lock:
+            self._counters["browsers_started"] += 1
+
+    def _quit(self, slot: _Slot):
+        if slot.driver:
+            try:
+                slot.driver.quit()
+            except Exception:
+                pass
+        if slot.lease:
+            self.supervisor.release(slot.lease)
+        slot.driver = None
+        slot.lease = None
+        slot.pages = 0
+
+    def _recycle(self, slot: _Slot):
+        self._quit(slot)
+        with self._lock:
+            self._counters["browsers_recycled"] += 1
+
+    # --- Rendering ---
+    def _wait(self, driver, strategy: str, selector: str | None):
+        """Waits according to the strategy once driver.get() has returned."""
+        if strategy == "load":
+            WebDriverWait(driver, WAIT_TIMEOUT).until(
+                lambda d: d.execute_script("return document.readyState") == "complete")
+        elif strategy == "selector" and selector:
+            WebDriverWait(driver, WAIT_TIMEOUT).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
+        elif strategy == "stable":
+            # Wait until the DOM stops growing, which is what SPAs need.
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            last_size, stable_since = -1, time.monotonic()
+            while time.monotonic() < deadline:
+                size = driver.execute_script("return document.documentElement.outerHTML.length")
+                if size != last_size:
+                    last_size, stable_since = size, time.monotonic()
+                elif (time.monotonic() - stable_since) * 1000 >= WAIT_STABLE_MS:
+                    return
+                time.sleep(0.1)
+        # "dom": the page load strategy already waited for DOMContentLoaded.
+
+    def _render_sync(self, url: str, strategy: str, selector: str | None, submitted_at: float) -> str:
+        slot = self._slots.get()
+        started = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+        self._wait_ms.append((started - submitted_at) * 1000)
+        try:
+            current = tracing.current_span()
+            if current is not None:
+                current.set(queue_wait_ms=round((started - submitted_at) * 1000, 1), browser=slot.index)
+            if slot.driver is None:
+                with tracing.span("driver_start", browser=slot.index):
+                    self._launch(slot)
+            driver = slot.driver
+            with slot.lease.busy():
+                with tracing.span("page_load") as load_span:
+                    try:
+                        driver.get(url)
+                    except Exception as e:
+                        # A page-load timeout still leaves whatever has rendered so far.
+                        if "timeout" not in type(e).__name__.lower():
+                            raise
+                        load_span.set(timed_out=True)
+                        print(f"⚠️ Page load timed out for {url}, using partial DOM.")
+                with tracing.span("wait", strategy=strategy):
+                    self._wait(driver, strategy, selector)
+                html = driver.page_source
+            slot.pages += 1
+            driver.delete_all_cookies()
+            if slot.pages >= BROWSER_MAX_PAGES:
+                self._recycle(slot)
+            with self._lock:
+                self._counters["renders"] += 1
+            return html
+        except Exception:
+            with self._lock:
+                self._counters["failures"] += 1
+            # Never hand a browser in an unknown state to the next request.
+            self._recycle(slot)
+            raise
+        finally:
+            self._render_ms.append((time.monotonic() - started) * 1000)
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.put(slot)
+
+    async def render(self, url: str, strategy: str | None = None, selector: str | None = None) -> str:
+        """Renders a URL on a pooled browser without blocking the event loop."""
+        strategy = strategy or DEFAULT_WAIT_STRATEGY
+        if strategy not in WAIT_STRATEGIES:
+            raise ValueError(f"Unknown wait strategy '{strategy}'. Use one of {WAIT_STRATEGIES}.")
+        with self._lock:
+            self._submitted += 1
+        loop = asyncio.get_running_loop()
+        job = tracing.wrap(functools.partial(self._render_sync, url, strategy, selector, time.monotonic()))
+        return await loop.run_in_executor(self._executor, job)
+
+    # --- Metrics ---
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = self._in_flight
+            finished = counters["renders"] + counters["failures"]
+            queued = max(0, self._submitted - finished - in_flight)
+        return {
+            "pool_size": self.size,
+            "in_flight": in_flight,
+            "queued": queued,
+            **counters,
+            "render_ms": _percentiles(self._render_ms),
+            "queue_wait_ms": _percentiles(self._wait_ms),
+        }
+
+
+def _percentiles(samples) -> dict:
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+    return {"count": len(values), "p50": pick(0.50), "p95": pick(0.95), "max": round(values[-1], 1)}
@@ -0,0 +1,242 @@
+# browser_supervisor.py
+# Memory-bounded supervision of headless Chrome, shared (by copy) by the services that start browsers.
+# - A global cap on live browsers, sized from the container's memory limit (cgroup) or the host's RAM,
+#   and a new browser only starts when the memory actually available can hold one.
+# - A watchdog measures every browser's process tree and kills trees that use too much memory or hang.
+# - Processes left behind by driver.quit() are killed and reaped when a browser is released.
+#   (Grandchildren re-parented to PID 1 need an init process: `init: true` in docker-compose.)
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+import tracing
+
+# --- Configuration ---
+# Expected footprint of one browser, used to size the cap; the watchdog measures the real one.
+BROWSER_MEMORY_MB = int(os.environ.get("BROWSER_MEMORY_MB", "400"))
+# A browser process tree above this RSS is killed.
+BROWSER_RSS_LIMIT_MB = int(os.environ.get("BROWSER_RSS_LIMIT_MB", "1536"))
+# A render holding a browser longer than this is considered hung and killed.
+BROWSER_RENDER_DEADLINE_SECONDS = float(os.environ.get("BROWSER_RENDER_DEADLINE_SECONDS", "120"))
+# Memory kept free for the service itself (models, Python heap).
+MEMORY_HEADROOM_MB = int(os.environ.get("MEMORY_HEADROOM_MB", "512"))
+# Hard cap on live browsers in this process; 0 derives it from the memory limit.
+MAX_BROWSERS = int(os.environ.get("MAX_BROWSERS", "0"))
+# How long a caller waits for memory to start a browser before giving up.
+BROWSER_ACQUIRE_TIMEOUT_SECONDS = float(os.environ.get("BROWSER_ACQUIRE_TIMEOUT_SECONDS", "60"))
+WATCHDOG_INTERVAL_SECONDS = float(os.environ.get("BROWSER_WATCHDOG_INTERVAL_SECONDS", "5"))
+
+_MB = 2**20
+
+
+class BrowserCapacityError(RuntimeError):
+    """No memory for another browser within the acquire timeout."""
+
+
+def _read_int(path: str) -> int | None:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def memory_limit_bytes() -> int:
+    """The container's memory limit (cgroup v2, then v1), or the host's RAM."""
+    host = psutil.virtual_memory().total
+    limit = _read_int("/sys/fs/cgroup/memory.max") or _read_int("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    return min(limit, host) if limit else host
+
+
+def memory_available_bytes() -> int:
+    """Memory that can still be used: the cgroup's limit minus its usage, or the host's available RAM."""
+    host = psutil.virtual_memory().available
+    limit = _read_int("/sys/fs/cgroup/memory.max") or _read_int("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    usage = _read_int("/sys/fs/cgroup/memory.current") or _read_int("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+    if limit and usage is not None and limit < psutil.virtual_memory().total:
+        return min(host, max(0, limit - usage))
+    return host
+
+
+def _kill(processes: list) -> int:
+    """Kills the processes and reaps the ones that are our children; returns how many were alive."""
+    alive = []
+    for p in processes:
+        try:
+            if p.status() != psutil.STATUS_ZOMBIE:
+                p.kill()
+                alive.append(p)
+        except psutil.Error:
+            pass
+    psutil.wait_procs(processes, timeout=5)
+    return len(alive)
+
+
+class BrowserLease:
+    """The right to run one browser, and the process tree it turned out to have."""
+
+    def __init__(self, lease_id: int):
+        self.id = lease_id
+        self.started_at = time.monotonic()
+        self.busy_since: float | None = None
+        self.rss = 0
+        self.killed: str | None = None
+        self._root: psutil.Process | None = None
+        self._processes: dict = {}
+
+    def attach(self, driver):
+        """Records the driver's process (chromedriver), whose descendants are the browser."""
+        process = getattr(getattr(driver, "service", None), "process", None)
+        if process is not None:
+            try:
+                self._root = psutil.Process(process.pid)
+            except psutil.Error:
+                return
+            self.refresh()
+
+    def refresh(self) -> list:
+        """Re-reads the process tree; remembered processes stay known even after their parent exits."""
+        if self._root is not None:
+            try:
+                for p in [self._root, *self._root.children(recursive=True)]:
+                    self._processes.setdefault(p.pid, p)
+            except psutil.Error:
+                pass
+        return [p for p in self._processes.values() if p.is_running()]
+
+    @contextmanager
+    def busy(self):
+        """Marks a render in progress, so the watchdog can tell a hung browser from an idle one."""
+        self.busy_since = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.busy_since = None
+
+
+class BrowserSupervisor:
+    """
+    Grants leases for browsers under a global memory budget and watches them.
+
+    capacity is the most browsers the memory limit can ever hold; on top of that,
+    a new browser only starts while the memory available right now leaves room
+    for one more, so concurrency follows the memory that is actually free.
+    """
+
+    def __init__(self, max_browsers: int = MAX_BROWSERS):
+        budget = memory_limit_bytes() - MEMORY_HEADROOM_MB * _MB
+        derived = max(1, budget // (BROWSER_MEMORY_MB * _MB))
+        self.capacity = min(max_browsers, derived) if max_browsers > 0 else derived
+        self._leases: dict = {}
+        self._next_id = 0
+        self._cond = threading.Condition()
+        self._watchdog: threading.Thread | None = None
+        self._counters = {"leases": 0, "waits": 0, "acquire_timeouts": 0, "killed_rss": 0, "killed_hung": 0,
+                          "leftover_processes_killed": 0}
+        tracing.register_gauge("browsers_live", lambda: len(self._leases))
+        tracing.register_gauge("browsers_capacity", lambda: self.capacity)
+        tracing.register_gauge("browsers_allowed", self.allowed)
+        tracing.register_gauge("browser_rss_bytes", lambda: sum(l.rss for l in list(self._leases.values())))
+        tracing.register_gauge("memory_available_bytes", memory_available_bytes)
+        for reason in ("rss", "hung"):
+            tracing.register_gauge("browser_kills_total", lambda r=reason: self._counters[f"killed_{r}"], reason=reason)
+
+    def allowed(self) -> int:
+        """How many browsers may be live right now, given the memory available."""
+        spare = (memory_available_bytes() - MEMORY_HEADROOM_MB * _MB) // (BROWSER_MEMORY_MB * _MB)
+        return max(1, min(self.capacity, len(self._leases) + max(0, spare)))
+
+    # --- Leases ---
+    def acquire(self, timeout: float = BROWSER_ACQUIRE_TIMEOUT_SECONDS) -> BrowserLease:
+        self._start_watchdog()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            waited = False
+            while self._leases and len(self._leases) >= self.allowed():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["acquire_timeouts"] += 1
+                    raise BrowserCapacityError(f"No memory for another browser ({len(self._leases)} live) after {timeout:g}s.")
+                waited = True
+                # Memory frees up without a notification too, so look again every second.
+                self._cond.wait(min(1.0, remaining))
+            self._next_id += 1
+            lease = BrowserLease(self._next_id)
+            self._leases[lease.id] = lease
+            self._counters["leases"] += 1
+            self._counters["waits"] += int(waited)
+        return lease
+
+    def release(self, lease: BrowserLease):
+        """Call after driver.quit(): whatever of the browser is still running is killed and reaped."""
+        leftovers = _kill(lease.refresh())
+        with self._cond:
+            self._leases.pop(lease.id, None)
+            self._counters["leftover_processes_killed"] += leftovers
+            self._cond.notify()
+        if leftovers:
+            print(f"⚠️ Killed {leftovers} browser process(es) left behind after quit (lease {lease.id}).")
+
+    @contextmanager
+    def lease(self, timeout: float = BROWSER_ACQUIRE_TIMEOUT_SECONDS):
+        lease = self.acquire(timeout)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    # --- Watchdog ---
+    def _start_watchdog(self):
+        with self._cond:
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, name="browser-watchdog", daemon=True)
+                self._watchdog.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(WATCHDOG_INTERVAL_SECONDS)
+            for lease in list(self._leases.values()):
+                try:
+                    self._check(lease)
+                except Exception as e:
+                    print(f"⚠️ Browser watchdog error (lease {lease.id}): {e}")
+
+    def _check(self, lease: BrowserLease):
+        processes = lease.refresh()
+        rss = 0
+        for p in processes:
+            try:
+                rss += p.memory_info().rss
+            except psutil.Error:
+                pass
+        lease.rss = rss
+        reason = None
+        if rss > BROWSER_RSS_LIMIT_MB * _MB:
+            reason = "rss"
+        elif lease.busy_since is not None and time.monotonic() - lease.busy_since > BROWSER_RENDER_DEADLINE_SECONDS:
+            reason = "hung"
+        if reason and processes:
+            # The render using this browser fails; its owner then quits it and releases the lease as usual.
+            lease.killed = reason
+            with self._cond:
+                self._counters[f"killed_{reason}"] += 1
+            print(f"⚠️ Killing browser (lease {lease.id}): {reason}, {rss / _MB:.0f} MB RSS.")
+            _kill(processes)
+
+    def stats(self) -> dict:
+        leases = list(self._leases.values())
+        with self._cond:
+            counters = dict(self._counters)
+        return {
+            "live": len(leases),
+            "capacity": self.capacity,
+            "allowed_now": self.allowed(),
+            "memory_limit_bytes": memory_limit_bytes(),
+            "memory_available_bytes": memory_available_bytes(),
+            "browser_rss_bytes": [l.rss for l in leases],
+            **counters,
+        }
@@ -0,0 +1,59 @@
+# /scraper_service/http_pool.py
+import os
+
+import httpx
+
+# --- Configuration ---
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SEC", "30"))
+FAST_TIMEOUT = float(os.environ.get("FAST_SCRAPE_TIMEOUT_SEC", "15"))
+
+
+def create_client(user_agent: str) -> httpx.AsyncClient:
+    """The app-lifetime client: HTTP/2 where the server offers it, keep-alive everywhere."""
+    return httpx.AsyncClient(
+        http2=True,
+        headers={"User-Agent": user_agent},
+        follow_redirects=True,
+        timeout=FAST_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+class ConnectionStats:
+    """
+    Counts how many requests opened a new TCP connection versus reusing a
+    pooled one, using httpcore's trace hook.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.http2_responses = 0
+
+    def tracer(self):
+        """Returns a per-request trace callback to pass as extensions={'trace': ...}."""
+        self.requests += 1
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+        return trace
+
+    def record_response(self, response: httpx.Response):
+        if response.http_version == "HTTP/2":
+            self.http2_responses += 1
+
+    def stats(self) -> dict:
+        reused = max(0, self.requests - self.new_connections)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else None,
+            "http2_responses": self.http2_responses,
+        }
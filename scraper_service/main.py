@@ -1,22 +1,93 @@
 # /scraper_service/main.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, HttpUrl
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from selenium_stealth import stealth
 import httpx # <-- Import httpx
 
+import blob_store
+from block_detector import TierMemory, classify_page, domain_key
+from browser_pool import BrowserPool
+from browser_supervisor import BrowserSupervisor
+from http_pool import ConnectionStats, create_client
+from politeness import HostLimiter
+import readiness
+import tracing
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Caps live browsers by memory and kills the ones that grow too large or hang.
+browser_supervisor = BrowserSupervisor()
+# One long-lived pool of Chrome instances for the whole service.
+browser_pool = BrowserPool(supervisor=browser_supervisor)
+# Per-host pacing shared by the fast path and the browser fallback.
+host_limiter = HostLimiter(USER_AGENT)
+connection_stats = ConnectionStats()
+# Learns per domain whether the fast path is enough or a browser is required.
+tier_memory = TierMemory()
+# The shared HTTP client, created when the app starts.
+http_client: httpx.AsyncClient | None = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    http_client = create_client(USER_AGENT)
+    # Resolving the driver binary can download it, so keep it off the event loop.
+    await asyncio.to_thread(browser_pool.start)
+    readiness.start()
+    yield
+    tier_memory.save()
+    await http_client.aclose()
+    await asyncio.to_thread(browser_pool.shutdown)
+
 # Initialize the FastAPI app
 app = FastAPI(
     title="Optimized Scraping Service",
-    description="A microservice to fetch HTML. It tries a fast HTTP request first, then falls back to Selenium."
+    description="A microservice to fetch HTML. It tries a fast HTTP request first, then falls back to Selenium.",
+    lifespan=lifespan
 )
+tracing.instrument_fastapi(app, "scraper_service")
+readiness.instrument_fastapi(app)
+for _name, _key in [("browser_pool_in_flight", "in_flight"), ("browser_pool_queued", "queued"), ("browser_pool_size", "pool_size")]:
+    tracing.register_gauge(_name, lambda key=_key: browser_pool.stats()[key])
+tracing.register_gauge("http_connections_reused_total", lambda: connection_stats.stats()["reused_connections"])
+tracing.register_gauge("http_connections_new_total", lambda: connection_stats.stats()["new_connections"])
+
+# Optional: without Chrome the service still serves everything the fast path can fetch.
+@readiness.step("browsers", required=False)
+def warm_browsers():
+    started = browser_pool.prewarm()
+    print(f"✅ {started} browser(s) started ahead of the first render.")
 
 # Pydantic model for incoming request body
 class URLPayload(BaseModel):
     url: HttpUrl
+    # Optional override of the browser wait strategy: dom | load | selector | stable
+    wait_strategy: str | None = None
+    # CSS selector to wait for when wait_strategy is "selector"
+    wait_selector: str | None = None
+    # "inline" returns the HTML in the response; "blob" stores it in the shared
+    # blob store and returns only a handle that product_ai_service can read.
+    transport: str = "inline"
+    # Validators from an earlier fetch; if the page has not changed the response is
+    # {"not_modified": true} without any HTML (used by the gateway's re-crawl scheduler).
+    etag: str | None = None
+    last_modified: str | None = None
+
+def response_validators(response: httpx.Response) -> dict:
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+async def build_response(html_content: str, method: str, transport: str, validators: dict | None = None) -> dict:
+    if transport == "blob":
+        try:
+            with tracing.span("blob_store.put"):
+                handle = await asyncio.to_thread(tracing.wrap(blob_store.put), html_content)
+        except OSError as e:
+            # The page was fetched fine; only storing it failed (e.g. the blob volume is full).
+            raise HTTPException(status_code=507, detail=f"Could not store the page in the blob store: {e}")
+        return {**handle, "method": method, **(validators or {})}
+    return {"html": html_content, "method": method, **(validators or {})}
 
 @app.post("/scrape/")
 async def scrape_url(payload: URLPayload):
@@ -25,45 +96,82 @@ async def scrape_url(payload: URLPayload):
     to be blocked, it uses the slower but more powerful Selenium/Chrome browser.
     """
     url = str(payload.url)
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    if payload.transport not in ("inline", "blob"):
+        raise HTTPException(status_code=400, detail="transport must be 'inline' or 'blob'.")
 
-    # --- STRATEGY 1: FAST HTTPX REQUEST ---
-    try:
-        print(f"Attempting fast scrape for: {url}")
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, follow_redirects=True, timeout=15)
-            response.raise_for_status() # Will raise an exception for 4xx/5xx responses
+    # --- STRATEGY 1: FAST HTTPX REQUEST (shared keep-alive client) ---
+    tier = tier_memory.tier(url)
+    # (html, validators) once the fast path succeeds; the response is built outside the fetch's error handling.
+    fast_page = None
+    if tier_memory.should_skip_fast(url):
+        print(f"⏩ {domain_key(url)} is known to need a browser, skipping the fast path.")
+    else:
+        try:
+            print(f"Attempting fast scrape for: {url}")
+            conditional = {}
+            if payload.etag:
+                conditional["If-None-Match"] = payload.etag
+            if payload.last_modified:
+                conditional["If-Modified-Since"] = payload.last_modified
+            with tracing.span("fast_fetch", url=url, conditional=bool(conditional)) as fetch_span:
+                queued_at = time.monotonic()
+                async with host_limiter.slot(url, http_client):
+                    fetch_span.set(politeness_wait_ms=round((time.monotonic() - queued_at) * 1000, 1))
+                    response = await http_client.get(url, headers=conditional, extensions={"trace": connection_stats.tracer()})
+                fetch_span.set(status=response.status_code, http_version=response.http_version, bytes=len(response.content))
+            connection_stats.record_response(response)
+            host_limiter.report(url, response.status_code, response.headers.get("Retry-After"))
+            if response.status_code == 304 and conditional:
+                print(f"✅ Not modified since the last fetch: {url}")
+                return {"not_modified": True, "method": "fast", **response_validators(response)}
             html_content = response.text
-            # Simple check: if HTML is very short, it might be a block page.
-            if len(html_content) > 500: # You can adjust this threshold
+            with tracing.span("classify_page") as classify_span:
+                verdict = classify_page(response.status_code, html_content)
+                classify_span.set(verdict=verdict.kind, reason=verdict.reason)
+            if verdict.kind == "gone":
+                # A missing page is missing for a browser too.
+                raise HTTPException(status_code=404, detail=f"Page not found ({verdict.reason}): {url}")
+            tier_memory.record_fast(url, verdict.usable)
+            if verdict.usable or (tier == "fast" and verdict.kind == "js_shell"):
                 print(f"✅ Fast scrape successful for {url}")
-                return {"html": html_content, "method": "fast"}
+                fast_page = (html_content, response_validators(response))
             else:
-                print("⚠️ Fast scrape returned minimal content, falling back to Selenium.")
-    except Exception as e:
-        print(f"⚠️ Fast scrape failed ({e}), falling back to Selenium.")
+                # Overload (429/5xx) is transient: even a fast-only domain gets one browser attempt for it.
+                transient = response.status_code == 429 or response.status_code >= 500
+                if tier == "fast" and not transient:
+                    raise HTTPException(status_code=502, detail=f"Fast scrape was {verdict.kind} ({verdict.reason}) for a fast-only domain: {url}")
+                print(f"⚠️ Fast scrape looks {verdict.kind} ({verdict.reason}), falling back to Selenium.")
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Timeouts and connection errors are transient too, so they fall back whatever the tier.
+            tier_memory.record_fast(url, False)
+            print(f"⚠️ Fast scrape failed ({e}), falling back to Selenium.")
+        if fast_page is not None:
+            return await build_response(fast_page[0], "fast", payload.transport, fast_page[1])
 
-    # --- STRATEGY 2: SLOW SELENIUM FALLBACK ---
+    # --- STRATEGY 2: SLOW SELENIUM FALLBACK (pooled browsers) ---
     print(f"Executing Selenium fallback for: {url}")
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-
-    driver = None # Initialize driver to None
+    started = time.monotonic()
     try:
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-        stealth(driver, languages=["en-US", "en"], vendor="Google Inc.", platform="Win32", webgl_vendor="Intel Inc.", renderer="Intel Iris OpenGL Engine", fix_hairline=True)
-        driver.get(url)
-        html_content = driver.page_source
-        print(f"✅ Selenium scrape successful for {url}")
-        return {"html": html_content, "method": "selenium"}
-
+        with tracing.span("browser_render", url=url):
+            async with host_limiter.slot(url):
+                html_content = await browser_pool.render(url, payload.wait_strategy, payload.wait_selector)
+        print(f"✅ Selenium scrape successful for {url} in {time.monotonic() - started:.2f}s")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ Both fast and Selenium scrapes failed. Error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to scrape the URL with all methods. Error: {str(e)}")
-    finally:
-        if driver:
-            driver.quit()
\ No newline at end of file
+    return await build_response(html_content, "selenium", payload.transport)
+
+@app.get("/stats")
+async def stats():
+    """Browser pool capacity, browser memory, connection reuse and per-host politeness state."""
+    return {
+        "browser_pool": browser_pool.stats(),
+        "browsers": browser_supervisor.stats(),
+        "http": connection_stats.stats(),
+        "hosts": host_limiter.stats(),
+        "tiers": tier_memory.stats(),
+    }
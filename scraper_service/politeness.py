@@ -0,0 +1,133 @@
+# /scraper_service/politeness.py
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+# --- Configuration ---
+# Steady-state requests per second and burst size allowed against ONE host.
+HOST_RATE = float(os.environ.get("HOST_RATE_PER_SEC", "1.0"))
+HOST_BURST = int(os.environ.get("HOST_BURST", "3"))
+HOST_MAX_CONCURRENCY = int(os.environ.get("HOST_MAX_CONCURRENCY", "2"))
+BACKOFF_BASE = float(os.environ.get("HOST_BACKOFF_BASE_SEC", "2"))
+BACKOFF_MAX = float(os.environ.get("HOST_BACKOFF_MAX_SEC", "120"))
+RESPECT_ROBOTS = os.environ.get("RESPECT_ROBOTS", "true").lower() == "true"
+ROBOTS_TIMEOUT = float(os.environ.get("ROBOTS_TIMEOUT_SEC", "5"))
+# Statuses that mean "slow down" rather than "this page is broken".
+THROTTLE_STATUSES = {429, 503}
+
+
+class _HostState:
+    """Token bucket, concurrency gate and backoff for a single host."""
+    def __init__(self, rate: float):
+        self.target_rate = rate
+        self.rate = rate
+        self.tokens = float(HOST_BURST)
+        self.updated = time.monotonic()
+        self.gate = asyncio.Semaphore(HOST_MAX_CONCURRENCY)
+        self.backoff = 0.0
+        self.penalty_until = 0.0
+        self.robots_checked = False
+        self.robots_lock = asyncio.Lock()
+        self.crawl_delay = None
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(float(HOST_BURST), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_needed(self) -> float:
+        """Seconds to wait before the next request may go out (0 = go now)."""
+        now = time.monotonic()
+        if now < self.penalty_until:
+            return self.penalty_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class HostLimiter:
+    """
+    Per-host politeness: a token bucket paced by the configured rate (or the
+    site's robots.txt Crawl-delay, whichever is slower), a cap on concurrent
+    requests, and exponential backoff whenever the host answers 429/503.
+    """
+
+    def __init__(self, user_agent: str):
+        self.user_agent = user_agent
+        self._hosts: dict[str, _HostState] = {}
+
+    def _state(self, host: str) -> _HostState:
+        if host not in self._hosts:
+            self._hosts[host] = _HostState(HOST_RATE)
+        return self._hosts[host]
+
+    async def _load_robots(self, client: httpx.AsyncClient, parsed, state: _HostState):
+        async with state.robots_lock:
+            if state.robots_checked:
+                return
+            state.robots_checked = True
+            try:
+                res = await client.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt", timeout=ROBOTS_TIMEOUT)
+                if res.status_code != 200:
+                    return
+                robots = RobotFileParser()
+                robots.parse(res.text.splitlines())
+                delay = robots.crawl_delay(self.user_agent) or robots.crawl_delay("*")
+                if delay:
+                    state.crawl_delay = float(delay)
+                    state.target_rate = min(state.target_rate, 1.0 / float(delay))
+                    state.rate = min(state.rate, state.target_rate)
+                    print(f"🤖 robots.txt for {parsed.netloc} asks for a {delay}s crawl delay.")
+            except Exception as e:
+                print(f"⚠️ Could not read robots.txt for {parsed.netloc}: {e}")
+
+    @asynccontextmanager
+    async def slot(self, url: str, client: httpx.AsyncClient | None = None):
+        """Waits until the host of `url` may be contacted, then holds a concurrency slot."""
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        state = self._state(host)
+        if RESPECT_ROBOTS and client is not None and not state.robots_checked:
+            await self._load_robots(client, parsed, state)
+        async with state.gate:
+            while True:
+                delay = state.delay_needed()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            yield
+
+    def report(self, url: str, status_code: int, retry_after: str | None = None):
+        """Feeds a response status back so the host's pace adapts."""
+        state = self._state(urlparse(url).netloc.lower())
+        if status_code in THROTTLE_STATUSES:
+            state.throttled += 1
+            state.backoff = min(BACKOFF_MAX, max(BACKOFF_BASE, state.backoff * 2))
+            wait = state.backoff
+            if retry_after and retry_after.isdigit():
+                wait = min(BACKOFF_MAX, max(wait, float(retry_after)))
+            state.penalty_until = time.monotonic() + wait
+            state.rate = max(state.target_rate / 8, state.rate / 2)
+            print(f"🐢 {urlparse(url).netloc} answered {status_code}, backing off for {wait:.0f}s.")
+        elif status_code < 400:
+            # Recover gradually so one good answer does not undo a throttle.
+            state.backoff = state.backoff / 2 if state.backoff > BACKOFF_BASE else 0.0
+            state.rate = min(state.target_rate, state.rate * 1.25)
+
+    def stats(self) -> dict:
+        return {
+            host: {
+                "rate_per_sec": round(s.rate, 3),
+                "crawl_delay": s.crawl_delay,
+                "backoff_sec": round(s.backoff, 1),
+                "throttled": s.throttled,
+            }
+            for host, s in self._hosts.items()
+        }
@@ -1,30 +1,48 @@
 # app.py - (Final, Corrected, Integrated, and OPTIMIZED Version)
 import os
+import threading
 import time
-import pandas as pd
 from flask import Flask, request, jsonify
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options as ChromeOptions
 from bs4 import BeautifulSoup
-from googleapiclient.discovery import build
 from urllib.parse import urlparse
 import joblib
+import hashlib
 # --- THE OPTIMIZATION: Import the tools for parallel processing ---
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import readiness
+import resilience
+import tracing
+from browser_supervisor import BrowserCapacityError, BrowserSupervisor
+from triage import SUPPLIER_CLASSES, TRIAGE_MODEL_FILE, TriageModel
+from url_canonicalizer import RESOLVE_REDIRECTS, RedirectResolver, dedupe_candidates
+import labelling_queue
 
 app = Flask(__name__)
+tracing.instrument_flask(app, "search-engine-service")
+readiness.instrument_flask(app)
 
 # --- Configuration ---
 API_KEY = os.environ.get("GOOGLE_API_KEY")
 SEARCH_ENGINE_ID = os.environ.get("GOOGLE_SEARCH_ENGINE_ID")
+# Both can point at local stand-ins (see benchmarks/stubs.py) for offline runs.
+GOOGLE_API_BASE_URL = os.environ.get("GOOGLE_API_BASE_URL", "https://www.googleapis.com")
+NLP_SERVICE_URL = os.environ.get("NLP_SERVICE_URL", "http://nlp-service:8000")
 CONFIDENCE_THRESHOLD = float(os.environ.get("CONFIDENCE_THRESHOLD", "0.60"))
 PAGES_TO_SEARCH = int(os.environ.get("PAGES_TO_SEARCH", "1"))
+# /api/versions asks the NLP service for its prompt version at most this often.
+VERSIONS_TTL_SECONDS = float(os.environ.get("VERSIONS_TTL_SECONDS", "60"))
 # --- THE OPTIMIZATION: Define how many parallel scrapers to run ---
 # This number can be tuned. 8 is a good starting point for a powerful machine.
+# Workers beyond what memory allows wait for a browser lease (see browser_supervisor.py).
 MAX_SCRAPING_WORKERS = 8
 
+# --- Downstream dependencies (adaptive timeouts + circuit breakers, see resilience.py) ---
+# Query expansion is optional: when the NLP service is down or slow, the raw query is searched.
+NLP_SERVICE = resilience.dependency("nlp_service", initial_timeout=30, floor=3, ceiling=60)
+# Never hedged: every call spends Custom Search quota.
+GOOGLE_SEARCH = resilience.dependency("google_search", initial_timeout=10, floor=2, ceiling=30)
+
 CLASS_MAPPING = {0: 'B2B', 1: 'Producer', 2: 'Retailer', 3: 'Info/Blog'}
 DOMAIN_BLACKLIST = [
     'reddit.com', 'facebook.com', 'instagram.com', 'twitter.com', 'youtube.com',
@@ -32,17 +50,73 @@ DOMAIN_BLACKLIST = [
 ]
 
 # --- Model Loading ---
-try:
-    model = joblib.load('hybrid_supplier_model.joblib')
-    model_columns = joblib.load('model_columns.joblib')
-    print("✅ ML Models loaded successfully.")
-except FileNotFoundError as e:
-    print(f"❗️ CRITICAL ERROR: Could not load model file. Make sure .joblib files are in the /app directory. Error: {e}")
-    raise e
+# Models load on first use, or during warm-up: unpickling them imports scikit-learn and
+# xgboost, which would otherwise hold up the service's start-up by seconds.
+_models = None
+_triage = None
+_models_lock = threading.Lock()
+
+def get_models() -> tuple:
+    """Returns (model, model_columns), loading them ONCE."""
+    global _models
+    with _models_lock:
+        if _models is None:
+            try:
+                _models = (joblib.load('hybrid_supplier_model.joblib'), joblib.load('model_columns.joblib'))
+                print("✅ ML Models loaded successfully.")
+            except FileNotFoundError as e:
+                print(f"❗️ CRITICAL ERROR: Could not load model file. Make sure .joblib files are in the /app directory. Error: {e}")
+                raise e
+        return _models
+
+def get_triage_model() -> TriageModel | None:
+    """Cheap first stage of the cascade; None disables it (every candidate is fetched)."""
+    global _triage
+    with _models_lock:
+        if _triage is None:
+            _triage = (TriageModel.load(),)
+        return _triage[0]
+
+def file_version(path: str) -> str | None:
+    """Short content hash of a model file, so callers can tell when results came from a different model."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    except FileNotFoundError:
+        return None
+
+# Caps live browsers across all requests by memory, and kills the ones that grow too large or hang.
+browser_supervisor = BrowserSupervisor()
+
+# Shared across requests, so redirects are only looked up once a day per URL.
+redirect_resolver = RedirectResolver() if RESOLVE_REDIRECTS else None
+
+MODEL_VERSIONS = {
+    "supplier_model": file_version('hybrid_supplier_model.joblib'),
+    "triage_model": file_version(TRIAGE_MODEL_FILE),
+}
+
+_nlp_prompt = {"version": None, "checked_at": None}
+
+def nlp_prompt_version() -> str | None:
+    """The NLP service's current prompt version (the last one seen if it cannot be reached)."""
+    checked_at = _nlp_prompt["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at >= VERSIONS_TTL_SECONDS:
+        _nlp_prompt["checked_at"] = time.monotonic()
+        try:
+            response = requests.get(f"{NLP_SERVICE_URL}/versions", headers=tracing.inject_headers(), timeout=3)
+            response.raise_for_status()
+            _nlp_prompt["version"] = response.json().get("prompt_version")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❗️ Could not read the NLP prompt version: {e}")
+    return _nlp_prompt["version"]
 
 # --- Helper Functions ---
 def setup_driver():
     """Sets up a single instance of a headless Chrome browser."""
+    # Selenium is only imported once a browser is needed (warm-up or the first fetch).
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options as ChromeOptions
     options = ChromeOptions()
     options.add_argument('--headless')
     options.add_argument('--no-sandbox')         # CRUCIAL for running in Docker
@@ -57,47 +131,102 @@ def setup_driver():
         print(f"❗️ CRITICAL ERROR: Could not start Selenium WebDriver: {e}")
         return None
 
-def get_processed_query_from_nlp(raw_query: str) -> list:
-    """Calls the nlp-service to get a list of expanded B2B search queries."""
-    nlp_service_url = "http://nlp-service:8000/process-query"
-    print(f"✨ Contacting NLP service at {nlp_service_url} for query: '{raw_query}'")
+# (lease, driver) started during warm-up and handed to the first URL that needs a browser.
+_prewarmed_browser = None
+_prewarmed_lock = threading.Lock()
+
+def take_prewarmed_browser() -> tuple | None:
+    """The warm-up's still-running browser and its lease, once; None if there is none or it has died."""
+    global _prewarmed_browser
+    with _prewarmed_lock:
+        prewarmed, _prewarmed_browser = _prewarmed_browser, None
+    if prewarmed is None:
+        return None
+    lease, driver = prewarmed
     try:
-        response = requests.post(nlp_service_url, json={"query": raw_query}, timeout=60)
-        response.raise_for_status()
-        nlp_data = response.json()
-        
-        english_queries = nlp_data.get("search_data", {}).get("english", {}).get("b2b_search_queries", [])
-        french_queries = nlp_data.get("search_data", {}).get("french", {}).get("b2b_search_queries", [])
-        
-        all_search_queries = english_queries + french_queries
-        if not all_search_queries:
-            all_search_queries = [raw_query]
-        
-        print(f"  -> NLP service returned {len(all_search_queries)} queries to search.")
-        return all_search_queries
+        driver.current_url  # The watchdog may have killed it while it sat idle.
+        return prewarmed
+    except Exception:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        browser_supervisor.release(lease)
+        return None
+
+def remaining(deadline: float | None) -> float | None:
+    """Seconds left until a request's deadline (time.monotonic()), or None without one."""
+    return None if deadline is None else deadline - time.monotonic()
 
-    except requests.exceptions.RequestException as e:
-        print(f"❗️ CRITICAL: Could not connect to NLP service: {e}")
+def get_processed_query_from_nlp(raw_query: str, deadline: float | None = None) -> tuple:
+    """
+    Calls the nlp-service to get a list of expanded B2B search queries.
+    Returns (queries, prompt version); the version is None when the raw query is used instead.
+    """
+    nlp_service_url = f"{NLP_SERVICE_URL}/process-query"
+    if deadline is not None and remaining(deadline) <= 0:
+        print("  -> Deadline reached before query expansion; using the original query.")
+        return [raw_query], None
+    print(f"✨ Contacting NLP service at {nlp_service_url} for query: '{raw_query}'")
+
+    def expand(timeout):
+        if deadline is not None:
+            timeout = max(0.01, min(timeout, remaining(deadline)))
+        with tracing.span("nlp_expand", timeout=round(timeout, 2)):
+            response = requests.post(nlp_service_url, json={"query": raw_query}, headers=tracing.inject_headers(), timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+    try:
+        nlp_data = NLP_SERVICE.call(expand)
+    except (requests.exceptions.RequestException, resilience.CircuitOpenError) as e:
+        print(f"❗️ CRITICAL: Could not get expanded queries from the NLP service: {e}")
         print("  -> Fallback: Using the original, unprocessed query.")
-        return [raw_query]
+        return [raw_query], None
+
+    # search_data is null when the LLM call failed.
+    search_data = nlp_data.get("search_data") or {}
+    english_queries = search_data.get("english", {}).get("b2b_search_queries", [])
+    french_queries = search_data.get("french", {}).get("b2b_search_queries", [])
+
+    all_search_queries = english_queries + french_queries
+    if not all_search_queries:
+        return [raw_query], None
 
-def search_google(query, start_index=1):
-    """Searches Google for a single query and returns a list of URLs."""
+    print(f"  -> NLP service returned {len(all_search_queries)} queries to search.")
+    return all_search_queries, nlp_data.get("prompt_version")
+
+def search_google(query, start_index=1, deadline: float | None = None):
+    """Searches Google for a single query and returns its hits as {'link', 'title', 'snippet'} dicts."""
+    if deadline is not None and remaining(deadline) <= 0:
+        return []
     print(f"🔎 Searching Google for: '{query}'")
+
+    def fetch(timeout):
+        if deadline is not None:
+            timeout = max(0.01, min(timeout, remaining(deadline)))
+        # Plain REST call to the Custom Search JSON API (same endpoint the discovery client wraps).
+        with tracing.span("google_search", start=start_index):
+            response = requests.get(
+                f"{GOOGLE_API_BASE_URL}/customsearch/v1",
+                params={"key": API_KEY, "cx": SEARCH_ENGINE_ID, "q": query, "num": 10, "start": start_index},
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            return response.json()
+
     try:
-        service = build("customsearch", "v1", developerKey=API_KEY)
-        res = service.cse().list(q=query, cx=SEARCH_ENGINE_ID, num=10, start=start_index).execute()
-        return [item['link'] for item in res.get('items', [])]
+        res = GOOGLE_SEARCH.call(fetch)
+        return [{'link': item['link'], 'title': item.get('title', ''), 'snippet': item.get('snippet', '')}
+                for item in res.get('items', [])]
     except Exception as e:
         print(f"   -> ❗️ Google Search API Error: {e}")
         return []
 
-def extract_features_for_prediction(driver, url):
-    """Scrapes a single URL and extracts features for the ML model."""
-    print(f"  -> Scraping {url}")
-    try:
-        driver.get(url)
-        html = driver.page_source
+def page_features(html: str, url: str):
+    """The model's input row for one page."""
+    import pandas as pd
+    with tracing.span("parse", html_bytes=len(html)):
         soup = BeautifulSoup(html, 'html.parser')
         title = soup.title.string or ""
         h1 = soup.h1.string if soup.h1 else ""
@@ -106,93 +235,324 @@ def extract_features_for_prediction(driver, url):
         key_text = f"{title} {h1} {meta_desc_text}"
         body_text = soup.body.get_text().lower() if soup.body else ""
         features = {'key_text': key_text,'has_add_to_cart': 1 if 'add to cart' in body_text else 0,'has_login': 1 if 'login' in body_text or 'my account' in body_text else 0,'has_b2b_keywords': 1 if any(k in body_text for k in ['b2b', 'wholesale', 'distributor', 'trade', 'sourcing']) else 0,'num_links': len(soup.find_all('a')),'num_images': len(soup.find_all('img')),'text_to_html_ratio': len(body_text) / (len(html) + 1),'has_corporate_keywords': 1 if any(k in body_text for k in ['investor relations', 'careers', 'our company', 'investors']) else 0,'has_blog_keywords': 1 if any(k in body_text for k in ['byline', 'author:', 'published on', 'comments', 'leave a reply']) else 0,'url_contains_blog_path': 1 if any(p in url.lower() for p in ['/blog/', '/news/']) else 0}
-        return pd.DataFrame([features])
+    return pd.DataFrame([features])
+
+def extract_features_for_prediction(driver, url):
+    """Scrapes a single URL and extracts features for the ML model."""
+    print(f"  -> Scraping {url}")
+    try:
+        with tracing.span("page_load"):
+            driver.get(url)
+            html = driver.page_source
+        return page_features(html, url)
     except Exception as e:
         print(f"     -> ❗️ Error processing page: {e}"); return None
 
+def predict_page(model, model_columns, features_df):
+    """Class probabilities for one page, with its features in the model's training order."""
+    for col in model_columns:
+        if col not in features_df.columns:
+            features_df[col] = 0
+    features_df = features_df[model_columns]
+    with tracing.span("predict"):
+        return model.predict_proba(features_df)[0]
+
 # --- THE OPTIMIZATION: A dedicated function for processing one URL from start to finish ---
-def process_single_url(url: str, model, model_columns) -> str | None:
+def process_single_url(url: str, model, model_columns, stop_event: threading.Event | None = None,
+                       promise: float | None = None, query: str | None = None) -> dict | None:
     """
     This function contains all logic for scraping and classifying one URL.
-    It returns the URL if it's a valid supplier, otherwise None.
+    It returns {'url', 'class', 'confidence', 'p_supplier', 'stage'} if it's a valid supplier, otherwise None.
+    Setting stop_event makes a worker that has not started its browser yet give up.
+    Uncertain or disputed verdicts (promise is the triage P(supplier)) go to the labelling queue.
     """
     if any(domain in url for domain in DOMAIN_BLACKLIST):
         print(f"  -> Skipping (Blacklist): {url}")
         return None
-
-    driver = setup_driver()
-    if not driver:
+    if stop_event is not None and stop_event.is_set():
         return None
+
+    url_span = tracing.start_span("classify_url", url=url)
+    prewarmed = take_prewarmed_browser()
+    if prewarmed is not None:
+        lease, driver = prewarmed
+        url_span.set(prewarmed_browser=True)
+    else:
+        try:
+            with tracing.span("browser_lease"):
+                lease = browser_supervisor.acquire()
+        except BrowserCapacityError as e:
+            print(f"  -> ❗️ Skipping {url}: {e}")
+            url_span.end()
+            return None
+        if stop_event is not None and stop_event.is_set():
+            # The request finished while this worker waited for memory.
+            browser_supervisor.release(lease)
+            url_span.end()
+            return None
+        with tracing.span("driver_start"):
+            driver = setup_driver()
+        if not driver:
+            browser_supervisor.release(lease)
+            url_span.end()
+            return None
+        lease.attach(driver)
         
     try:
-        features_df = extract_features_for_prediction(driver, url)
+        with lease.busy():
+            features_df = extract_features_for_prediction(driver, url)
         if features_df is None:
             return None
         
-        for col in model_columns:
-            if col not in features_df.columns:
-                features_df[col] = 0
-        features_df = features_df[model_columns]
-
-        probabilities = model.predict_proba(features_df)[0]
+        probabilities = predict_page(model, model_columns, features_df)
         confidence = probabilities.max()
         prediction = probabilities.argmax()
         class_name = CLASS_MAPPING.get(prediction, "Unknown")
         print(f"     -> 🤖 [{class_name}] with {confidence:.2f} confidence for {url}")
+        url_span.set(predicted_class=class_name, confidence=round(float(confidence), 3))
+        reasons = labelling_queue.review_reasons(probabilities, CONFIDENCE_THRESHOLD, promise)
+        if reasons:
+            try:
+                labelling_queue.record_verdict(url, probabilities, reasons, features_df.iloc[0].to_dict(), query, promise)
+            except OSError as e:
+                print(f"     -> ❗️ Could not queue verdict for labelling: {e}")
         
         if prediction in [0, 1, 2] and confidence >= CONFIDENCE_THRESHOLD:
             print(f"        -> ✅ VALIDATED: {url}")
-            return url
+            p_supplier = sum(probabilities[c] for c in SUPPLIER_CLASSES)
+            return {"url": url, "class": class_name, "confidence": round(float(confidence), 3),
+                    "p_supplier": round(float(p_supplier), 3), "stage": "full_model"}
     except Exception as e:
         print(f"     -> ❗️ Error in worker for {url}: {e}")
     finally:
-        if driver:
+        try:
             driver.quit()
+        except Exception as e:
+            # The watchdog may already have killed this browser.
+            print(f"     -> ❗️ Could not quit browser for {url}: {e}")
+        browser_supervisor.release(lease)
+        url_span.end()
     
     return None
 
+def parse_budget(data: dict) -> dict:
+    """Reads the optional budget fields of a discover request; raises ValueError if one is invalid."""
+    budget = {}
+    for key, cast in (("target_count", int), ("deadline_seconds", float), ("max_pages", int)):
+        value = data.get(key)
+        if value is None:
+            budget[key] = None
+            continue
+        try:
+            value = cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{key}' must be a number")
+        if value <= 0:
+            raise ValueError(f"'{key}' must be positive")
+        budget[key] = value
+    return budget
+
 # --- API Endpoint (Now with Parallel Processing) ---
 @app.route('/api/discover', methods=['POST'])
 def discover_suppliers():
+    """
+    Discovers supplier URLs for a query. Optional budget fields turn on the budgeted mode:
+    target_count (stop once this many suppliers are found), deadline_seconds (wall clock
+    from the start of the request, query expansion and Google search included) and
+    max_pages (at most this many pages fetched). Candidates are then fetched most
+    promising first, and whatever is still outstanding when the target or deadline is
+    hit is cancelled.
+    """
+    # The deadline covers the whole request, so the clock starts before anything else.
+    started = time.monotonic()
     data = request.get_json()
     if not data or 'query' not in data:
         return jsonify({"error": "Missing 'query' key"}), 400
+    try:
+        budget = parse_budget(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    target_count = budget["target_count"]
+    deadline = started + budget["deadline_seconds"] if budget["deadline_seconds"] else None
     
     raw_query = data['query']
+    model, model_columns = get_models()
+    triage_model = get_triage_model()
     
     # Step 1: Call the NLP service to get the expanded queries
-    all_search_queries = get_processed_query_from_nlp(raw_query)
+    all_search_queries, prompt_version = get_processed_query_from_nlp(raw_query, deadline)
     
-    # Step 2: Loop through the new list of queries and gather all candidate URLs
-    all_candidate_urls = set()
+    # Step 2: Loop through the new list of queries and gather all candidate hits
+    all_candidates = {}
     for query in all_search_queries:
         for page in range(PAGES_TO_SEARCH):
-            page_urls = search_google(query, start_index=(page * 10 + 1))
-            if not page_urls: break
-            all_candidate_urls.update(page_urls)
-            time.sleep(1)
+            page_hits = search_google(query, start_index=(page * 10 + 1), deadline=deadline)
+            if not page_hits: break
+            for hit in page_hits:
+                all_candidates.setdefault(hit['link'], hit)
+            time.sleep(1 if deadline is None else max(0.0, min(1, remaining(deadline))))
 
-    unique_urls = list(all_candidate_urls)
-    print(f"\nCollected {len(unique_urls)} unique candidates. Starting parallel processing...")
-    
-    # --- STEP 3: THE OPTIMIZATION - Process all URLs in parallel ---
-    validated_urls = set()
-    with ThreadPoolExecutor(max_workers=MAX_SCRAPING_WORKERS) as executor:
-        future_to_url = {executor.submit(process_single_url, url, model, model_columns): url for url in unique_urls}
-        
-        for future in as_completed(future_to_url):
-            result_url = future.result()
-            if result_url: # If the function returned a valid URL
-                validated_urls.add(result_url)
-    
-    print(f"\n--- Parallel processing complete ---")
+    candidates = [hit for url, hit in all_candidates.items() if not any(domain in url for domain in DOMAIN_BLACKLIST)]
+    print(f"\nCollected {len(all_candidates)} unique candidates ({len(all_candidates) - len(candidates)} blacklisted).")
+
+    # One candidate per supplier site: canonical URLs, redirects followed, grouped by registrable domain.
+    with tracing.span("canonicalize", candidates=len(candidates)) as canonical_span:
+        # The blacklist is checked again on final URLs: a redirect can land on a blacklisted site.
+        candidates, canonical_stats = dedupe_candidates(candidates, redirect_resolver, DOMAIN_BLACKLIST, deadline)
+        canonical_span.set(sites=canonical_stats["sites"])
+    print(f"Kept {canonical_stats['sites']} supplier sites ({canonical_stats['duplicates_removed']} duplicate URLs removed, "
+          f"{canonical_stats['blacklisted']} redirected to a blacklisted site).")
+
+    # Step 3: Triage every hit from its URL, title and snippet; only the uncertain ones are fetched.
+    validated = {}
+    triage_stats = {"enabled": triage_model is not None, "candidates": len(candidates), "accepted": 0, "rejected": 0, "fetched": len(candidates)}
+    # (url, promise) pairs; promise is the triage P(supplier), or None without a triage model.
+    to_fetch = [(hit['link'], None) for hit in candidates]
+    if triage_model is not None:
+        triage_stats.update(accept_threshold=triage_model.accept, reject_threshold=triage_model.reject)
+        to_fetch = []
+        with tracing.span("triage", candidates=len(candidates)):
+            for hit, probabilities in zip(candidates, triage_model.score(candidates)):
+                decision, predicted, p_supplier = triage_model.decide(probabilities)
+                if decision == "accept":
+                    print(f"  -> ⚡ Triage ACCEPT [{CLASS_MAPPING[predicted]}] p_supplier={p_supplier:.2f}: {hit['link']}")
+                    validated[hit['link']] = {"url": hit['link'], "class": CLASS_MAPPING[predicted],
+                                              "confidence": round(float(probabilities.get(predicted, 0.0)), 3),
+                                              "p_supplier": round(float(p_supplier), 3), "stage": "triage"}
+                elif decision == "reject":
+                    print(f"  -> ⚡ Triage REJECT p_supplier={p_supplier:.2f}: {hit['link']}")
+                else:
+                    to_fetch.append((hit['link'], p_supplier))
+        triage_stats.update(accepted=len(validated), rejected=len(candidates) - len(validated) - len(to_fetch), fetched=len(to_fetch))
+
+    # Budgeted mode: most promising first (search order breaks ties), capped at max_pages.
+    if target_count or deadline or budget["max_pages"]:
+        to_fetch.sort(key=lambda item: -(item[1] or 0.0))
+        if budget["max_pages"]:
+            to_fetch = to_fetch[:budget["max_pages"]]
+    print(f"Fetching {len(to_fetch)} uncertain candidates. Starting parallel processing...")
+
+    if target_count and len(validated) >= target_count:
+        to_fetch = []  # Triage alone already met the target.
+
+    # --- STEP 4: THE OPTIMIZATION - Process the remaining URLs in parallel ---
+    # The executor runs jobs in submission order, so the ranking above is the fetch order.
+    stop_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=MAX_SCRAPING_WORKERS)
+    pending = {executor.submit(tracing.wrap(process_single_url), url, model, model_columns, stop_event, promise, raw_query): url
+               for url, promise in to_fetch}
+    stopped = "exhausted"
+    try:
+        while pending:
+            if target_count and len(validated) >= target_count:
+                stopped = "target"
+                break
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                stopped = "deadline"
+                break
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                result = future.result()
+                if result: # If the function returned a validated supplier
+                    validated[result['url']] = result
+    finally:
+        # Queued fetches are cancelled; running ones finish in the background and quit their browser.
+        stop_event.set()
+        executor.shutdown(wait=not pending, cancel_futures=True)
+    if stopped == "exhausted" and target_count and len(validated) >= target_count:
+        stopped = "target"
     
+    print(f"\n--- Parallel processing complete ({stopped}, {len(pending)} fetches abandoned) ---")
+
+    # Best results first; in budgeted mode only the first target_count are returned. Both stages report
+    # P(supplier) (the mass on the three supplier classes), so triage accepts and fetched pages share one
+    # scale; 'confidence' stays the probability of the predicted class and is not compared across stages.
+    suppliers = sorted(validated.values(), key=lambda s: -s['p_supplier'])[:target_count or None]
     return jsonify({
         "original_query": raw_query,
         "expanded_queries_used": all_search_queries,
-        "count": len(validated_urls),
-        "supplier_urls": sorted(list(validated_urls))
+        # What produced this answer; nlp_prompt is None when query expansion fell back to the raw query.
+        "versions": {**MODEL_VERSIONS, "nlp_prompt": prompt_version},
+        "count": len(suppliers),
+        "supplier_urls": [s['url'] for s in suppliers],
+        "suppliers": suppliers,
+        "canonicalization": canonical_stats,
+        "triage": triage_stats,
+        "budget": {**budget, "stopped": stopped, "fetched": len(to_fetch) - len(pending), "abandoned": len(pending),
+                   "elapsed_seconds": round(time.monotonic() - started, 2)}
     })
 
+@app.route('/api/versions', methods=['GET'])
+def deployed_versions():
+    """The model and prompt versions a discovery run would report now (the gateway keys its result cache on them)."""
+    return jsonify({**MODEL_VERSIONS, "nlp_prompt": nlp_prompt_version()})
+
+@app.route('/api/feedback', methods=['POST'])
+def submit_feedback():
+    """
+    Lets a user dispute a verdict: {'url', 'label' (0-3 or class name, optional), 'note', 'query'}.
+    The URL joins the labelling queue; a label is used directly by labelling_queue.py export.
+    """
+    data = request.get_json()
+    if not data or not data.get('url'):
+        return jsonify({"error": "Missing 'url' key"}), 400
+    try:
+        label = None if data.get('label') is None else labelling_queue.parse_label(data['label'])
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'label': {e}"}), 400
+    labelling_queue.record_feedback(data['url'], label, data.get('note', ''), data.get('query'))
+    return jsonify({"status": "queued", "url": data['url'], "label": label}), 202
+
+@app.route('/api/resilience', methods=['GET'])
+def resilience_stats():
+    """Current timeout, recent latency and breaker state of the NLP service and Google search."""
+    return jsonify(resilience.stats())
+
+@app.route('/api/resources', methods=['GET'])
+def resource_stats():
+    """Live browsers, the cap memory allows, their measured RSS and how many were killed."""
+    return jsonify(browser_supervisor.stats())
+
+# --- Warm-up (see readiness.py) ---
+# A small supplier-like page, classified once so the first real one skips every one-time cost.
+WARMUP_HTML = ("<html><head><title>Wholesale olive oil supplier</title><meta name='description' content='B2B distributor'>"
+               "</head><body><h1>Bulk olive oil</h1><a href='/login'>My account</a><p>Add to cart</p></body></html>")
+
+@readiness.step("models")
+def warm_models():
+    # Imports scikit-learn/xgboost and pandas, and runs the first (TF-IDF) transform and predict.
+    model, model_columns = get_models()
+    predict_page(model, model_columns, page_features(WARMUP_HTML, "https://example.com/"))
+
+@readiness.step("triage_model")
+def warm_triage_model():
+    triage_model = get_triage_model()
+    if triage_model is not None:
+        triage_model.score([{"link": "https://example.com/wholesale", "title": "Wholesale supplier", "snippet": "B2B"}])
+
+# Optional: a failed launch is retried per URL anyway. The started browser is kept (under its lease,
+# so it counts against the memory cap) and the first URL to be fetched renders in it.
+@readiness.step("browser", required=False)
+def warm_browser():
+    global _prewarmed_browser
+    lease = browser_supervisor.acquire()
+    driver = setup_driver()
+    if driver is None:
+        browser_supervisor.release(lease)
+        raise RuntimeError("Chrome could not be started.")
+    lease.attach(driver)
+    try:
+        driver.get("about:blank")
+    except Exception:
+        driver.quit()
+        browser_supervisor.release(lease)
+        raise
+    with _prewarmed_lock:
+        _prewarmed_browser = (lease, driver)
+
+readiness.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
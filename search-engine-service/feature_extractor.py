@@ -1,5 +1,8 @@
 # feature_extractor.py (Final Robust Version)
+import glob
+import os
 import re
+import sys
 import pandas as pd
 import time
 from selenium import webdriver
@@ -7,10 +10,12 @@ from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 
-TRAINING_FILES = ['supplier_training_multiclass.txt', 'verified_data_batch_1.txt',  'verified_data_batch_2.txt',
-    'verified_data_batch_3.txt',
-    'verified_data_batch_4.txt']
+# Every verified_data_batch_N.txt is picked up in N order; later files win when a URL is relabelled.
+TRAINING_FILES = ['supplier_training_multiclass.txt'] + sorted(
+    glob.glob('verified_data_batch_*.txt'), key=lambda f: int(re.search(r'(\d+)\.txt$', f).group(1)))
 OUTPUT_CSV_FILE = 'supplier_engineered_features.csv'
+# Pass --full to re-extract every URL instead of only the ones not yet in OUTPUT_CSV_FILE.
+FULL_REBUILD = '--full' in sys.argv
 
 def setup_driver():
     options = webdriver.ChromeOptions(); options.add_argument('--headless'); options.add_argument('--log-level=3')
@@ -68,7 +73,17 @@ def extract_features(driver, url, retries=1):
 # --- Main Script ---
 all_urls = []; [all_urls.extend(parse_url_file(f)) for f in TRAINING_FILES]
 df_urls = pd.DataFrame(all_urls).drop_duplicates(subset='url', keep='last').reset_index(drop=True)
-driver = setup_driver()
+
+# Incremental run: keep already-extracted rows (with their latest label) and only scrape new URLs.
+df_existing = pd.DataFrame()
+if not FULL_REBUILD and os.path.exists(OUTPUT_CSV_FILE):
+    df_existing = pd.read_csv(OUTPUT_CSV_FILE)
+    latest_labels = df_urls.set_index('url')['label']
+    df_existing['label'] = df_existing['url'].map(latest_labels).fillna(df_existing['label']).astype(int)
+    df_urls = df_urls[~df_urls['url'].isin(df_existing['url'])].reset_index(drop=True)
+print(f"{len(df_urls)} URL(s) to extract from {len(TRAINING_FILES)} file(s), {len(df_existing)} already in {OUTPUT_CSV_FILE}.")
+
+driver = setup_driver() if len(df_urls) else None
 all_features_data = []
 
 for index, row in df_urls.iterrows():
@@ -78,7 +93,8 @@ for index, row in df_urls.iterrows():
         record.update(structural_features)
         all_features_data.append(record)
 
-driver.quit()
-df_features = pd.DataFrame(all_features_data)
+if driver:
+    driver.quit()
+df_features = pd.concat([df_existing, pd.DataFrame(all_features_data)], ignore_index=True)
 df_features.to_csv(OUTPUT_CSV_FILE, index=False)
 print(f"\nFeature extraction complete. Saved to {OUTPUT_CSV_FILE}")
\ No newline at end of file
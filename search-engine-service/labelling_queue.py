@@ -0,0 +1,236 @@
+# labelling_queue.py - Active-learning loop for the supplier classifier.
+"""
+The discovery service appends its uncertain and disputed verdicts, with the
+features it extracted, to LABEL_QUEUE_FILE; users can add disputes through
+POST /api/feedback. This tool turns that queue into training data:
+
+    python labelling_queue.py stats                 # what is waiting
+    python labelling_queue.py label                 # label pending URLs interactively
+    python labelling_queue.py export                # -> verified_data_batch_<N+1>.txt + CSV rows
+    python labelling_queue.py retrain --min-new 20  # export, then retrain incrementally
+
+Exported URLs that came with production features are appended to
+supplier_engineered_features.csv directly, so they are never scraped again;
+the rest are picked up by the next feature_extractor.py run.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+LABEL_QUEUE_FILE = os.environ.get("LABEL_QUEUE_FILE", "label_queue.jsonl")
+LABELS_FILE = os.environ.get("LABELS_FILE", "label_decisions.jsonl")
+FEATURES_CSV = "supplier_engineered_features.csv"
+# Verdicts whose two most likely classes are closer than this are queued as disputed.
+LABEL_MARGIN = float(os.environ.get("LABEL_MARGIN", "0.15"))
+
+CLASS_NAMES = {0: 'B2B Marketplace / Wholesaler', 1: 'Direct Producer / Brand Site',
+               2: 'Specialty E-commerce / Retailer', 3: 'Information / Blog / News'}
+SHORT_NAMES = {'b2b': 0, 'producer': 1, 'retailer': 2, 'info/blog': 3, 'info': 3, 'blog': 3}
+
+_write_lock = threading.Lock()
+
+
+def _append(path: str, record: dict):
+    line = json.dumps(record, ensure_ascii=False, default=float) + "\n"
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def _read(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_label(value) -> int:
+    """Accepts 0-3 or a class name ('B2B', 'Producer', 'Retailer', 'Info/Blog')."""
+    if isinstance(value, str) and value.strip().lower() in SHORT_NAMES:
+        return SHORT_NAMES[value.strip().lower()]
+    label = int(value)
+    if label not in CLASS_NAMES:
+        raise ValueError(f"label must be one of {sorted(CLASS_NAMES)}")
+    return label
+
+
+# --- Called by the service ---
+def review_reasons(probabilities, confidence_threshold: float, triage_p_supplier: float | None = None) -> list:
+    """Why a full-model verdict deserves a human look; empty if it does not."""
+    ranked = sorted(probabilities, reverse=True)
+    predicted_supplier = int(max(range(len(probabilities)), key=lambda i: probabilities[i])) in (0, 1, 2)
+    reasons = []
+    if ranked[0] < confidence_threshold:
+        reasons.append("low_confidence")
+    if len(ranked) > 1 and ranked[0] - ranked[1] < LABEL_MARGIN:
+        reasons.append("narrow_margin")
+    if triage_p_supplier is not None and (triage_p_supplier >= 0.5) != predicted_supplier:
+        reasons.append("triage_disagrees")
+    return reasons
+
+
+def record_verdict(url: str, probabilities, reasons: list, features: dict, query: str | None = None,
+                   triage_p_supplier: float | None = None):
+    _append(LABEL_QUEUE_FILE, {
+        "ts": time.time(), "source": "model", "url": url, "query": query, "reasons": reasons,
+        "probabilities": [round(float(p), 4) for p in probabilities],
+        "predicted": int(max(range(len(probabilities)), key=lambda i: probabilities[i])),
+        "triage_p_supplier": None if triage_p_supplier is None else round(float(triage_p_supplier), 4),
+        "features": features,
+    })
+
+
+def record_feedback(url: str, label: int | None, note: str = "", query: str | None = None):
+    """A user dispute. With a label it is a labelling decision; without one it only queues the URL."""
+    _append(LABEL_QUEUE_FILE, {"ts": time.time(), "source": "feedback", "url": url, "query": query,
+                               "reasons": ["user_feedback"], "note": note, "features": None})
+    if label is not None:
+        _append(LABELS_FILE, {"ts": time.time(), "url": url, "label": label, "by": "feedback"})
+
+
+# --- Queue state ---
+def load_state() -> tuple:
+    """Returns (latest queue entry per URL, latest label per URL, features per URL)."""
+    entries, features = {}, {}
+    for entry in _read(LABEL_QUEUE_FILE):
+        entries[entry["url"]] = entry
+        if entry.get("features"):
+            features[entry["url"]] = entry["features"]
+    labels = {}
+    for decision in _read(LABELS_FILE):
+        if decision.get("label") is None:
+            labels.pop(decision["url"], None)
+        else:
+            labels[decision["url"]] = decision
+    return entries, labels, features
+
+
+def exported_urls() -> dict:
+    """URL -> label for everything already in a verified_data_batch_*.txt file."""
+    exported = {}
+    for path in sorted(glob.glob("verified_data_batch_*.txt")):
+        label = None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("# Class"):
+                    label = int(re.search(r"\d+", line).group())
+                elif line.startswith("http") and label is not None:
+                    exported[line.strip()] = label
+    return exported
+
+
+# --- CLI commands ---
+def cmd_stats(args):
+    entries, labels, _ = load_state()
+    exported = exported_urls()
+    pending = [url for url in entries if url not in labels]
+    ready = [url for url, d in labels.items() if exported.get(url) != d["label"]]
+    reasons = {}
+    for url in pending:
+        for reason in entries[url]["reasons"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    print(f"{len(entries)} queued URL(s): {len(pending)} unlabelled, {len(labels)} labelled, {len(ready)} ready to export.")
+    for reason, count in sorted(reasons.items(), key=lambda kv: -kv[1]):
+        print(f"  {reason:<18} {count}")
+
+
+def cmd_label(args):
+    entries, labels, _ = load_state()
+    # Most uncertain first: smallest top-class probability.
+    pending = sorted((e for url, e in entries.items() if url not in labels),
+                     key=lambda e: max(e.get("probabilities") or [0.0]))
+    if not pending:
+        print("Nothing to label.")
+        return
+    print("Label: 0=B2B 1=Producer 2=Retailer 3=Info/Blog, s=skip, q=quit")
+    for entry in pending[:args.limit]:
+        probs = entry.get("probabilities")
+        shown = " ".join(f"{p:.2f}" for p in probs) if probs else "n/a"
+        print(f"\n{entry['url']}\n  query={entry.get('query')!r} reasons={entry['reasons']} p=[{shown}]")
+        answer = input("  label> ").strip().lower()
+        if answer == "q":
+            break
+        if answer in ("", "s"):
+            continue
+        try:
+            _append(LABELS_FILE, {"ts": time.time(), "url": entry["url"], "label": parse_label(answer), "by": "cli"})
+        except ValueError as e:
+            print(f"  ❗️ {e}; skipped.")
+
+
+def ready_labels(labels: dict) -> dict:
+    """url -> label for every label not yet exported with that value."""
+    exported = exported_urls()
+    return {url: d["label"] for url, d in labels.items() if exported.get(url) != d["label"]}
+
+
+def cmd_export(args) -> int:
+    """Writes the next batch file and CSV rows; returns the number of URLs exported."""
+    import pandas as pd
+
+    _, labels, features = load_state()
+    ready = ready_labels(labels)
+    if not ready:
+        print("No new labels to export.")
+        return 0
+
+    numbers = [int(re.search(r"(\d+)\.txt$", p).group(1)) for p in glob.glob("verified_data_batch_*.txt")]
+    batch_file = f"verified_data_batch_{max(numbers, default=0) + 1}.txt"
+    with open(batch_file, "w", encoding="utf-8") as f:
+        f.write("# Exported from the active-learning queue (labelling_queue.py)\n")
+        for label, name in CLASS_NAMES.items():
+            urls = sorted(url for url, l in ready.items() if l == label)
+            if urls:
+                f.write(f"\n# Class {label}: {name}\n" + "\n".join(urls) + "\n")
+
+    df = pd.read_csv(FEATURES_CSV)
+    relabelled = df["url"].isin(ready)
+    df.loc[relabelled, "label"] = df.loc[relabelled, "url"].map(ready)
+    new_rows = [{"url": url, "label": label, **features[url]} for url, label in ready.items()
+                if url in features and url not in set(df["url"])]
+    if new_rows:
+        df = pd.concat([df, pd.DataFrame(new_rows)[df.columns]], ignore_index=True)
+    df.to_csv(FEATURES_CSV, index=False)
+
+    missing = len(ready) - int(relabelled.sum()) - len(new_rows)
+    print(f"✅ Wrote {batch_file} ({len(ready)} URLs): {len(new_rows)} new CSV rows, {int(relabelled.sum())} relabelled.")
+    if missing:
+        print(f"  -> {missing} URL(s) have no stored features; run feature_extractor.py to scrape them.")
+    return len(ready)
+
+
+def cmd_retrain(args):
+    # Counted before exporting: labels exported below the threshold would never count again.
+    new = len(ready_labels(load_state()[1]))
+    if new < args.min_new:
+        print(f"Only {new} new label(s) (< --min-new {args.min_new}); not exporting or retraining.")
+        return
+    cmd_export(args)
+    subprocess.run([sys.executable, "train_hybrid_model.py"], check=True)
+    if args.triage:
+        subprocess.run([sys.executable, "train_triage_model.py"], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats").set_defaults(func=cmd_stats)
+    label = sub.add_parser("label")
+    label.add_argument("--limit", type=int, default=50)
+    label.set_defaults(func=cmd_label)
+    sub.add_parser("export").set_defaults(func=cmd_export)
+    retrain = sub.add_parser("retrain")
+    retrain.add_argument("--min-new", type=int, default=1, help="Export and retrain only once at least this many new labels are waiting.")
+    retrain.add_argument("--triage", action="store_true", help="Also retrain the triage model.")
+    retrain.set_defaults(func=cmd_retrain)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,307 @@
-# train_hybrid_model.py (Final Tuned Version)
+# train_hybrid_model.py (Search + Incremental Version)
+"""
+Trains the hybrid (TF-IDF + structural features -> XGBoost) supplier model.
+
+    python train_hybrid_model.py                 # incremental if a cache exists, else full
+    python train_hybrid_model.py --full          # refit TF-IDF and rerun the search
+    python train_hybrid_model.py --n-iter 60     # larger hyperparameter search
+
+Full run: runs a cross-validated hyperparameter search in parallel over all cores,
+refitting the preprocessor (TF-IDF vocabulary included) inside every fold, then fits
+it once on the whole training split and caches the vectorized matrices in .train_cache/.
+
+Incremental run: rows of supplier_engineered_features.csv that are not in the cache
+(new verified_data_batch_*.txt files, see feature_extractor.py) are transformed with
+the cached preprocessor and appended; relabelled rows are updated in place. The
+cached best parameters are reused and XGBoost continues from the previous booster,
+until the booster would exceed --max-rounds; then it is refit from scratch on the
+cached matrices instead.
+
+Every run writes models/hybrid_supplier_model-<version>.joblib with a metrics JSON
+(held-out report, CV score, inference latency per row). It replaces
+hybrid_supplier_model.joblib / model_columns.joblib, which app.py loads, only if its
+accuracy is no worse than the current model's on the held-out rows neither model was
+trained on (the current model's training URLs are kept in model_train_urls.json).
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
+import scipy.sparse as sp
 from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import accuracy_score, classification_report, f1_score
+from sklearn.model_selection import RandomizedSearchCV, StratifiedKFold, train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from xgboost import XGBClassifier
-from sklearn.metrics import classification_report
-import joblib
 
-df = pd.read_csv('supplier_engineered_features.csv')
-X = df.drop(['url', 'label'], axis=1); y = df['label']
-text_feature = 'key_text'; numeric_features = [col for col in X.columns if col != text_feature]
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('text', TfidfVectorizer(stop_words='english', ngram_range=(1,2)), text_feature),
-        ('numeric', StandardScaler(), numeric_features)
-    ],
-    remainder='passthrough'
-)
-
-# --- UPGRADE: Tuned XGBoost Hyperparameters ---
-# These parameters make the model more powerful and less prone to simple mistakes.
-xgb_tuned = XGBClassifier(
-    use_label_encoder=False,
-    eval_metric='mlogloss',
-    n_estimators=200,      # More trees
-    learning_rate=0.1,     # Slower learning
-    max_depth=5,           # Deeper trees
-    subsample=0.8,         # Use 80% of data per tree
-    colsample_bytree=0.8,  # Use 80% of features per tree
-    random_state=42
-)
-
-model_pipeline = Pipeline(steps=[('preprocessor', preprocessor), ('classifier', xgb_tuned)])
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, random_state=42, stratify=y)
-print("Training Final Tuned Hybrid Model...")
-model_pipeline.fit(X_train, y_train)
-
-print("\nEvaluating Final Tuned Model...")
-y_pred = model_pipeline.predict(X_test)
-print(classification_report(y_test, y_pred, target_names=['B2B', 'Producer', 'Retailer', 'Info/Blog']))
-
-joblib.dump(model_pipeline, 'hybrid_supplier_model.joblib')
-joblib.dump(list(X.columns), 'model_columns.joblib')
-print("\nFinal hybrid model trained and saved successfully!")
\ No newline at end of file
+DATA_FILE = 'supplier_engineered_features.csv'
+CACHE_FILE = os.path.join('.train_cache', 'features.joblib')
+MODEL_DIR = 'models'
+# Training URLs of the promoted model, so it is only ever compared on rows it has not seen.
+PROMOTED_TRAIN_URLS_FILE = 'model_train_urls.json'
+TEXT_FEATURE = 'key_text'
+TARGET_NAMES = ['B2B', 'Producer', 'Retailer', 'Info/Blog']
+
+# The previously hand-tuned config; always part of the search as a baseline.
+BASE_PARAMS = {'n_estimators': 200, 'learning_rate': 0.1, 'max_depth': 5, 'subsample': 0.8, 'colsample_bytree': 0.8}
+PARAM_SPACE = {
+    'n_estimators': [100, 200, 300, 500],
+    'learning_rate': [0.03, 0.05, 0.1, 0.2],
+    'max_depth': [3, 4, 5, 6, 8],
+    'subsample': [0.6, 0.8, 1.0],
+    'colsample_bytree': [0.5, 0.8, 1.0],
+    'min_child_weight': [1, 2, 4],
+    'reg_lambda': [0.5, 1.0, 2.0],
+}
+
+
+def make_classifier(**params) -> XGBClassifier:
+    # One thread per model: the search parallelizes across candidates and folds instead.
+    return XGBClassifier(eval_metric='mlogloss', random_state=42, n_jobs=1, **params)
+
+
+def make_search_pipeline(numeric_features: list) -> Pipeline:
+    """Preprocessor + classifier, so each CV fold fits its own TF-IDF vocabulary on its own training rows."""
+    return Pipeline(steps=[('preprocessor', make_preprocessor(numeric_features)), ('classifier', make_classifier())])
+
+
+def make_preprocessor(numeric_features: list) -> ColumnTransformer:
+    return ColumnTransformer(
+        transformers=[
+            ('text', TfidfVectorizer(stop_words='english', ngram_range=(1, 2)), TEXT_FEATURE),
+            ('numeric', StandardScaler(), numeric_features)
+        ],
+        remainder='passthrough'
+    )
+
+
+def file_digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def load_data(path: str) -> tuple:
+    df = pd.read_csv(path).drop_duplicates(subset='url', keep='last').reset_index(drop=True)
+    df[TEXT_FEATURE] = df[TEXT_FEATURE].fillna("")
+    columns = [col for col in df.columns if col not in ('url', 'label')]
+    return df, columns
+
+
+def full_build(df: pd.DataFrame, columns: list, args) -> dict:
+    """Splits, runs the parallel hyperparameter search and fits the preprocessor on the training split."""
+    train_df, test_df = train_test_split(df, test_size=0.25, random_state=42, stratify=df['label'])
+    numeric_features = [col for col in columns if col != TEXT_FEATURE]
+
+    print(f"Searching {args.n_iter} XGBoost configs x {args.folds} folds on all cores...")
+    space = {f'classifier__{key}': list(values) for key, values in PARAM_SPACE.items()}
+    search = RandomizedSearchCV(
+        make_search_pipeline(numeric_features), space, n_iter=args.n_iter, scoring='f1_macro', n_jobs=-1,
+        random_state=42, cv=StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42), refit=False)
+    search.fit(train_df[columns], train_df['label'].to_numpy())
+    best_params, best_score = search.best_params_, float(search.best_score_)
+
+    baseline = RandomizedSearchCV(
+        make_search_pipeline(numeric_features), {f'classifier__{key}': [value] for key, value in BASE_PARAMS.items()},
+        n_iter=1, scoring='f1_macro', n_jobs=-1, cv=StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42),
+        refit=False)
+    baseline.fit(train_df[columns], train_df['label'].to_numpy())
+    if baseline.best_score_ >= best_score:
+        best_params, best_score = baseline.best_params_, float(baseline.best_score_)
+    best_params = {key.removeprefix('classifier__'): value for key, value in best_params.items()}
+    print(f"  -> Best CV macro-F1 {best_score:.3f} with {best_params}")
+
+    preprocessor = make_preprocessor(numeric_features)
+    X_train = sp.csr_matrix(preprocessor.fit_transform(train_df[columns]))
+    X_test = sp.csr_matrix(preprocessor.transform(test_df[columns]))
+
+    classifier = make_classifier(**best_params).fit(X_train, train_df['label'].to_numpy())
+    return {
+        'columns': columns, 'preprocessor': preprocessor, 'params': best_params, 'cv_f1_macro': best_score,
+        'train_urls': train_df['url'].tolist(), 'X_train': X_train, 'y_train': train_df['label'].to_numpy(),
+        'test_urls': test_df['url'].tolist(), 'X_test': X_test, 'y_test': test_df['label'].to_numpy(),
+        'classifier': classifier, 'incremental_runs': 0,
+    }
+
+
+def incremental_update(cache: dict, df: pd.DataFrame, args) -> tuple:
+    """Appends unseen rows to the cached training matrix and warm-starts (or, past --max-rounds, refits) the booster.
+    Returns (cache, new_rows)."""
+    labels = df.set_index('url')['label']
+    cache['y_train'] = np.array([labels.get(url, y) for url, y in zip(cache['train_urls'], cache['y_train'])])
+    cache['y_test'] = np.array([labels.get(url, y) for url, y in zip(cache['test_urls'], cache['y_test'])])
+
+    known = set(cache['train_urls']) | set(cache['test_urls'])
+    new_df = df[~df['url'].isin(known)]
+    if len(new_df):
+        X_new = sp.csr_matrix(cache['preprocessor'].transform(new_df[cache['columns']]))
+        cache['X_train'] = sp.vstack([cache['X_train'], X_new], format='csr')
+        cache['y_train'] = np.concatenate([cache['y_train'], new_df['label'].to_numpy()])
+        cache['train_urls'] += new_df['url'].tolist()
+
+    # Continue boosting from the previous model with a few extra rounds over the grown set, as long as the
+    # booster stays within --max-rounds; past that, refit with the cached parameters so it stops growing.
+    previous = cache['classifier'].get_booster()
+    max_rounds = args.max_rounds or 2 * cache['params'].get('n_estimators', BASE_PARAMS['n_estimators'])
+    if previous.num_boosted_rounds() + args.incremental_rounds <= max_rounds:
+        params = {**cache['params'], 'n_estimators': args.incremental_rounds}
+        cache['classifier'] = make_classifier(**params).fit(cache['X_train'], cache['y_train'], xgb_model=previous)
+    else:
+        print(f"  -> Booster would exceed {max_rounds} rounds; refitting from scratch on the cached matrices.")
+        cache['classifier'] = make_classifier(**cache['params']).fit(cache['X_train'], cache['y_train'])
+    cache['incremental_runs'] += 1
+    return cache, len(new_df)
+
+
+def promotion_check(model: Pipeline, test_frame: pd.DataFrame, y_test: np.ndarray, columns: list) -> dict | None:
+    """
+    Accuracy of the new model and of the one app.py currently loads, on the held-out rows
+    that neither was trained on; None if the current model cannot be compared fairly.
+    """
+    try:
+        if joblib.load('model_columns.joblib') != columns:
+            print("Feature columns changed since the current model was trained; it will be replaced.")
+            return None
+        with open(PROMOTED_TRAIN_URLS_FILE, encoding='utf-8') as f:
+            seen = set(json.load(f))
+        current = joblib.load('hybrid_supplier_model.joblib')
+    except Exception as e:
+        print(f"Could not evaluate the current model ({e}); it will be replaced.")
+        return None
+    unseen = np.array([url not in seen for url in test_frame.index])
+    if not unseen.any():
+        print("Every held-out row was in the current model's training set; it will be replaced.")
+        return None
+    frame, y = test_frame[unseen], y_test[unseen]
+    return {
+        'rows': int(unseen.sum()),
+        'accuracy': round(float(accuracy_score(y, model.predict(frame))), 4),
+        'current_model_accuracy': round(float(accuracy_score(y, current.predict(frame))), 4),
+    }
+
+
+def measure_latency(model: Pipeline, X: pd.DataFrame) -> dict:
+    """Inference latency of the saved pipeline as app.py calls it: one row at a time, and batched."""
+    single = []
+    for i in range(min(len(X), 50)):
+        started = time.perf_counter()
+        model.predict_proba(X.iloc[[i]])
+        single.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    model.predict_proba(X)
+    batch_ms = (time.perf_counter() - started) * 1000
+    return {
+        'single_row_ms_p50': round(float(np.percentile(single, 50)), 3),
+        'single_row_ms_p95': round(float(np.percentile(single, 95)), 3),
+        'batched_ms_per_row': round(batch_ms / max(1, len(X)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--full', action='store_true', help='Ignore the cache: refit TF-IDF and rerun the search.')
+    parser.add_argument('--n-iter', type=int, default=40, help='Hyperparameter configs to try in a full run.')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--incremental-rounds', type=int, default=50, help='Boosting rounds added per incremental run.')
+    parser.add_argument('--max-rounds', type=int, default=0,
+                        help='Most boosting rounds an incrementally grown model may reach (default: 2x its n_estimators).')
+    parser.add_argument('--force-promote', action='store_true',
+                        help='Replace hybrid_supplier_model.joblib even if held-out accuracy regressed.')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    df, columns = load_data(args.data)
+    cache = None
+    if not args.full and os.path.exists(CACHE_FILE):
+        cache = joblib.load(CACHE_FILE)
+        if cache['columns'] != columns:
+            print("Feature columns changed since the cache was built; doing a full run.")
+            cache = None
+
+    if cache is None:
+        mode, new_rows = 'full', len(df)
+        print(f"Training Hybrid Model from scratch on {len(df)} labelled URLs...")
+        cache = full_build(df, columns, args)
+    else:
+        mode = 'incremental'
+        print(f"Updating cached Hybrid Model ({len(cache['train_urls'])} cached training URLs)...")
+        previous_classifier = cache['classifier']
+        cache, new_rows = incremental_update(cache, df, args)
+        print(f"  -> {new_rows} new URL(s) appended, booster now has "
+              f"{cache['classifier'].get_booster().num_boosted_rounds()} rounds.")
+
+    # app.py calls predict_proba on raw feature frames, so ship preprocessor + classifier as one pipeline.
+    model_pipeline = Pipeline(steps=[('preprocessor', cache['preprocessor']), ('classifier', cache['classifier'])])
+    train_seconds = time.perf_counter() - started
+
+    print("\nEvaluating on the held-out split...")
+    y_pred = cache['classifier'].predict(cache['X_test'])
+    print(classification_report(cache['y_test'], y_pred, labels=[0, 1, 2, 3], target_names=TARGET_NAMES, zero_division=0))
+    test_frame = df.set_index('url').loc[cache['test_urls'], columns]
+    test_accuracy = float(accuracy_score(cache['y_test'], y_pred))
+    comparison = promotion_check(model_pipeline, test_frame, cache['y_test'], columns)
+    promote = args.force_promote or comparison is None or comparison['accuracy'] >= comparison['current_model_accuracy']
+
+    version = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    metrics = {
+        'version': version,
+        'mode': mode,
+        'data_file': args.data,
+        'data_sha256': file_digest(args.data),
+        'train_rows': len(cache['train_urls']),
+        'test_rows': len(cache['test_urls']),
+        'new_rows': new_rows,
+        'incremental_runs_since_full': cache['incremental_runs'],
+        'params': cache['params'],
+        'cv_f1_macro': round(cache['cv_f1_macro'], 4),
+        'test_accuracy': round(test_accuracy, 4),
+        'promotion_check': comparison,
+        'promoted': promote,
+        'test_f1_macro': round(float(f1_score(cache['y_test'], y_pred, average='macro')), 4),
+        'classification_report': classification_report(cache['y_test'], y_pred, labels=[0, 1, 2, 3], target_names=TARGET_NAMES,
+                                                        zero_division=0, output_dict=True),
+        'train_seconds': round(train_seconds, 2),
+        'inference_latency': measure_latency(model_pipeline, test_frame),
+    }
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model_path = os.path.join(MODEL_DIR, f'hybrid_supplier_model-{version}.joblib')
+    joblib.dump(model_pipeline, model_path)
+    with open(os.path.join(MODEL_DIR, f'hybrid_supplier_model-{version}.metrics.json'), 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2)
+    if promote:
+        shutil.copyfile(model_path, 'hybrid_supplier_model.joblib')
+        joblib.dump(columns, 'model_columns.joblib')
+        with open(PROMOTED_TRAIN_URLS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache['train_urls'], f)
+    elif mode == 'incremental':
+        # Keep growing from the model that is actually served, not the rejected one.
+        cache['classifier'] = previous_classifier
+    # A rejected full run leaves the cache as it was: the next incremental run builds on the served model.
+    if promote or mode == 'incremental':
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        joblib.dump(cache, CACHE_FILE)
+
+    latency = metrics['inference_latency']
+    print(f"Model {version} ({mode}) trained in {train_seconds:.1f}s: test accuracy {metrics['test_accuracy']:.3f}, "
+          f"macro-F1 {metrics['test_f1_macro']:.3f}, {latency['single_row_ms_p50']} ms/row single, "
+          f"{latency['batched_ms_per_row']} ms/row batched.")
+    if promote:
+        print(f"\nSaved {model_path} and updated hybrid_supplier_model.joblib successfully!")
+    else:
+        print(f"\nSaved {model_path}, but kept hybrid_supplier_model.joblib: accuracy {comparison['accuracy']:.3f} is "
+              f"below the current model's {comparison['current_model_accuracy']:.3f} on {comparison['rows']} rows neither "
+              f"was trained on (use --force-promote to replace it anyway).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# train_triage_model.py - Trains the cheap first-stage triage model (see triage.py)
+# and reports what the cascade saves in page fetches against what it costs in accuracy.
+#
+# The labelled data has no search snippets, so key_text (page title + h1 + meta
+# description) stands in for the Google title + snippet; the snippet usually IS the
+# meta description, so this is the closest proxy we have.
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import FeatureUnion, Pipeline
+
+from train_hybrid_model import BASE_PARAMS, make_classifier, make_preprocessor
+from triage import SUPPLIER_CLASSES, url_tokens
+
+CONFIDENCE_THRESHOLD = 0.60
+ACCEPT_GRID = [0.80, 0.85, 0.90, 0.95, 0.99]
+REJECT_GRID = [0.01, 0.05, 0.10, 0.20, 0.30]
+
+parser = argparse.ArgumentParser(description="Train triage_model.joblib and write triage_report.json.")
+parser.add_argument("--data", default="supplier_engineered_features.csv")
+parser.add_argument("--out", default="triage_model.joblib")
+parser.add_argument("--report", default="triage_report.json")
+parser.add_argument("--folds", type=int, default=5)
+args = parser.parse_args()
+
+df = pd.read_csv(args.data)
+df['key_text'] = df['key_text'].fillna("")
+texts = (df['key_text'] + " " + df['url'].map(url_tokens)).tolist()
+y = df['label'].to_numpy()
+
+# Word n-grams for the title/snippet, character n-grams so unseen domains still share signal.
+triage_pipeline = Pipeline(steps=[
+    ('features', FeatureUnion([
+        ('words', TfidfVectorizer(stop_words='english', ngram_range=(1, 2), sublinear_tf=True)),
+        ('chars', TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), sublinear_tf=True, min_df=2)),
+    ])),
+    ('classifier', LogisticRegression(C=4.0, max_iter=2000, class_weight='balanced')),
+])
+
+# Built like train_hybrid_model.py, so the report compares against the real second stage.
+X_full = df.drop(['url', 'label'], axis=1)
+full_pipeline = Pipeline(steps=[
+    ('preprocessor', make_preprocessor([col for col in X_full.columns if col != 'key_text'])),
+    ('classifier', make_classifier(**BASE_PARAMS)),
+])
+
+folds = StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42)
+print(f"Cross-validating triage and full models on {len(df)} labelled URLs ({args.folds} folds)...")
+triage_proba = cross_val_predict(triage_pipeline, texts, y, cv=folds, method='predict_proba')
+full_proba = cross_val_predict(full_pipeline, X_full, y, cv=folds, method='predict_proba')
+
+# What the service actually decides: supplier (class 0-2) or not.
+is_supplier = np.isin(y, SUPPLIER_CLASSES)
+p_supplier = triage_proba[:, SUPPLIER_CLASSES].sum(axis=1)
+full_accepts = np.isin(full_proba.argmax(axis=1), SUPPLIER_CLASSES) & (full_proba.max(axis=1) >= CONFIDENCE_THRESHOLD)
+
+
+def summarize(decisions: np.ndarray, fetched: np.ndarray) -> dict:
+    tp = int((decisions & is_supplier).sum())
+    return {
+        "fetch_rate": round(float(fetched.mean()), 3),
+        "accuracy": round(float((decisions == is_supplier).mean()), 3),
+        "precision": round(tp / max(1, int(decisions.sum())), 3),
+        "recall": round(tp / max(1, int(is_supplier.sum())), 3),
+    }
+
+
+baseline = summarize(full_accepts, np.ones(len(df), dtype=bool))
+rows = []
+for accept in ACCEPT_GRID:
+    for reject in REJECT_GRID:
+        accepted, rejected = p_supplier >= accept, p_supplier <= reject
+        fetched = ~(accepted | rejected)
+        cascade = accepted | (fetched & full_accepts)
+        row = {"accept": accept, "reject": reject, **summarize(cascade, fetched)}
+        row["fetch_reduction"] = round(1 - row["fetch_rate"], 3)
+        row["accuracy_loss"] = round(baseline["accuracy"] - row["accuracy"], 3)
+        rows.append(row)
+
+print(f"\nFull model on every URL: accuracy {baseline['accuracy']:.3f}, "
+      f"precision {baseline['precision']:.3f}, recall {baseline['recall']:.3f}")
+print(f"\n{'accept':>7} {'reject':>7} {'fetch-':>7} {'acc':>6} {'acc loss':>9} {'prec':>6} {'recall':>7}")
+for row in rows:
+    print(f"{row['accept']:>7.2f} {row['reject']:>7.2f} {row['fetch_reduction']:>7.1%} {row['accuracy']:>6.3f} "
+          f"{row['accuracy_loss']:>+9.3f} {row['precision']:>6.3f} {row['recall']:>7.3f}")
+
+print("\nTraining the triage model on all labelled data...")
+triage_pipeline.fit(texts, y)
+joblib.dump(triage_pipeline, args.out)
+
+with open(args.report, "w", encoding="utf-8") as f:
+    json.dump({"samples": len(df), "folds": args.folds, "confidence_threshold": CONFIDENCE_THRESHOLD,
+               "full_model": baseline, "cascade": rows}, f, indent=2)
+print(f"✅ Triage model saved to {args.out}, report written to {args.report}.")
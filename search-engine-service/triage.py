@@ -0,0 +1,79 @@
+# triage.py - Cheap first stage of the discovery cascade.
+# Scores a search hit from its URL, title and snippet alone, so that only the
+# hits it is unsure about are rendered in Chrome and sent to the full
+# hybrid_supplier_model.
+import os
+import re
+from urllib.parse import urlparse
+
+import joblib
+
+TRIAGE_MODEL_FILE = os.environ.get("TRIAGE_MODEL_FILE", "triage_model.joblib")
+# P(supplier) at or above this -> accept without fetching the page.
+TRIAGE_ACCEPT = float(os.environ.get("TRIAGE_ACCEPT", "0.90"))
+# P(supplier) at or below this -> reject without fetching the page.
+TRIAGE_REJECT = float(os.environ.get("TRIAGE_REJECT", "0.20"))
+SUPPLIER_CLASSES = [0, 1, 2]
+
+_URL_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+
+
+def url_tokens(url: str) -> str:
+    """Host and path words plus a few structural markers, as plain tokens."""
+    parsed = urlparse(url.lower())
+    host = parsed.netloc[4:] if parsed.netloc.startswith("www.") else parsed.netloc
+    words = [w for w in _URL_SPLIT_RE.split(f"{host} {parsed.path}") if w and not w.isdigit()]
+    markers = []
+    if any(p in parsed.path for p in ("/blog", "/news", "/article", "/magazine")):
+        markers.append("urlmark_blog")
+    if any(p in parsed.path for p in ("/product", "/shop", "/collections", "/catalog")):
+        markers.append("urlmark_shop")
+    if parsed.path.strip("/") == "":
+        markers.append("urlmark_home")
+    markers.append(f"urlmark_tld_{host.rsplit('.', 1)[-1]}" if "." in host else "urlmark_tld_none")
+    markers.append(f"urlmark_depth_{min(3, len([p for p in parsed.path.split('/') if p]))}")
+    return " ".join(words + markers)
+
+
+def triage_text(url: str, title: str, snippet: str) -> str:
+    return f"{title or ''} {snippet or ''} {url_tokens(url)}"
+
+
+class TriageModel:
+    """Wraps the trained triage pipeline (text -> class probabilities)."""
+
+    def __init__(self, pipeline, accept: float = TRIAGE_ACCEPT, reject: float = TRIAGE_REJECT):
+        self.pipeline = pipeline
+        self.accept = accept
+        self.reject = reject
+        self.classes = list(pipeline.classes_)
+
+    @classmethod
+    def load(cls, path: str = TRIAGE_MODEL_FILE):
+        """Returns None (cascade disabled) when no triage model has been trained."""
+        try:
+            return cls(joblib.load(path))
+        except FileNotFoundError:
+            print(f"⚠️ No triage model at {path}; every candidate will be fetched.")
+            return None
+
+    def score(self, hits: list) -> list:
+        """Class-probability dicts for a list of {'link', 'title', 'snippet'} hits."""
+        if not hits:
+            return []
+        texts = [triage_text(h["link"], h.get("title", ""), h.get("snippet", "")) for h in hits]
+        return [dict(zip(self.classes, row)) for row in self.pipeline.predict_proba(texts)]
+
+    def decide(self, probabilities: dict) -> tuple:
+        """
+        Returns (decision, class, p_supplier): ('accept', most likely supplier class, p_supplier),
+        ('reject', None, p_supplier) or ('fetch', None, p_supplier), where p_supplier is the
+        probability mass on the supplier classes in every case.
+        """
+        p_supplier = sum(probabilities.get(c, 0.0) for c in SUPPLIER_CLASSES)
+        if p_supplier >= self.accept:
+            best = max(SUPPLIER_CLASSES, key=lambda c: probabilities.get(c, 0.0))
+            return "accept", best, p_supplier
+        if p_supplier <= self.reject:
+            return "reject", None, p_supplier
+        return "fetch", None, p_supplier
@@ -0,0 +1,204 @@
+# url_canonicalizer.py - One candidate per supplier site before anything is fetched.
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+import tldextract
+
+import tracing
+
+# --- Configuration ---
+# Follow redirects with a HEAD request, so shorteners and moved pages group with their target.
+RESOLVE_REDIRECTS = os.environ.get("RESOLVE_REDIRECTS", "true").lower() == "true"
+REDIRECT_TIMEOUT_SECONDS = float(os.environ.get("REDIRECT_TIMEOUT_SECONDS", "3"))
+REDIRECT_WORKERS = int(os.environ.get("REDIRECT_WORKERS", "8"))
+REDIRECT_CACHE_SIZE = int(os.environ.get("REDIRECT_CACHE_SIZE", "10000"))
+REDIRECT_CACHE_TTL_HOURS = float(os.environ.get("REDIRECT_CACHE_TTL_HOURS", "24"))
+# Platforms where each subdomain is a different seller: these group by full host, not by domain.
+SHARED_HOST_DOMAINS = set(filter(None, os.environ.get(
+    "SHARED_HOST_DOMAINS",
+    "alibaba.com,made-in-china.com,myshopify.com,wixsite.com,squarespace.com,wordpress.com,webnode.com,jimdosite.com,"
+    "business.site,github.io,netlify.app,vercel.app",
+).split(",")))
+
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "dclid", "mc_cid", "mc_eid", "ref", "ref_", "srsltid",
+                   "_ga", "_gl", "igshid", "spm", "sessionid", "sid", "hl", "lang", "locale"}
+# A leading /en/, /fr-fr/, /en_GB/ ... path segment selects a translation of the same page.
+_LOCALE_SEGMENT = re.compile(r"^/[a-z]{2}(?:[-_][a-z]{2})?(?=/|$)", re.I)
+_INDEX_PAGE = re.compile(r"/(?:index|default|home)\.(?:html?|php|aspx?)$", re.I)
+
+# The bundled public-suffix snapshot: no download at start-up and no network dependency.
+_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+
+def registrable_domain(host: str) -> str | None:
+    """'shop.example.co.uk' -> 'example.co.uk'; hosts on shared platforms are kept whole."""
+    host = host.lower().rstrip(".")
+    parts = _extract(host)
+    if not parts.domain or not parts.suffix:
+        return None  # IP addresses, localhost, internal names
+    domain = f"{parts.domain}.{parts.suffix}"
+    if domain in SHARED_HOST_DOMAINS:
+        return host[4:] if host.startswith("www.") else host
+    return domain
+
+
+def site_key(url: str) -> str:
+    """
+    The supplier site a URL belongs to: its registrable domain. Hosts without a
+    public suffix (IPs, internal names such as the benchmark stubs) may serve many
+    sites, so their pages only group when they are the same canonical page.
+    """
+    return registrable_domain(urlparse(url).hostname or "") or canonical_url(url)
+
+
+def _clean_query(query: str) -> list:
+    return sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                  if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+
+
+def strip_tracking(url: str) -> str:
+    """The same URL, still fetchable, without tracking parameters or fragment."""
+    parsed = urlparse(url.strip())
+    return urlunparse(parsed._replace(query=urlencode(_clean_query(parsed.query)), fragment=""))
+
+
+def canonical_url(url: str) -> str:
+    """
+    Scheme-less identity of a page: lower-case host without www. or default port,
+    no tracking or language parameters, no locale prefix, fragment, index page or
+    trailing slash, and sorted query parameters.
+    """
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+    path = re.sub(r"/{2,}", "/", parsed.path or "/")
+    path = _INDEX_PAGE.sub("/", _LOCALE_SEGMENT.sub("", path)).rstrip("/") or "/"
+    return urlunparse(("", host, path, "", urlencode(_clean_query(parsed.query)), ""))[2:]
+
+
+class RedirectResolver:
+    """Final URL of each candidate after redirects, from a HEAD request, cached (LRU with a TTL)."""
+
+    def __init__(self, timeout: float = REDIRECT_TIMEOUT_SECONDS, max_size: int = REDIRECT_CACHE_SIZE,
+                 ttl_hours: float = REDIRECT_CACHE_TTL_HOURS):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.ttl = ttl_hours * 3600
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "cache_hits": 0, "redirected": 0, "errors": 0}
+        tracing.register_gauge("redirect_cache_entries", lambda: len(self._cache))
+
+    def _cached(self, url: str):
+        with self._lock:
+            self._counters["lookups"] += 1
+            entry = self._cache.get(url)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                return None
+            self._cache.move_to_end(url)
+            self._counters["cache_hits"] += 1
+            return entry[0]
+
+    def _store(self, url: str, final: str):
+        with self._lock:
+            self._cache[url] = (final, time.time())
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _timeout(self, deadline: float | None) -> float | None:
+        """The lookup timeout, cut to what is left before `deadline` (time.monotonic()); None once it has passed."""
+        if deadline is None:
+            return self.timeout
+        left = deadline - time.monotonic()
+        return min(self.timeout, left) if left > 0 else None
+
+    def resolve(self, url: str, deadline: float | None = None) -> str:
+        """The URL `url` redirects to; `url` itself if it cannot be looked up before `deadline`."""
+        cached = self._cached(url)
+        if cached is not None:
+            return cached
+        final = url
+        try:
+            timeout = self._timeout(deadline)
+            if timeout is None:
+                return url
+            response = requests.head(url, allow_redirects=True, timeout=timeout,
+                                     headers={"User-Agent": "Mozilla/5.0 (compatible; supplier-discovery)"})
+            if response.status_code in (403, 405, 501):
+                timeout = self._timeout(deadline)
+                if timeout is None:
+                    return url
+                # Some servers refuse HEAD; a streamed GET follows the same redirects without the body.
+                response = requests.get(url, allow_redirects=True, timeout=timeout, stream=True,
+                                        headers={"User-Agent": "Mozilla/5.0 (compatible; supplier-discovery)"})
+                response.close()
+            final = response.url or url
+        except requests.exceptions.RequestException:
+            # Unreachable now; the URL is kept as it is and retried on the next request.
+            with self._lock:
+                self._counters["errors"] += 1
+            return url
+        if canonical_url(final) != canonical_url(url):
+            with self._lock:
+                self._counters["redirected"] += 1
+        self._store(url, final)
+        return final
+
+    def resolve_all(self, urls: list, deadline: float | None = None) -> dict:
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(REDIRECT_WORKERS, len(urls))) as pool:
+            # One wrap per task: each carries its own copy of the trace context.
+            futures = [pool.submit(tracing.wrap(self.resolve), url, deadline) for url in urls]
+            return {url: future.result() for url, future in zip(urls, futures)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._cache), **self._counters}
+
+
+def dedupe_candidates(hits: list, resolver: RedirectResolver | None = None, blacklist: list = (),
+                      deadline: float | None = None) -> tuple:
+    """
+    Keeps one hit per supplier site, in search order: the first-ranked hit of each
+    registrable domain (after redirects) represents the site, under its final URL,
+    and the other URLs are listed under its 'aliases'. Hits whose final host contains
+    a `blacklist` domain (e.g. a shortener that lands on a social network) are dropped.
+    Redirects not looked up before `deadline` (time.monotonic()) are left unresolved.
+    Returns (representatives, stats).
+    """
+    finals = resolver.resolve_all([hit['link'] for hit in hits], deadline) if resolver else {}
+    sites, pages, blacklisted = {}, set(), 0
+    for hit in hits:
+        final = finals.get(hit['link'], hit['link'])
+        if any(domain in urlparse(final).netloc for domain in blacklist):
+            blacklisted += 1
+            continue
+        pages.add(canonical_url(final))
+        site = site_key(final)
+        if site in sites:
+            sites[site]['aliases'].append(hit['link'])
+        else:
+            sites[site] = {**hit, 'link': strip_tracking(final), 'site': site, 'aliases': []}
+            if sites[site]['link'] != hit['link']:
+                sites[site]['search_link'] = hit['link']
+    representatives = list(sites.values())
+    stats = {
+        "candidates": len(hits),
+        "unique_pages": len(pages),
+        "sites": len(representatives),
+        "blacklisted": blacklisted,
+        "duplicates_removed": len(hits) - blacklisted - len(representatives),
+        "redirected": sum(1 for hit in hits if canonical_url(finals.get(hit['link'], hit['link'])) != canonical_url(hit['link'])),
+    }
+    return representatives, stats